@@ -13,6 +13,10 @@ import csv
 import os
 from bisect import bisect_left
 
+import columnar
+import metrics
+import stages
+
 # 文件路径
 BAROMETER_FILE = 'bmp/Barometer.csv'
 DEVICE_FILES = [
@@ -21,14 +25,14 @@ DEVICE_FILES = [
     'WTB1_data/WTB1.csv'
 ]
 
-def load_barometer_data():
+def load_barometer_data(barometer_file=BAROMETER_FILE):
     """加载气压计数据，返回 (时间戳列表[us], 数据列表[(sec, alt, press), ...])"""
     print("加载气压计数据...")
     
     timestamps = []
     values = []
     
-    with open(BAROMETER_FILE, 'r', encoding='utf-8') as f:
+    with open(barometer_file, 'r', encoding='utf-8') as f:
         reader = csv.reader(f)
         header = next(reader)
         print(f"  气压计表头: {header}")
@@ -82,28 +86,41 @@ def find_closest_index(target_ts, timestamps):
     else:
         return pos
 
-def process_device_file(filepath, baro_timestamps, baro_values):
-    """处理单个设备文件"""
-    print(f"\n处理文件: {filepath}")
+def process_device_file(filepath, barometer, output_path=None):
+    """
+    处理单个设备文件
+    :param barometer: load_barometer_data() 的返回值 (多个设备文件可共用)
+    :param output_path: 输出路径 (默认覆盖输入文件，按中间格式决定扩展名)
+    :return: stages.StageResult
+    """
+    with stages.measure('align', file=filepath) as result:
+        _align(filepath, barometer, output_path, result)
+    return result
+
+def _align(filepath, barometer, output_path, result):
+    baro_timestamps, baro_values = barometer
+    # 输入可能是 CSV 或列式中间文件
+    input_path = columnar.resolve_input(filepath)
+    print(f"\n处理文件: {input_path}")
     
-    if not os.path.exists(filepath):
+    if not os.path.exists(input_path):
         print(f"  ✗ 文件不存在!")
-        return False
+        result.fail(f"文件不存在: {input_path}")
+        return
     
     # Step 1: 读取 IMU 数据，获取所有时间戳
     imu_timestamps = []
     imu_rows = []
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        try:
-            header = next(reader)
-        except StopIteration:
-            print("  空文件")
-            return False
-        
-        base_header_len = 27
-        
+    header, reader = columnar.open_rows(input_path)
+    if not header:
+        print("  空文件")
+        result.fail(f"空文件: {input_path}")
+        return
+    
+    base_header_len = 27
+    
+    with metrics.step('read'):
         for row in reader:
             if not row:
                 continue
@@ -124,25 +141,24 @@ def process_device_file(filepath, baro_timestamps, baro_values):
     
     # Step 3: 对每条气压计数据，找到最接近的 IMU 行并填入
     matched_count = 0
-    for i, baro_ts in enumerate(baro_timestamps):
-        # 找到最接近的 IMU 行索引
-        closest_idx = find_closest_index(baro_ts, imu_timestamps)
-        
-        if closest_idx >= 0 and closest_idx < len(imu_rows):
-            # 只有当该位置尚未被填充时才填入（或者覆盖也可以）
-            # 这里选择直接覆盖
-            baro_data_for_imu[closest_idx] = baro_values[i]
-            matched_count += 1
+    with metrics.step('match'):
+        for i, baro_ts in enumerate(baro_timestamps):
+            # 找到最接近的 IMU 行索引
+            closest_idx = find_closest_index(baro_ts, imu_timestamps)
+            
+            if closest_idx >= 0 and closest_idx < len(imu_rows):
+                # 只有当该位置尚未被填充时才填入（或者覆盖也可以）
+                # 这里选择直接覆盖
+                baro_data_for_imu[closest_idx] = baro_values[i]
+                matched_count += 1
     
     print(f"  成功匹配 {matched_count} 条气压计数据到 IMU 行")
     
     # Step 4: 写回文件
     new_header = header[:base_header_len] + ['seconds_elapsed', 'relativeAltitude', 'pressure']
     
-    with open(filepath, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(new_header)
-        
+    output_path = columnar.output_path(output_path or filepath)
+    with metrics.step('write'), columnar.open_row_writer(output_path, new_header) as writer:
         for i, base_row in enumerate(imu_rows):
             sec, alt, pres = baro_data_for_imu[i]
             # 格式化 - 10000 表示无效占位值
@@ -156,8 +172,12 @@ def process_device_file(filepath, baro_timestamps, baro_values):
     # 统计有多少行有有效气压数据
     non_zero_count = sum(1 for v in baro_data_for_imu if v[2] != 0.0)
     print(f"  ✓ 完成! 共 {len(imu_rows)} 行, 其中 {non_zero_count} 行有气压数据, {len(imu_rows) - non_zero_count} 行填 0")
-    
-    return True
+    metrics.count('rows', len(imu_rows))
+    metrics.count_file('bytes_read', input_path)
+    metrics.count_file('bytes_written', output_path)
+    result.outputs['output'] = output_path
+    result.details = {'matched': matched_count, 'pressure_rows': non_zero_count}
+    result.ok = True
 
 def main():
     print("=" * 70)
@@ -168,11 +188,11 @@ def main():
         print(f"✗ 气压计文件不存在: {BAROMETER_FILE}")
         return False
     
-    baro_timestamps, baro_values = load_barometer_data()
+    barometer = load_barometer_data()
     
     success_count = 0
     for filepath in DEVICE_FILES:
-        if process_device_file(filepath, baro_timestamps, baro_values):
+        if process_device_file(filepath, barometer).ok:
             success_count += 1
             
     print("\n" + "=" * 70)
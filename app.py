@@ -5,17 +5,24 @@ BLE 数据处理 Web API
 """
 import os
 import subprocess
+import sys
+import time
 import asyncio
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import csv
+import json
+
+import columnar
+import metrics
+import stage_log
 
 app = FastAPI(title="BLE Data Processing API", version="1.0.0")
 
@@ -34,9 +41,21 @@ OUTPUT_DIR = Path("output")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# 处理阶段通过统一命令行以子进程运行 (只导入该阶段的脚本)
+STAGE_CLI = [sys.executable, "-m", "ble_playback"]
+
 # 任务状态存储
 tasks_status = {}
 
+# 实时采集会话 (设备名 -> ingest.IngestSession，结束后保留最近一次的状态)
+live_sessions = {}
+
+# 实时采集向客户端回报计数的间隔 (秒)
+INGEST_ACK_INTERVAL = 1.0
+
+# 所有任务的累计指标 (/metrics)
+metrics_collector = metrics.MetricsCollector()
+
 
 class TaskStatus(BaseModel):
     task_id: str
@@ -45,11 +64,14 @@ class TaskStatus(BaseModel):
     message: str
     result: Optional[dict] = None
     error: Optional[str] = None
+    stage_progress: Optional[dict] = None  # 正在运行阶段的最近进度
+    stages: Optional[List[dict]] = None  # 已结束阶段的摘要 (错误分类计数与样本位置)
 
 
 class ProcessRequest(BaseModel):
     filename: str
-    steps: List[str]  # ["split", "align", "downsample", "convert"]
+    steps: List[str]  # ["split", "align", "downsample", "convert", "audit"]
+    profile: Optional[str] = None  # "cprofile" / "sample"，对各阶段做性能剖析
 
 
 @app.get("/")
@@ -106,7 +128,9 @@ async def process_data(request: ProcessRequest, background_tasks: BackgroundTask
         "progress": 0,
         "message": "任务已创建",
         "result": None,
-        "error": None
+        "error": None,
+        "stage_progress": None,
+        "stages": []
     }
 
     # 在后台执行处理
@@ -117,36 +141,47 @@ async def process_data(request: ProcessRequest, background_tasks: BackgroundTask
 
 async def run_processing(task_id: str, request: ProcessRequest):
     """后台执行数据处理"""
+    job_start = time.perf_counter()
+    # 子进程把各阶段的计时/计数写入该文件，处理结束后汇总
+    metrics_file = OUTPUT_DIR / f"metrics_{task_id}.jsonl"
+    # 各阶段的进度事件与摘要 (stage_log)
+    stage_log_file = OUTPUT_DIR / f"stages_{task_id}.jsonl"
+    env = dict(os.environ, **{metrics.METRICS_FILE_ENV: str(metrics_file.resolve()),
+                              stage_log.STAGE_LOG_FILE_ENV: str(stage_log_file.resolve())})
+    if request.profile:
+        env[metrics.PROFILE_ENV] = request.profile
+        env[metrics.PROFILE_DIR_ENV] = str((OUTPUT_DIR / "profiles").resolve())
+
     try:
         tasks_status[task_id]["status"] = "processing"
         tasks_status[task_id]["message"] = "开始处理数据"
 
-        # 复制上传的文件到工作目录
+        # 复制上传的文件到工作目录 (TXT 直接拆分，不再生成中间 data.csv)
         source = UPLOAD_DIR / request.filename
-        dest = Path("data.csv")
+        dest = Path("data.txt") if source.suffix.lower() == ".txt" else Path("data.csv")
 
         if source.exists():
             import shutil
             shutil.copy(source, dest)
 
         total_steps = len(request.steps)
+        audit_report = None
 
         for i, step in enumerate(request.steps):
             progress = int((i / total_steps) * 100)
             tasks_status[task_id]["progress"] = progress
+            step_start = time.perf_counter()
 
             if step == "split":
                 tasks_status[task_id]["message"] = "正在拆分设备数据..."
-                result = subprocess.run(["python3", "split_by_device.py"],
-                                      capture_output=True, text=True)
+                result = await _run_stage(task_id, [*STAGE_CLI, "split", str(dest)], env, stage_log_file)
                 if result.returncode != 0:
                     raise Exception(f"拆分失败: {result.stderr}")
 
             elif step == "align":
                 tasks_status[task_id]["message"] = "正在对齐气压计数据..."
                 if Path("bmp/Barometer.csv").exists():
-                    result = subprocess.run(["python3", "align_barometer.py"],
-                                          capture_output=True, text=True)
+                    result = await _run_stage(task_id, [*STAGE_CLI, "align"], env, stage_log_file)
                     if result.returncode != 0:
                         raise Exception(f"对齐失败: {result.stderr}")
                 else:
@@ -154,40 +189,105 @@ async def run_processing(task_id: str, request: ProcessRequest):
 
             elif step == "downsample":
                 tasks_status[task_id]["message"] = "正在降采样到 50Hz..."
-                result = subprocess.run(["python3", "downsample_50hz.py"],
-                                      capture_output=True, text=True)
+                result = await _run_stage(task_id, [*STAGE_CLI, "downsample"], env, stage_log_file)
                 if result.returncode != 0:
                     raise Exception(f"降采样失败: {result.stderr}")
 
             elif step == "convert":
                 tasks_status[task_id]["message"] = "正在转换为二进制格式..."
-                result = subprocess.run(["python3", "csv_to_bin.py"],
-                                      capture_output=True, text=True)
+                result = await _run_stage(task_id, [*STAGE_CLI, "encode"], env, stage_log_file)
                 if result.returncode != 0:
                     raise Exception(f"转换失败: {result.stderr}")
 
+            elif step == "audit":
+                tasks_status[task_id]["message"] = "正在审计时间戳..."
+                report_path = OUTPUT_DIR / f"timestamp_audit_{task_id}.json"
+                # 审计发现问题时返回码为 1，不视为处理失败，结果写入报告
+                result = await _run_stage(task_id, [*STAGE_CLI, "verify", "timestamp", "--audit",
+                                                    "--json", str(report_path)], env, stage_log_file)
+                if not report_path.exists():
+                    raise Exception(f"时间戳审计失败: {result.stderr}")
+                with open(report_path, 'r', encoding='utf-8') as f:
+                    audit_report = json.load(f)
+
+            metrics_collector.observe_step(step, time.perf_counter() - step_start)
+            _, tasks_status[task_id]["stages"] = stage_log.load(str(stage_log_file))
+
         # 收集输出文件
         output_files = []
         for device in ["WTR1", "WTL1", "WTB1"]:
             device_dir = Path(f"{device}_data")
             if device_dir.exists():
-                for file in device_dir.glob("*.csv"):
-                    output_files.append(str(file))
-                for file in device_dir.glob("*.bin"):
-                    output_files.append(str(file))
+                for pattern in ("*.csv", "*.parquet", "*.feather", "*.bin"):
+                    for file in device_dir.glob(pattern):
+                        output_files.append(str(file))
+
+        stage_records = _collect_stage_metrics(metrics_file)
 
         tasks_status[task_id]["status"] = "completed"
         tasks_status[task_id]["progress"] = 100
         tasks_status[task_id]["message"] = "处理完成"
         tasks_status[task_id]["result"] = {
             "output_files": output_files,
-            "total_files": len(output_files)
+            "total_files": len(output_files),
+            "timestamp_audit": audit_report,
+            "metrics": metrics.summarize(stage_records)
         }
+        metrics_collector.observe_job(time.perf_counter() - job_start, "completed")
 
     except Exception as e:
+        _collect_stage_metrics(metrics_file)
+        _, tasks_status[task_id]["stages"] = stage_log.load(str(stage_log_file))
         tasks_status[task_id]["status"] = "failed"
         tasks_status[task_id]["error"] = str(e)
         tasks_status[task_id]["message"] = f"处理失败: {str(e)}"
+        metrics_collector.observe_job(time.perf_counter() - job_start, "failed")
+
+
+async def _run_stage(task_id: str, args: List[str], env: dict, stage_log_file: Path):
+    """
+    以子进程运行一个阶段，不阻塞事件循环
+
+    运行期间定期读取 stage_log 事件文件，把本阶段最近的进度写入任务状态
+    (只读取本阶段启动之后写入的事件)。
+    """
+    since = stage_log.position(str(stage_log_file))
+    proc = await asyncio.create_subprocess_exec(*args, env=env,
+                                                stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.PIPE)
+    communicate = asyncio.ensure_future(proc.communicate())
+    base_message = tasks_status[task_id]["message"]
+    while True:
+        done, _ = await asyncio.wait({communicate}, timeout=0.5)
+        latest, _ = stage_log.load(str(stage_log_file), since)
+        tasks_status[task_id]["stage_progress"] = latest
+        if latest:
+            total = f"/{latest['total']}" if latest.get('total') else ""
+            tasks_status[task_id]["message"] = f"{base_message} ({latest['stage']}: {latest['done']}{total})"
+        else:
+            tasks_status[task_id]["message"] = base_message
+        if done:
+            break
+    stdout, stderr = communicate.result()
+    tasks_status[task_id]["stage_progress"] = None
+    return subprocess.CompletedProcess(args, proc.returncode,
+                                       stdout.decode('utf-8', 'replace'),
+                                       stderr.decode('utf-8', 'replace'))
+
+
+def _collect_stage_metrics(metrics_file: Path):
+    """读取子进程写出的阶段记录并计入 /metrics"""
+    stage_records = metrics.load(str(metrics_file))
+    for record in stage_records:
+        metrics_collector.observe_record(record)
+    return stage_records
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 指标: 任务/步骤/阶段耗时直方图、各阶段行数与字节数、吞吐量"""
+    return PlainTextResponse(metrics_collector.render(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/api/task/{task_id}")
@@ -236,26 +336,31 @@ async def download_file(device: str, filename: str):
 
 
 @app.get("/api/preview/{device}/{filename}")
-async def preview_csv(device: str, filename: str, limit: int = 100):
-    """预览CSV文件"""
+async def preview_csv(device: str, filename: str, limit: int = 100, start: Optional[float] = None):
+    """
+    预览CSV文件
+
+    bin / .binz 文件解码为与 bin_to_csv 相同的列；start 为相对首帧的秒数，
+    通过 .idx 索引 (.binz 为块索引) 直接定位，不扫描整个文件。
+    """
     file_path = Path(f"{device}_data") / filename
 
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="文件不存在")
 
-    if not filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="只能预览CSV文件")
+    if filename.endswith(('.bin', '.binz')):
+        return _preview_bin(file_path, limit, start)
+
+    if not filename.endswith('.csv') and not columnar.is_columnar(filename):
+        raise HTTPException(status_code=400, detail="只能预览CSV、列式或bin文件")
 
     try:
         data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            header = next(reader)
-
-            for i, row in enumerate(reader):
-                if i >= limit:
-                    break
-                data.append(row)
+        header, reader = columnar.open_rows(str(file_path))
+        for i, row in enumerate(reader):
+            if i >= limit:
+                break
+            data.append(row)
 
         return {
             "header": header,
@@ -266,6 +371,80 @@ async def preview_csv(device: str, filename: str, limit: int = 100):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _preview_bin(file_path: Path, limit: int, start: Optional[float]):
+    import bin_archive
+    import bin_index
+    import bin_to_csv
+    import packed_frame
+
+    frame_len = bin_to_csv.FRAME_LEN
+    if not bin_archive.is_archive(str(file_path)) and packed_frame.is_packed_file(str(file_path)):
+        return _preview_packed(file_path, limit, start)
+    if bin_archive.is_archive(str(file_path)):
+        # .binz 归档: 块索引定位，只解压涉及的块
+        with bin_archive.ArchiveReader(str(file_path)) as index:
+            first_frame = index.seek_seconds(start) if start else 0
+            raw = index.read_frames(first_frame, first_frame + limit)
+    else:
+        index = bin_index.get_index(str(file_path))
+        first_frame = index.seek_seconds(start) if start else 0
+        with open(file_path, 'rb') as f:
+            f.seek(first_frame * frame_len)
+            raw = f.read(limit * frame_len)
+    columns = bin_to_csv.decode_frames(raw)
+    valid = columns['__header_valid']
+    data = [list(row) for row in zip(*(columns[k][valid].tolist() for k in bin_to_csv.CSV_FIELDS))]
+
+    return {
+        "header": bin_to_csv.CSV_FIELDS,
+        "data": data,
+        "total_rows": len(data),
+        "first_frame": first_frame,
+        "frame_count": index.frames,
+    }
+
+
+def _preview_packed(file_path: Path, limit: int, start: Optional[float]):
+    """
+    打包帧 (Cmd 0x02) 文件的预览: 帧长不固定且没有 .idx 索引，从头逐帧解码，
+    取够 limit 行即停止 (因此不返回总帧数)；start 为相对首个样本的秒数
+    """
+    import bin_index
+    import bin_to_csv
+    import packed_frame
+
+    data = []
+    first_frame = None
+    lo = None
+    frames = 0
+    for kind, _, _, samples in packed_frame.iter_frames(bin_to_csv._open_bin(str(file_path))):
+        if kind != 'frame':
+            continue
+        frames += 1
+        if lo is None:
+            first = samples[0][0]
+            lo = first + int(round((start or 0) * bin_index.ticks_per_second(first)))
+        for ts, values in samples:
+            if ts < lo:
+                continue
+            if first_frame is None:
+                first_frame = frames - 1
+            row = bin_to_csv.values_to_row([ts] + values)
+            data.append([row[k] for k in bin_to_csv.CSV_FIELDS])
+            if len(data) >= limit:
+                break
+        if len(data) >= limit:
+            break
+
+    return {
+        "header": bin_to_csv.CSV_FIELDS,
+        "data": data,
+        "total_rows": len(data),
+        "first_frame": first_frame or 0,
+        "frame_count": None,
+    }
+
+
 @app.get("/api/stats/{device}/{filename}")
 async def get_stats(device: str, filename: str):
     """获取CSV文件统计信息"""
@@ -274,12 +453,16 @@ async def get_stats(device: str, filename: str):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="文件不存在")
 
-    if not filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="只能分析CSV文件")
+    if not filename.endswith('.csv') and not columnar.is_columnar(filename):
+        raise HTTPException(status_code=400, detail="只能分析CSV或列式文件")
 
     try:
-        import pandas as pd
-        df = pd.read_csv(file_path)
+        if columnar.is_columnar(filename):
+            # 列式文件直接按列读取，无需解析文本
+            df = columnar.read_dataframe(str(file_path))
+        else:
+            import pandas as pd
+            df = pd.read_csv(file_path)
 
         stats = {
             "row_count": len(df),
@@ -303,6 +486,82 @@ async def get_stats(device: str, filename: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.websocket("/api/ingest/{device}")
+async def ingest_frames(websocket: WebSocket, device: str, max_mb: float = 64, max_seconds: float = 3600,
+                        csv_output: bool = False):
+    """
+    实时采集: 网关以二进制消息推送 80 字节帧 (帧可以跨消息)
+
+    每批校验帧头和 CRC 后追加到 {device}_data/{device}_live_*.bin，按大小 (max_mb)
+    或时间跨度 (max_seconds) 轮转，.idx 索引随之更新。每 INGEST_ACK_INTERVAL 秒
+    回一条 JSON 计数消息。
+    """
+    import ingest
+
+    if device in live_sessions and not live_sessions[device].closed:
+        await websocket.close(code=1008, reason=f"{device} 正在采集")
+        return
+    # 检查与登记之间不能有 await，否则同一设备的两个连接可能都通过检查
+    session = ingest.IngestSession(device, Path(f"{device}_data"), int(max_mb * 1024 * 1024),
+                                   max_seconds, csv_output)
+    live_sessions[device] = session
+    last_ack = time.monotonic()
+    try:
+        await websocket.accept()
+        while True:
+            data = await websocket.receive_bytes()
+            session.feed(data)
+            now = time.monotonic()
+            if now - last_ack >= INGEST_ACK_INTERVAL:
+                last_ack = now
+                await websocket.send_json(session.status())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.close()
+        metrics_collector.observe_record({
+            'stage': 'ingest', 'labels': {'device': device},
+            'wall_seconds': time.time() - session.started,
+            'counters': {'rows': session.counts['frames'], 'bytes_read': session.counts['bytes_received'],
+                         'skipped_bytes': session.counts['skipped_bytes']},
+        })
+
+
+@app.get("/api/live")
+async def list_live_sessions():
+    """实时采集会话的状态"""
+    return {"sessions": [session.status() for session in live_sessions.values()]}
+
+
+@app.get("/api/live/{device}/stats")
+async def get_live_stats(device: str):
+    """实时采集最近 ROLLING_SECONDS 秒的滚动统计"""
+    session = live_sessions.get(device)
+    if session is None:
+        raise HTTPException(status_code=404, detail="没有该设备的采集会话")
+    return {"status": session.status(), "window_seconds": session.rolling.window,
+            "numeric_stats": session.rolling.summary()}
+
+
+@app.get("/api/live/{device}/chart")
+async def get_live_chart(device: str, column: str = "AccX(g)", level: int = 0, points: int = 500):
+    """
+    实时采集的图表数据 (min/max 金字塔)
+
+    level 0 每个点 PYRAMID_BASE 帧，每升一级合并 PYRAMID_FACTOR 个点。
+    """
+    session = live_sessions.get(device)
+    if session is None:
+        raise HTTPException(status_code=404, detail="没有该设备的采集会话")
+    pyramid = session.pyramid
+    if column not in pyramid.columns:
+        raise HTTPException(status_code=400, detail=f"未知的列: {column}")
+    if not 0 <= level < len(pyramid.levels):
+        raise HTTPException(status_code=400, detail=f"level 范围: 0 ~ {len(pyramid.levels) - 1}")
+    return {"column": column, "level": level, "frames_per_point": pyramid.sizes[level],
+            "points": pyramid.query(level, column, points)}
+
+
 # 挂载静态文件（前端）
 if Path("web/dist").exists():
     app.mount("/", StaticFiles(directory="web/dist", html=True), name="static")
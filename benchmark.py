@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+端到端流水线基准测试
+
+1. generate: 按固定随机种子生成 WT 格式的 data.txt / data.csv (3 个设备，
+   可配置采样率、时长、时间抖动、丢包率) 以及对应的 bmp/Barometer.csv
+2. run:      在临时工作目录中依次运行各阶段脚本 (子进程)，记录每个阶段的
+   耗时、CPU 时间、峰值内存 (RSS)、读写字节数和吞吐量，输出 JSON 报告
+3. compare:  对比两份报告，耗时或内存超过阈值即视为性能回退 (返回码 1)
+
+    python3 benchmark.py run --duration 300 -o bench_base.json
+    python3 benchmark.py run --duration 300 -o bench_new.json
+    python3 benchmark.py compare bench_base.json bench_new.json
+"""
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEVICES = ['WTR1', 'WTL1', 'WTB1']
+
+# 与 WT 上位机导出一致的列 (含重复的 SpeedY)
+WT_HEADER = [
+    'time', 'DeviceName',
+    'AccX(g)', 'AccY(g)', 'AccZ(g)',
+    'AsX(°/s)', 'AsY(°/s)', 'AsZ(°/s)',
+    'AngleX(°)', 'AngleY(°)', 'AngleZ(°)',
+    'HX(uT)', 'HY(uT)', 'HZ(uT)',
+    'Q0()', 'Q1()', 'Q2()', 'Q3()',
+    'Temperature(°C)', 'Version()', 'Battery level(%)',
+    'TrajectoryX(m)', 'TrajectoryY(m)', 'TrajectoryZ(m)',
+    'SpeedX(m/s)', 'SpeedY(m/s)', 'SpeedY(m/s)',
+]
+
+# 生成数据的默认起始时间 (16位微秒时间戳)
+START_US = 1761820435980000
+
+# 阶段: (名称, [每条命令的参数]) —— 命令在工作目录中以 python3 运行
+STAGES = [
+    ('convert_to_csv', [['convert_to_csv.py']]),
+    ('verify_csv', [['verify_csv.py']]),
+    ('split', [['split_by_device.py', 'data.csv']]),
+    ('verify_split', [['verify_split.py']]),
+    ('align', [['align_barometer.py']]),
+    ('downsample', [['downsample_50hz.py']]),
+    ('csv_to_bin', [['csv_to_bin.py']]),
+    ('bin_to_csv', [['bin_to_csv.py', f'{d}_data/{d}_50hz.bin'] for d in DEVICES]),
+    ('verify_timestamp', [['verify_timestamp.py', '--audit']]),
+]
+
+# compare 的默认回退阈值 (相对变化)
+REGRESSION_THRESHOLD = 0.10
+
+def _device_rows(rng, device_index, rate, duration, jitter_us, loss):
+    """生成单个设备的 (时间戳, 行) 序列"""
+    period_us = 1_000_000 / rate
+    # 每个设备有各自的起始偏移和 ±50ppm 以内的时钟偏差
+    offset_us = rng.randint(0, int(period_us))
+    skew = 1 + rng.uniform(-50e-6, 50e-6)
+    phase = rng.uniform(0, 2 * math.pi)
+    mac = ''.join(rng.choice('0123456789abcdef') for _ in range(12))
+    name = f"{DEVICES[device_index]}({mac})"
+
+    for i in range(int(rate * duration)):
+        if loss and rng.random() < loss:
+            continue
+        ts = START_US + offset_us + int(i * period_us * skew)
+        if jitter_us:
+            ts += int(rng.uniform(-jitter_us, jitter_us))
+        t = i / rate
+        acc = [0.3 * math.sin(2 * math.pi * 1.5 * t + phase + k) + rng.gauss(0, 0.02) for k in range(3)]
+        acc[2] += 1.0
+        gyro = [40 * math.cos(2 * math.pi * 0.8 * t + phase + k) + rng.gauss(0, 0.5) for k in range(3)]
+        angle = [30 * math.sin(2 * math.pi * 0.1 * t + k) for k in range(2)]
+        angle.append((t * 3) % 360 - 180)
+        mag = [25 * math.cos(math.radians(angle[2]) + k) + rng.gauss(0, 0.3) for k in range(3)]
+        quat = [math.cos(t * 0.1), math.sin(t * 0.1), 0.0, 0.0]
+        battery = 'null' if i % 50 == 0 else f"{max(0.0, 100 - t / 60):.0f}"
+        values = (
+            [f"{v:.3f}" for v in acc] + [f"{v:.3f}" for v in gyro] +
+            [f"{v:.3f}" for v in angle] + [f"{v:.3f}" for v in mag] +
+            [f"{v:.5f}" for v in quat] +
+            [f"{25 + 2 * math.sin(t / 600):.2f}", '5.1.9', battery] +
+            ['0.000'] * 6
+        )
+        yield ts, [str(ts), name] + values
+
+def generate(out_dir, rate=100, duration=60, jitter_ms=0.5, loss=0.0, seed=0,
+             baro_rate=2, write_txt=True):
+    """
+    生成确定性的合成采集数据
+    :return: 生成参数与文件信息 (写入报告的 meta)
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(out_dir, 'bmp'), exist_ok=True)
+    jitter_us = jitter_ms * 1000
+
+    # 三个设备的数据按时间交织 (与实际接收顺序一致)
+    streams = [list(_device_rows(rng, i, rate, duration, jitter_us, loss)) for i in range(len(DEVICES))]
+    merged = sorted((row for stream in streams for row in stream), key=lambda x: x[0])
+
+    csv_path = os.path.join(out_dir, 'data.csv')
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(WT_HEADER) + '\r\n')
+        for _, row in merged:
+            f.write(','.join(row) + '\r\n')
+
+    if write_txt:
+        with open(os.path.join(out_dir, 'data.txt'), 'w', encoding='utf-8', newline='') as f:
+            f.write('\t'.join(WT_HEADER) + '\r\n')
+            for _, row in merged:
+                f.write('\t'.join(row) + '\r\n')
+
+    # 气压计: 19位纳秒时间戳
+    baro_path = os.path.join(out_dir, 'bmp', 'Barometer.csv')
+    with open(baro_path, 'w', encoding='utf-8', newline='') as f:
+        f.write('time,seconds_elapsed,relativeAltitude,pressure\n')
+        for i in range(int(duration * baro_rate)):
+            elapsed = i / baro_rate
+            ts_ns = (START_US + int(elapsed * 1_000_000)) * 1000 + rng.randint(0, 999)
+            altitude = 1.5 * math.sin(elapsed / 30) + rng.gauss(0, 0.05)
+            pressure = 1013.25 - altitude * 0.12 + rng.gauss(0, 0.02)
+            f.write(f"{ts_ns},{elapsed},{altitude:.4f},{pressure:.4f}\n")
+
+    return {
+        'rate': rate,
+        'duration': duration,
+        'jitter_ms': jitter_ms,
+        'loss': loss,
+        'seed': seed,
+        'baro_rate': baro_rate,
+        'rows': len(merged),
+        'data_csv_bytes': os.path.getsize(csv_path),
+    }
+
+def _child_main(argv):
+    """
+    子进程入口: 以 __main__ 方式运行阶段脚本，结束时写出本进程的资源统计
+
+    argv: [统计输出路径, 脚本, 参数...]
+    """
+    import runpy
+    stats_path, script, args = argv[0], argv[1], argv[2:]
+    sys.argv = [script] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    code = 0
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        io = {}
+        try:
+            with open('/proc/self/io', 'r') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    io[key.strip()] = int(value)
+        except OSError:
+            pass
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss: Linux 为 KB，macOS 为字节
+        rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        with open(stats_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'peak_rss_bytes': rss,
+                'cpu_seconds': usage.ru_utime + usage.ru_stime,
+                'read_bytes': io.get('rchar'),
+                'write_bytes': io.get('wchar'),
+            }, f)
+    sys.exit(code)
+
+def _run_command(args, work_dir, log):
+    """在工作目录中运行一条阶段命令，返回测量结果"""
+    script = os.path.join(REPO_DIR, args[0])
+    fd, stats_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    cmd = [sys.executable, os.path.abspath(__file__), '_child', stats_path, script] + args[1:]
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - start
+
+    try:
+        with open(stats_path, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {}
+    finally:
+        os.remove(stats_path)
+    stats['wall_seconds'] = wall
+    stats['returncode'] = proc.returncode
+    return stats
+
+def run_stages(work_dir, stages=None, repeat=1, log_path=None):
+    """
+    依次运行各阶段 (每个阶段重复 repeat 次取最快的一次)
+    :return: {阶段名: 测量结果}
+    """
+    selected = [s for s in STAGES if stages is None or s[0] in stages]
+    rows = None
+    data_csv = os.path.join(work_dir, 'data.csv')
+    if os.path.exists(data_csv):
+        with open(data_csv, 'rb') as f:
+            rows = max(sum(1 for _ in f) - 1, 0)
+
+    results = {}
+    log = open(log_path or os.devnull, 'w', encoding='utf-8')
+    try:
+        for name, commands in selected:
+            best = None
+            for _ in range(repeat):
+                print(f"➜ {name} ...", flush=True)
+                runs = [_run_command(args, work_dir, log) for args in commands]
+                merged = {
+                    'wall_seconds': sum(r['wall_seconds'] for r in runs),
+                    'cpu_seconds': sum(r.get('cpu_seconds') or 0 for r in runs),
+                    'peak_rss_bytes': max(r.get('peak_rss_bytes') or 0 for r in runs),
+                    'read_bytes': sum(r.get('read_bytes') or 0 for r in runs),
+                    'write_bytes': sum(r.get('write_bytes') or 0 for r in runs),
+                    'returncode': max((r['returncode'] for r in runs), key=abs),
+                }
+                if best is None or merged['wall_seconds'] < best['wall_seconds']:
+                    best = merged
+            wall = best['wall_seconds']
+            best['read_mb_per_s'] = best['read_bytes'] / 1e6 / wall if wall else None
+            if rows is not None:
+                best['input_rows'] = rows
+                best['rows_per_s'] = rows / wall if wall else None
+            results[name] = best
+            status = '✓' if best['returncode'] == 0 else f"✗ (返回码 {best['returncode']})"
+            print(f"  {status} {wall:.2f}s, 峰值内存 {best['peak_rss_bytes'] / 1e6:.1f} MB, "
+                  f"读 {best['read_bytes'] / 1e6:.1f} MB, 写 {best['write_bytes'] / 1e6:.1f} MB")
+    finally:
+        log.close()
+    return results
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmark(output=None, keep_dir=None, stages=None, repeat=1, **gen_options):
+    """生成数据、运行全部阶段并写出 JSON 报告"""
+    work_dir = keep_dir or tempfile.mkdtemp(prefix='ble_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+    print("=" * 60)
+    print("流水线基准测试")
+    print("=" * 60)
+    print(f"工作目录: {work_dir}")
+    try:
+        start = time.perf_counter()
+        meta = generate(work_dir, **gen_options)
+        print(f"生成数据: {meta['rows']} 行, {meta['data_csv_bytes'] / 1e6:.1f} MB "
+              f"({time.perf_counter() - start:.1f}s)")
+        results = run_stages(work_dir, stages, repeat, os.path.join(work_dir, 'benchmark.log'))
+    finally:
+        if not keep_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'intermediate_format': os.environ.get('BLE_INTERMEDIATE_FORMAT', 'csv'),
+        'generator': meta,
+        'repeat': repeat,
+        'stages': results,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存: {output}")
+    return report
+
+def compare_reports(base_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """
+    对比两份报告，打印各阶段的变化
+    :return: 是否没有回退 (耗时与峰值内存均未超过阈值)
+    """
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    if base.get('generator') != new.get('generator'):
+        print("⚠️ 两份报告的生成参数不同，对比结果仅供参考")
+
+    print(f"{'阶段':<18} {'耗时(s)':>16} {'变化':>8} {'峰值内存(MB)':>18} {'变化':>8}")
+    print("-" * 74)
+    ok = True
+    for name, b in base['stages'].items():
+        n = new['stages'].get(name)
+        if n is None:
+            print(f"{name:<18} (新报告中不存在)")
+            continue
+        changes = []
+        for key in ('wall_seconds', 'peak_rss_bytes'):
+            changes.append((n[key] - b[key]) / b[key] if b[key] else 0.0)
+        regressed = any(c > threshold for c in changes)
+        ok = ok and not regressed and n['returncode'] == 0
+        print(f"{name:<18} {b['wall_seconds']:>7.2f} → {n['wall_seconds']:<7.2f} {changes[0]:>+7.0%} "
+              f"{b['peak_rss_bytes'] / 1e6:>8.1f} → {n['peak_rss_bytes'] / 1e6:<7.1f} {changes[1]:>+7.0%}"
+              f"{'  ✗ 回退' if regressed else ''}")
+
+    print()
+    print("✓ 没有超过阈值的性能回退" if ok else f"✗ 存在超过 {threshold:.0%} 的性能回退或失败的阶段")
+    return ok
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='BLE 数据处理流水线基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add_generator_options(p):
+        p.add_argument('--rate', type=float, default=100, help='每个设备的采样率 (Hz)')
+        p.add_argument('--duration', type=float, default=60, help='时长 (秒)')
+        p.add_argument('--jitter-ms', type=float, default=0.5, help='时间戳抖动 (±毫秒)')
+        p.add_argument('--loss', type=float, default=0.0, help='丢包率 (0~1)')
+        p.add_argument('--seed', type=int, default=0, help='随机种子')
+        p.add_argument('--baro-rate', type=float, default=2, help='气压计采样率 (Hz)')
+
+    p_gen = sub.add_parser('generate', help='只生成合成数据')
+    p_gen.add_argument('out_dir')
+    add_generator_options(p_gen)
+
+    p_run = sub.add_parser('run', help='生成数据并运行全部阶段')
+    add_generator_options(p_run)
+    p_run.add_argument('-o', '--output', default='benchmark_report.json', help='JSON 报告路径')
+    p_run.add_argument('--keep', metavar='DIR', help='在指定目录中运行并保留生成的文件')
+    p_run.add_argument('--stages', nargs='+', choices=[s[0] for s in STAGES], help='只运行指定阶段')
+    p_run.add_argument('--repeat', type=int, default=1, help='每个阶段重复次数 (取最快)')
+
+    p_cmp = sub.add_parser('compare', help='对比两份报告')
+    p_cmp.add_argument('base')
+    p_cmp.add_argument('new')
+    p_cmp.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='回退阈值 (相对变化)')
+
+    args = parser.parse_args()
+    gen_options = {}
+    if args.command in ('generate', 'run'):
+        gen_options = dict(rate=args.rate, duration=args.duration, jitter_ms=args.jitter_ms,
+                           loss=args.loss, seed=args.seed, baro_rate=args.baro_rate)
+
+    if args.command == 'generate':
+        meta = generate(args.out_dir, **gen_options)
+        print(f"✓ 已生成 {meta['rows']} 行: {args.out_dir}")
+    elif args.command == 'run':
+        report = run_benchmark(args.output, args.keep, args.stages, args.repeat, **gen_options)
+        failed = [name for name, r in report['stages'].items() if r['returncode'] != 0]
+        sys.exit(1 if failed else 0)
+    else:
+        sys.exit(0 if compare_reports(args.base, args.new, args.threshold) else 1)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '_child':
+        _child_main(sys.argv[2:])
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+bin 文件的分块压缩归档 (.binz)
+
+把 bin 文件按 BLOCK_FRAMES 帧分块，每块独立压缩，文件末尾保存块索引
+(每块的偏移、压缩/原始长度、首帧时间戳、块内累计最大时间戳)。压缩前按
+字节位置重排块内的帧并做相邻帧差分，CRC 替换为与重新计算值的异或 (见
+_encode_block)：GPS 恒为 0、帧头、时间戳高位和缓变的数值都会变成连续的 0，
+压缩率比直接压缩高得多。
+
+    python3 bin_archive.py compress WTR1_data/WTR1_50hz.bin --codec zstd   # -> WTR1_50hz.binz
+    python3 bin_archive.py extract WTR1_data/WTR1_50hz.binz                # -> WTR1_50hz.bin
+    python3 bin_archive.py info WTR1_data/WTR1_50hz.binz
+
+bin_to_csv / playback 可直接读取 .binz: 按时间定位时只根据块索引找到目标块，
+解压这一块即可。解压结果与原 bin 文件逐字节一致 (包括末尾不足一帧的字节)。
+
+压缩算法: zlib (标准库，默认)、zstd (需要 zstandard)、lz4 (需要 lz4)。
+
+文件格式 (小端):
+    头部 HEADER_FMT: 魔数、版本、压缩算法、帧长、每块帧数
+    各块压缩数据
+    块索引: 每块一条 BLOCK_FMT
+    尾部 TRAILER_FMT: 块索引偏移、块数、魔数
+"""
+import io
+import os
+import struct
+
+import bin_to_csv
+
+FRAME_LEN = bin_to_csv.FRAME_LEN
+
+ARCHIVE_SUFFIX = '.binz'
+ARCHIVE_MAGIC = b'BLEBINZ\x01'
+ARCHIVE_VERSION = 1
+
+# 魔数, 版本, 压缩算法, 帧长, 每块帧数
+HEADER_FMT = '<8s H B H I'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+# 块偏移, 压缩长度, 原始长度, 首帧时间戳, 块内累计最大时间戳
+BLOCK_FMT = '<Q I I Q Q'
+BLOCK_SIZE = struct.calcsize(BLOCK_FMT)
+# 块索引偏移, 块数, 魔数
+TRAILER_FMT = '<Q I 8s'
+TRAILER_SIZE = struct.calcsize(TRAILER_FMT)
+
+# 每块帧数 (4096 帧 = 320 KB，50Hz 下约 80 秒)
+BLOCK_FRAMES = 4096
+
+CODECS = ('zlib', 'zstd', 'lz4')
+DEFAULT_CODEC = 'zlib'
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+def _codec(name):
+    """返回 (压缩函数, 解压函数)；可选依赖在使用时才导入"""
+    if name == 'zlib':
+        import zlib
+        return (lambda data: zlib.compress(data, ZLIB_LEVEL)), zlib.decompress
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("使用 zstd 压缩需要安装 zstandard: pip install zstandard")
+        return (zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress,
+                zstandard.ZstdDecompressor().decompress)
+    if name == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("使用 lz4 压缩需要安装 lz4: pip install lz4")
+        return lz4.frame.compress, lz4.frame.decompress
+    raise ValueError(f"未知的压缩算法: {name}")
+
+def _encode_block(data):
+    """
+    压缩前的可逆变换 (只处理完整帧，末尾不足一帧的字节原样追加):
+    1. CRC 字段替换为 "接收 CRC xor 计算 CRC" (正常帧为 0，损坏帧原样可还原)
+    2. 按字节位置重排 (第 0 字节的所有帧、第 1 字节的所有帧 ...)
+    3. 每个字节位置内做相邻帧的差分 (mod 256)
+    """
+    import numpy as np
+    whole = len(data) // FRAME_LEN * FRAME_LEN
+    frames = np.frombuffer(data, dtype=np.uint8, count=whole).reshape(-1, FRAME_LEN).copy()
+    crc = bin_to_csv.crc16_frames(frames.view(bin_to_csv.frame_dtype()).reshape(-1))
+    frames[:, FRAME_LEN - 2] ^= (crc & 0xFF).astype(np.uint8)
+    frames[:, FRAME_LEN - 1] ^= (crc >> 8).astype(np.uint8)
+    columns = frames.T
+    deltas = np.diff(columns, axis=1, prepend=np.zeros((FRAME_LEN, 1), dtype=np.uint8))
+    return deltas.tobytes() + bytes(data[whole:])
+
+def _decode_block(data):
+    """_encode_block 的逆变换"""
+    import numpy as np
+    whole = len(data) // FRAME_LEN * FRAME_LEN
+    deltas = np.frombuffer(data, dtype=np.uint8, count=whole).reshape(FRAME_LEN, -1)
+    frames = np.cumsum(deltas, axis=1, dtype=np.uint8).T.copy()
+    crc = bin_to_csv.crc16_frames(frames.view(bin_to_csv.frame_dtype()).reshape(-1))
+    frames[:, FRAME_LEN - 2] ^= (crc & 0xFF).astype(np.uint8)
+    frames[:, FRAME_LEN - 1] ^= (crc >> 8).astype(np.uint8)
+    return frames.tobytes() + bytes(data[whole:])
+
+def archive_path(bin_path):
+    return os.path.splitext(bin_path)[0] + ARCHIVE_SUFFIX
+
+def is_archive(path):
+    """文件是否为 .binz 归档 (按魔数判断)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+    except OSError:
+        return False
+
+class ArchiveReader:
+    """按块随机读取 .binz 归档，接口与 bin_index.BinIndex 的定位方法一致"""
+
+    def __init__(self, path):
+        import numpy as np
+        self.path = path
+        self._file = open(path, 'rb')
+        magic, version, codec_id, frame_len, self.block_frames = \
+            struct.unpack(HEADER_FMT, self._file.read(HEADER_SIZE))
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION or frame_len != FRAME_LEN:
+            self._file.close()
+            raise ValueError(f"不支持的归档文件: {path}")
+        self.codec = CODECS[codec_id]
+        _, self._decompress = _codec(self.codec)
+
+        self._file.seek(-TRAILER_SIZE, os.SEEK_END)
+        index_offset, count, magic = struct.unpack(TRAILER_FMT, self._file.read(TRAILER_SIZE))
+        if magic != ARCHIVE_MAGIC:
+            self._file.close()
+            raise ValueError(f"归档文件不完整 (缺少块索引): {path}")
+        self._file.seek(index_offset)
+        blocks = np.frombuffer(self._file.read(count * BLOCK_SIZE), dtype=np.dtype([
+            ('offset', '<u8'), ('compressed', '<u4'), ('size', '<u4'),
+            ('first_time', '<u8'), ('max_time', '<u8')]))
+        self.blocks = blocks
+        # 每块起始的原始字节偏移 (最后一个元素为原始总长度)
+        self.block_bytes = np.concatenate([[0], np.cumsum(blocks['size'].astype(np.int64))])
+        self.raw_size = int(self.block_bytes[-1])
+        self.frames = self.raw_size // FRAME_LEN
+        self.first_time = int(blocks['first_time'][0]) if count else 0
+        self.max_time = int(blocks['max_time'][-1]) if count else 0
+        import bin_index
+        self.ticks = bin_index.ticks_per_second(self.first_time) if count else 1_000_000
+        self._cached = (None, None)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_block(self, b):
+        """解压第 b 块，返回原始字节 (缓存最近一块)"""
+        if self._cached[0] == b:
+            return self._cached[1]
+        block = self.blocks[b]
+        self._file.seek(int(block['offset']))
+        data = _decode_block(self._decompress(self._file.read(int(block['compressed']))))
+        self._cached = (b, data)
+        return data
+
+    def read(self, start, end):
+        """读取原始字节区间 [start, end)，只解压涉及的块"""
+        import numpy as np
+        end = min(end, self.raw_size)
+        if start >= end:
+            return b''
+        first = int(np.searchsorted(self.block_bytes, start, side='right')) - 1
+        last = int(np.searchsorted(self.block_bytes, end, side='left'))
+        parts = [self.read_block(b) for b in range(first, last)]
+        data = parts[0] if len(parts) == 1 else b''.join(parts)
+        base = int(self.block_bytes[first])
+        return data[start - base:end - base]
+
+    def read_frames(self, first, last):
+        """读取帧区间 [first, last) 的原始字节"""
+        return self.read(first * FRAME_LEN, last * FRAME_LEN)
+
+    def seek(self, timestamp):
+        """第一帧 time >= timestamp 的帧序号 (只解压一个块)"""
+        import numpy as np
+        if self.frames == 0 or timestamp <= self.first_time:
+            return 0
+        if timestamp > self.max_time:
+            return self.frames
+        # 块内累计最大时间戳单调不减，第一个达到 timestamp 的块即为目标块
+        b = int(np.searchsorted(self.blocks['max_time'], timestamp, side='left'))
+        times = np.frombuffer(self.read_block(b), dtype=bin_to_csv.frame_dtype(),
+                              count=int(self.blocks['size'][b]) // FRAME_LEN)['time'].astype(np.int64)
+        if b:
+            times = np.maximum(times, int(self.blocks['max_time'][b - 1]))
+        first_frame = int(self.block_bytes[b]) // FRAME_LEN
+        return first_frame + int(np.searchsorted(np.maximum.accumulate(times), timestamp, side='left'))
+
+    def seek_seconds(self, seconds):
+        return self.seek(self.first_time + int(round(seconds * self.ticks)))
+
+    def frame_range(self, start=None, end=None):
+        """相对首帧的时间区间 [start, end) (秒) 对应的帧序号区间"""
+        a = self.seek_seconds(start) if start is not None else 0
+        b = self.seek_seconds(end) if end is not None else self.frames
+        return a, max(a, b)
+
+    def load_frames(self, first=0):
+        """解压 first 帧之后的全部帧为结构化数组"""
+        import numpy as np
+        data = self.read_frames(first, self.frames)
+        return np.frombuffer(data, dtype=bin_to_csv.frame_dtype(), count=len(data) // FRAME_LEN)
+
+class ArchiveFile(io.RawIOBase):
+    """把归档包装为只读的文件对象 (seek / read 时按需解压块)"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self.pos
+        elif whence == os.SEEK_END:
+            pos += self.reader.raw_size
+        self.pos = max(0, pos)
+        return self.pos
+
+    def readinto(self, buffer):
+        data = self.reader.read(self.pos, self.pos + len(buffer))
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.reader.close()
+        super().close()
+
+def open_bin(path):
+    """打开 bin 或 .binz 文件，返回可 read / seek 的二进制文件对象"""
+    if is_archive(path):
+        return io.BufferedReader(ArchiveFile(ArchiveReader(path)), buffer_size=BLOCK_FRAMES * FRAME_LEN)
+    return open(path, 'rb')
+
+def compress_bin(bin_path, out_path=None, codec=DEFAULT_CODEC, block_frames=BLOCK_FRAMES):
+    """
+    把 bin 文件压缩为 .binz 归档 (先写临时文件，完成后替换)
+    :return: 输出路径
+    """
+    import numpy as np
+    compress, _ = _codec(codec)
+    out_path = out_path or archive_path(bin_path)
+    block_bytes = block_frames * FRAME_LEN
+    entries = []
+    running_max = 0
+    tmp = out_path + '.tmp'
+    with open(bin_path, 'rb') as f_in, open(tmp, 'wb') as f_out:
+        f_out.write(struct.pack(HEADER_FMT, ARCHIVE_MAGIC, ARCHIVE_VERSION, CODECS.index(codec),
+                                FRAME_LEN, block_frames))
+        while True:
+            data = f_in.read(block_bytes)
+            if not data:
+                break
+            times = np.frombuffer(data, dtype=bin_to_csv.frame_dtype(),
+                                  count=len(data) // FRAME_LEN)['time']
+            first_time = int(times[0]) if len(times) else running_max
+            if len(times):
+                running_max = max(running_max, int(times.max()))
+            compressed = compress(_encode_block(data))
+            entries.append(struct.pack(BLOCK_FMT, f_out.tell(), len(compressed), len(data),
+                                       first_time, running_max))
+            f_out.write(compressed)
+        index_offset = f_out.tell()
+        f_out.write(b''.join(entries))
+        f_out.write(struct.pack(TRAILER_FMT, index_offset, len(entries), ARCHIVE_MAGIC))
+    os.replace(tmp, out_path)
+    return out_path
+
+def extract_bin(path, out_path=None):
+    """把 .binz 归档还原为 bin 文件"""
+    out_path = out_path or os.path.splitext(path)[0] + '.bin'
+    tmp = out_path + '.tmp'
+    with ArchiveReader(path) as reader, open(tmp, 'wb') as f_out:
+        for b in range(len(reader.blocks)):
+            f_out.write(reader.read_block(b))
+    os.replace(tmp, out_path)
+    return out_path
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='bin 文件分块压缩归档 (.binz)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('compress', help='压缩 bin 文件')
+    p.add_argument('files', nargs='+')
+    p.add_argument('--codec', choices=CODECS, default=DEFAULT_CODEC)
+    p.add_argument('--block-frames', type=int, default=BLOCK_FRAMES, help='每块帧数')
+    p = sub.add_parser('extract', help='还原为 bin 文件')
+    p.add_argument('files', nargs='+')
+    p.add_argument('--force', action='store_true', help='覆盖已存在的 bin 文件')
+    p = sub.add_parser('info', help='显示归档信息')
+    p.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"✗ 找不到文件: {path}")
+            continue
+        if args.command == 'compress':
+            import packed_frame
+            if packed_frame.is_packed_file(path):
+                print(f"✗ {path} 是打包帧文件，不需要再归档")
+                continue
+            begin = time.perf_counter()
+            out = compress_bin(path, codec=args.codec, block_frames=args.block_frames)
+            size, packed = os.path.getsize(path), os.path.getsize(out)
+            print(f"✓ {out}: {size} -> {packed} bytes ({size / max(packed, 1):.1f}x, "
+                  f"{time.perf_counter() - begin:.2f} 秒)")
+        elif args.command == 'extract':
+            out = os.path.splitext(path)[0] + '.bin'
+            if os.path.exists(out) and not args.force:
+                print(f"✗ {out} 已存在 (使用 --force 覆盖)")
+                continue
+            print(f"✓ {extract_bin(path, out)}")
+        else:
+            with ArchiveReader(path) as reader:
+                span = (reader.max_time - reader.first_time) / reader.ticks
+                print(f"{path}: {reader.codec}, {len(reader.blocks)} 块 x {reader.block_frames} 帧, "
+                      f"{reader.frames} 帧, {span:.1f} 秒, 原始 {reader.raw_size} bytes "
+                      f"({reader.raw_size / os.path.getsize(path):.1f}x)")
+
+if __name__ == '__main__':
+    main()
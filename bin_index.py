@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+bin 文件的时间戳索引 (.idx 旁路文件)
+
+把时间轴按 BUCKET_SECONDS 分桶，记录每个桶内第一帧的帧序号。帧长固定
+(FRAME_LEN)，因此定位任意时间戳只需: 计算桶号 -> 取出桶的帧范围 -> 在该范围内
+对 mmap 的时间戳二分查找，不再扫描整个文件。
+
+    idx = bin_index.get_index('WTR1_data/WTR1_50hz.bin')   # 缺失或过期时自动重建
+    frame = idx.seek_seconds(37 * 60)                       # 第 37 分钟的第一帧
+    offset = frame * FRAME_LEN
+
+索引头记录了 bin 文件的大小和修改时间 (ns)，两者与当前文件不一致时视为过期。
+csv_to_bin 生成 bin 后会同时写出索引 (追加模式下只为新增帧补充索引)。
+
+文件格式 (小端):
+    头部 HEADER_FMT: 魔数、版本、帧长、bin 大小、bin mtime_ns、帧数、
+                     时间戳单位 (每秒多少个)、桶宽 (时间戳单位)、首帧时间戳、最大时间戳
+    之后为 uint64 数组: 第 b 个桶 [t0 + b*桶宽, t0 + (b+1)*桶宽) 内第一帧的序号
+"""
+import os
+import struct
+
+import bin_to_csv
+
+FRAME_LEN = bin_to_csv.FRAME_LEN
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'BLEIDX\x00\x01'
+INDEX_VERSION = 1
+
+# 魔数, 版本, 帧长, bin 大小, bin mtime_ns, 帧数, 每秒时间戳单位数, 桶宽, 首帧时间戳, 最大时间戳
+HEADER_FMT = '<8s H H Q q Q Q Q Q Q'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+
+# 桶宽 (秒)
+BUCKET_SECONDS = 1.0
+
+def index_path(bin_path):
+    return bin_path + INDEX_SUFFIX
+
+def ticks_per_second(first_time):
+    """16 位微秒时间戳 -> 1e6；13 位毫秒时间戳 -> 1e3"""
+    return 1000 if 0 < first_time < 10**14 else 1_000_000
+
+class BinIndex:
+    """bin 文件的时间戳分桶索引"""
+
+    def __init__(self, bin_path, frames, ticks, bucket, first_time, max_time, entries,
+                 size=None, mtime_ns=None):
+        self.bin_path = bin_path
+        self.frames = frames
+        self.ticks = ticks
+        self.bucket = bucket
+        self.first_time = first_time
+        self.max_time = max_time
+        self.entries = entries
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._times = None
+
+    def _frame_times(self):
+        """mmap 的时间戳列 (首次使用时打开)"""
+        if self._times is None:
+            self._times = bin_to_csv.load_frames(self.bin_path)['time']
+        return self._times
+
+    def is_current(self):
+        """索引是否与 bin 文件的当前大小和修改时间一致"""
+        try:
+            stat = os.stat(self.bin_path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    def seek(self, timestamp):
+        """第一帧 time >= timestamp 的帧序号 (timestamp 为原始时间戳单位)"""
+        import numpy as np
+        if self.frames == 0 or timestamp <= self.first_time:
+            return 0
+        if timestamp > self.max_time:
+            return self.frames
+        b = (timestamp - self.first_time) // self.bucket
+        lo = int(self.entries[b])
+        hi = int(self.entries[b + 1]) if b + 1 < len(self.entries) else self.frames
+        if lo >= hi:
+            return lo
+        # 只读取该桶范围内的时间戳 (时间戳回退时用累计最大值保持有序)
+        times = self._frame_times()[lo:hi].astype(np.int64)
+        return lo + int(np.searchsorted(np.maximum.accumulate(times), timestamp, side='left'))
+
+    def seek_seconds(self, seconds):
+        """相对首帧 seconds 秒处的第一帧序号"""
+        return self.seek(self.first_time + int(round(seconds * self.ticks)))
+
+    def frame_range(self, start=None, end=None):
+        """相对首帧的时间区间 [start, end) (秒，None 表示不限) 对应的帧序号区间"""
+        a = self.seek_seconds(start) if start is not None else 0
+        b = self.seek_seconds(end) if end is not None else self.frames
+        return a, max(a, b)
+
+def _bucket_entries(times, first_time, bucket, base=0, running_max=None):
+    """计算各桶第一帧的序号 (按累计最大值，容忍时间戳回退)"""
+    import numpy as np
+    runmax = np.maximum.accumulate(times)
+    if running_max is not None:
+        runmax = np.maximum(runmax, running_max)
+    count = int((runmax[-1] - first_time) // bucket) + 1
+    starts = first_time + np.arange(count, dtype=np.int64) * bucket
+    return base + np.searchsorted(runmax, starts, side='left').astype(np.uint64), int(runmax[-1])
+
+def build_index(bin_path, bucket_seconds=BUCKET_SECONDS):
+    """扫描 bin 文件的时间戳 (mmap，只读时间戳列) 构建索引"""
+    import numpy as np
+    stat = os.stat(bin_path)
+    times = bin_to_csv.load_frames(bin_path)['time'].astype(np.int64)
+    if len(times) == 0:
+        return BinIndex(bin_path, 0, 1_000_000, 1, 0, 0, np.zeros(0, dtype=np.uint64),
+                        stat.st_size, stat.st_mtime_ns)
+    first_time = int(times[0])
+    ticks = ticks_per_second(first_time)
+    bucket = max(1, int(bucket_seconds * ticks))
+    entries, max_time = _bucket_entries(times, first_time, bucket)
+    return BinIndex(bin_path, len(times), ticks, bucket, first_time, max_time, entries,
+                    stat.st_size, stat.st_mtime_ns)
+
+def extend_index(index):
+    """
+    bin 文件追加了新帧后，只读取新增帧的时间戳补充索引
+    (要求追加前索引与文件一致，且已有帧未被修改)
+    """
+    import numpy as np
+    stat = os.stat(index.bin_path)
+    frames = bin_to_csv.load_frames(index.bin_path)
+    if len(frames) < index.frames:
+        return build_index(index.bin_path)
+    if index.frames == 0:
+        return build_index(index.bin_path)
+    new_times = frames['time'][index.frames:].astype(np.int64)
+    if len(new_times):
+        tail, max_time = _bucket_entries(new_times, index.first_time, index.bucket,
+                                         base=index.frames, running_max=index.max_time)
+        # 已有的桶保持不变，只追加新出现的桶
+        index.entries = np.concatenate([index.entries, tail[len(index.entries):]])
+        index.max_time = max_time
+    index.frames = len(frames)
+    index._times = None
+    index.size = stat.st_size
+    index.mtime_ns = stat.st_mtime_ns
+    return index
+
+def write_index(index, path=None):
+    path = path or index_path(index.bin_path)
+    header = struct.pack(HEADER_FMT, INDEX_MAGIC, INDEX_VERSION, FRAME_LEN,
+                         index.size, index.mtime_ns, index.frames, index.ticks,
+                         index.bucket, index.first_time, index.max_time)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(index.entries.astype('<u8').tobytes())
+    os.replace(tmp, path)
+    return path
+
+def load_index(bin_path, path=None):
+    """读取索引；不存在、格式不符或已过期时返回 None"""
+    import numpy as np
+    path = path or index_path(bin_path)
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) != HEADER_SIZE:
+                return None
+            (magic, version, frame_len, size, mtime_ns, frames, ticks,
+             bucket, first_time, max_time) = struct.unpack(HEADER_FMT, header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or frame_len != FRAME_LEN:
+                return None
+            entries = np.frombuffer(f.read(), dtype='<u8').astype(np.uint64)
+    except OSError:
+        return None
+    index = BinIndex(bin_path, frames, ticks, bucket, first_time, max_time, entries, size, mtime_ns)
+    return index if index.is_current() else None
+
+def get_index(bin_path, save=True):
+    """读取有效的索引，缺失或过期时重建 (save=True 时写回 .idx，写入失败不影响使用)"""
+    index = load_index(bin_path)
+    if index is None:
+        index = build_index(bin_path)
+        if save:
+            try:
+                write_index(index)
+            except OSError:
+                pass
+    return index
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='构建 / 查询 bin 文件的时间戳索引')
+    parser.add_argument('bin_files', nargs='+')
+    parser.add_argument('--seek', type=float, help='查询相对首帧该秒数处的帧序号')
+    args = parser.parse_args()
+
+    for bin_path in args.bin_files:
+        if not os.path.exists(bin_path):
+            print(f"✗ 找不到文件: {bin_path}")
+            continue
+        index = get_index(bin_path)
+        span = (index.max_time - index.first_time) / index.ticks
+        print(f"✓ {index_path(bin_path)}: {index.frames} 帧, {span:.1f} 秒, {len(index.entries)} 个桶")
+        if args.seek is not None:
+            frame = index.seek_seconds(args.seek)
+            print(f"  {args.seek} 秒 -> 帧 {frame} (字节偏移 {frame * FRAME_LEN})")
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,14 @@
 协议格式: Header(2) + Cmd(1) + Len(1) + Payload(74) + CRC(2) = 80 Bytes
 """
 import csv
+import mmap
 import struct
 import os
 import sys
 
+import metrics
+import stage_log
+
 # 常量定义
 HEADER0 = 0x55
 HEADER1 = 0xAA
@@ -15,6 +19,82 @@ CMD_TYPE = 0x01
 PAYLOAD_LEN = 74  # 0x4A
 FRAME_LEN = 80
 
+# Payload 的 struct 格式 (与 csv_to_bin.PAYLOAD_FMT 一致)
+PAYLOAD_FMT = '<Q iii iii iii iii iii i h'
+
+G_TO_MS2 = 9.80665
+
+# 帧同步字: Header + Cmd + Len
+SYNC_PATTERN = bytes([HEADER0, HEADER1, CMD_TYPE, PAYLOAD_LEN])
+
+# 重同步扫描每次向量化校验的帧数
+SCAN_BLOCK_FRAMES = 65536
+
+# 帧结构 (numpy 结构化类型，紧凑排列，共 80 字节)
+FRAME_FIELDS = [
+    ('header0', 'u1'), ('header1', 'u1'), ('cmd', 'u1'), ('len', 'u1'),
+    ('time', '<u8'),
+    ('acc_x', '<i4'), ('acc_y', '<i4'), ('acc_z', '<i4'),
+    ('gyro_x', '<i4'), ('gyro_y', '<i4'), ('gyro_z', '<i4'),
+    ('mag_x', '<i4'), ('mag_y', '<i4'), ('mag_z', '<i4'),
+    ('roll', '<i4'), ('pitch', '<i4'), ('yaw', '<i4'),
+    ('gps_lat', '<i4'), ('gps_lon', '<i4'), ('gps_speed', '<i4'),
+    ('pressure', '<i4'),
+    ('temp', '<i2'),
+    ('crc', '<u2'),
+]
+
+# 转换输出的 CSV 字段
+CSV_FIELDS = [
+    'time',
+    'AccX(g)', 'AccY(g)', 'AccZ(g)',
+    'AsX(°/s)', 'AsY(°/s)', 'AsZ(°/s)',
+    'HX(uT)', 'HY(uT)', 'HZ(uT)',
+    'AngleX(°)', 'AngleY(°)', 'AngleZ(°)',
+    'GPS_Lat', 'GPS_Lon', 'GPS_Speed',
+    'pressure', 'Temperature(°C)',
+]
+
+# decode_frames 的物理量列: (CSV 列名, 帧字段, 依次除以的数) —— 与 values_to_row 的运算顺序一致
+DECODE_FIELDS = [
+    ('AccX(g)', 'acc_x', (1000.0, G_TO_MS2)),
+    ('AccY(g)', 'acc_y', (1000.0, G_TO_MS2)),
+    ('AccZ(g)', 'acc_z', (1000.0, G_TO_MS2)),
+    ('AsX(°/s)', 'gyro_x', (1000.0,)),
+    ('AsY(°/s)', 'gyro_y', (1000.0,)),
+    ('AsZ(°/s)', 'gyro_z', (1000.0,)),
+    ('HX(uT)', 'mag_x', (100.0,)),
+    ('HY(uT)', 'mag_y', (100.0,)),
+    ('HZ(uT)', 'mag_z', (100.0,)),
+    ('AngleX(°)', 'roll', (10000.0,)),
+    ('AngleY(°)', 'pitch', (10000.0,)),
+    ('AngleZ(°)', 'yaw', (10000.0,)),
+    ('pressure', 'pressure', (100.0,)),
+    ('Temperature(°C)', 'temp', (100.0,)),
+]
+
+# 转换时每次解码的帧数
+DECODE_CHUNK_FRAMES = 65536
+
+# 往返校验字段: (CSV 列名, 帧字段, 编码倍数)
+# csv_to_bin 按 int(值 * 倍数) 截断编码，因此解码误差必须小于一个量化步长 1/倍数
+ROUND_TRIP_FIELDS = [
+    ('AccX(g)', 'acc_x', G_TO_MS2 * 1000),
+    ('AccY(g)', 'acc_y', G_TO_MS2 * 1000),
+    ('AccZ(g)', 'acc_z', G_TO_MS2 * 1000),
+    ('AsX(°/s)', 'gyro_x', 1000),
+    ('AsY(°/s)', 'gyro_y', 1000),
+    ('AsZ(°/s)', 'gyro_z', 1000),
+    ('HX(uT)', 'mag_x', 100),
+    ('HY(uT)', 'mag_y', 100),
+    ('HZ(uT)', 'mag_z', 100),
+    ('AngleX(°)', 'roll', 10000),
+    ('AngleY(°)', 'pitch', 10000),
+    ('AngleZ(°)', 'yaw', 10000),
+    ('pressure', 'pressure', 100),
+    ('Temperature(°C)', 'temp', 100),
+]
+
 # CRC16-MODBUS 表
 CRC16_TABLE = [
     0x0000, 0xC0C1, 0xC181, 0x0140, 0xC301, 0x03C0, 0x0280, 0xC241,
@@ -59,6 +139,38 @@ def calculate_crc16(data: bytes) -> int:
         crc = (crc >> 8) ^ CRC16_TABLE[idx]
     return crc
 
+def values_to_row(unpacked):
+    """
+    把 Payload 的整数值 (时间戳 + 17 个字段) 换算为 CSV 各列的物理量
+    """
+    return {
+        'time': unpacked[0],
+        # Acc: bin中为 m/s^2 * 1000, 需转回 g
+        'AccX(g)': unpacked[1] / 1000.0 / G_TO_MS2,
+        'AccY(g)': unpacked[2] / 1000.0 / G_TO_MS2,
+        'AccZ(g)': unpacked[3] / 1000.0 / G_TO_MS2,
+        # Gyro: bin中为 deg/s * 1000
+        'AsX(°/s)': unpacked[4] / 1000.0,
+        'AsY(°/s)': unpacked[5] / 1000.0,
+        'AsZ(°/s)': unpacked[6] / 1000.0,
+        # Mag: bin中为 uT * 100
+        'HX(uT)': unpacked[7] / 100.0,
+        'HY(uT)': unpacked[8] / 100.0,
+        'HZ(uT)': unpacked[9] / 100.0,
+        # Euler: bin中为 deg * 10000
+        'AngleX(°)': unpacked[10] / 10000.0,
+        'AngleY(°)': unpacked[11] / 10000.0,
+        'AngleZ(°)': unpacked[12] / 10000.0,
+        # GPS: 原始值
+        'GPS_Lat': unpacked[13],
+        'GPS_Lon': unpacked[14],
+        'GPS_Speed': unpacked[15],
+        # Pressure: bin中为 hPa * 100
+        'pressure': unpacked[16] / 100.0,
+        # Temp: bin中为 °C * 100
+        'Temperature(°C)': unpacked[17] / 100.0,
+    }
+
 def parse_frame(frame_data: bytes):
     """
     解析单帧数据
@@ -90,38 +202,10 @@ def parse_frame(frame_data: bytes):
     # 4. 解析 Payload
     # Payload 格式: Q iii iii iii iii iii i h
     # timestamp(8) + acc(12) + gyro(12) + mag(12) + euler(12) + gps(12) + pressure(4) + temp(2) = 74
-    payload_fmt = '<Q iii iii iii iii iii i h'
-    unpacked = struct.unpack(payload_fmt, payload)
-    
-    # 反向转换系数
-    G_TO_MS2 = 9.80665
+    unpacked = struct.unpack(PAYLOAD_FMT, payload)
     
-    data = {
-        'time': unpacked[0],
-        # Acc: bin中为 m/s^2 * 1000, 需转回 g
-        'AccX(g)': unpacked[1] / 1000.0 / G_TO_MS2,
-        'AccY(g)': unpacked[2] / 1000.0 / G_TO_MS2,
-        'AccZ(g)': unpacked[3] / 1000.0 / G_TO_MS2,
-        # Gyro: bin中为 deg/s * 1000
-        'AsX(°/s)': unpacked[4] / 1000.0,
-        'AsY(°/s)': unpacked[5] / 1000.0,
-        'AsZ(°/s)': unpacked[6] / 1000.0,
-        # Mag: bin中为 uT * 100
-        'HX(uT)': unpacked[7] / 100.0,
-        'HY(uT)': unpacked[8] / 100.0,
-        'HZ(uT)': unpacked[9] / 100.0,
-        # Euler: bin中为 deg * 10000
-        'AngleX(°)': unpacked[10] / 10000.0,
-        'AngleY(°)': unpacked[11] / 10000.0,
-        'AngleZ(°)': unpacked[12] / 10000.0,
-        # GPS: 原始值
-        'GPS_Lat': unpacked[13],
-        'GPS_Lon': unpacked[14],
-        'GPS_Speed': unpacked[15],
-        # Pressure: bin中为 hPa * 100
-        'pressure': unpacked[16] / 100.0,
-        # Temp: bin中为 °C * 100
-        'Temperature(°C)': unpacked[17] / 100.0,
+    data = values_to_row(unpacked)
+    data.update({
         # 额外信息
         '__crc_valid': crc_valid,
         '__received_crc': received_crc,
@@ -130,16 +214,21 @@ def parse_frame(frame_data: bytes):
         '__raw_acc_x': unpacked[1],
         '__raw_acc_y': unpacked[2],
         '__raw_acc_z': unpacked[3],
-    }
+    })
     
     return True, data, None
 
-def convert_bin_to_csv(bin_path, csv_path=None, include_raw=False):
+@metrics.timed('bin_to_csv')
+def convert_bin_to_csv(bin_path, csv_path=None, include_raw=False, resync=False, start=None, end=None):
     """
     将 bin 文件转换为 csv
     :param bin_path: 输入的 bin 文件路径
     :param csv_path: 输出的 csv 文件路径 (默认: bin文件同名.csv)
     :param include_raw: 是否包含原始整数值列
+    :param resync: 按同步字重新定位帧边界 (用于有丢字节/插入字节的损坏文件)，
+                   只输出 CRC 正确的完整帧，并报告跳过的字节区间
+    :param start: 只导出相对首帧 start 秒之后的帧 (通过 .idx 索引直接定位)
+    :param end: 只导出相对首帧 end 秒之前的帧
     """
     if not os.path.exists(bin_path):
         print(f"✗ 找不到文件: {bin_path}")
@@ -148,33 +237,48 @@ def convert_bin_to_csv(bin_path, csv_path=None, include_raw=False):
     if csv_path is None:
         csv_path = os.path.splitext(bin_path)[0] + '_from_bin.csv'
     
-    file_size = os.path.getsize(bin_path)
+    import bin_archive
+    archive = bin_archive.is_archive(bin_path)
+    # .binz 归档按解压后的原始大小计算
+    file_size = raw_size(bin_path)
     expected_frames = file_size // FRAME_LEN
+    packed = _is_packed(bin_path)
+    first_frame = 0
+    # 指定时间区间时只读取区间内的帧 (None: 读到文件末尾)
+    frame_limit = None
+    if (start is not None or end is not None) and not packed:
+        if archive:
+            # 归档的块索引带时间戳，只解压目标块即可定位
+            with bin_archive.ArchiveReader(bin_path) as reader:
+                first_frame, last_frame = reader.frame_range(start, end)
+        else:
+            import bin_index
+            first_frame, last_frame = bin_index.get_index(bin_path).frame_range(start, end)
+        expected_frames = frame_limit = last_frame - first_frame
     
     print(f"=" * 60)
     print(f"BIN -> CSV 转换 & 校验工具")
     print(f"=" * 60)
     print(f"➜ 输入文件: {bin_path}")
     print(f"  文件大小: {file_size} bytes ({file_size / 1024 / 1024:.2f} MB)")
-    print(f"  预期帧数: {expected_frames}")
+    if archive:
+        print(f"  格式: 分块压缩归档 (.binz, 压缩后 {os.path.getsize(bin_path)} bytes)")
+    if packed:
+        print(f"  格式: 多样本打包帧 (Cmd 0x02)")
+    else:
+        print(f"  预期帧数: {expected_frames}")
+    if frame_limit is not None:
+        print(f"  导出区间: 帧 {first_frame} ~ {first_frame + expected_frames}")
     print(f"➜ 输出文件: {csv_path}")
     print()
     
     # 检查文件大小是否为帧长度的整数倍
-    if file_size % FRAME_LEN != 0:
+    if not packed and file_size % FRAME_LEN != 0:
         print(f"⚠️ 警告: 文件大小 {file_size} 不是帧长度 {FRAME_LEN} 的整数倍!")
         print(f"   余数: {file_size % FRAME_LEN} bytes")
     
     # CSV 字段
-    fieldnames = [
-        'time',
-        'AccX(g)', 'AccY(g)', 'AccZ(g)',
-        'AsX(°/s)', 'AsY(°/s)', 'AsZ(°/s)',
-        'HX(uT)', 'HY(uT)', 'HZ(uT)',
-        'AngleX(°)', 'AngleY(°)', 'AngleZ(°)',
-        'GPS_Lat', 'GPS_Lon', 'GPS_Speed',
-        'pressure', 'Temperature(°C)',
-    ]
+    fieldnames = list(CSV_FIELDS)
     
     if include_raw:
         fieldnames.extend(['__raw_acc_x', '__raw_acc_y', '__raw_acc_z'])
@@ -184,40 +288,52 @@ def convert_bin_to_csv(bin_path, csv_path=None, include_raw=False):
     valid_frames = 0
     crc_errors = 0
     parse_errors = 0
+    log = stage_log.StageLog('bin_to_csv', file=bin_path)
     
-    with open(bin_path, 'rb') as f_bin, open(csv_path, 'w', newline='', encoding='utf-8') as f_csv:
-        writer = csv.DictWriter(f_csv, fieldnames=fieldnames)
-        writer.writeheader()
+    # 打包帧按帧头逐帧解析，本身就会跳过损坏区间 (即 --resync 的行为)
+    if packed or (resync and _has_packed_frames(_open_bin(bin_path))):
+        return _convert_packed(bin_path, csv_path, fieldnames, log, start, end)
+    
+    if resync:
+        return _convert_resync(bin_path, csv_path, fieldnames, log)
+    
+    import numpy as np
+    with bin_archive.open_bin(bin_path) as f_bin, open(csv_path, 'w', newline='', encoding='utf-8') as f_csv:
+        writer = csv.writer(f_csv)
+        writer.writerow(fieldnames)
+        f_bin.seek(first_frame * FRAME_LEN)
         
-        while True:
-            frame_data = f_bin.read(FRAME_LEN)
-            if not frame_data:
-                break
-            if len(frame_data) < FRAME_LEN:
-                print(f"⚠️ 帧 {total_frames + 1}: 数据不完整 ({len(frame_data)} bytes)")
+        # 按块批量解码 (每块 DECODE_CHUNK_FRAMES 帧)
+        while frame_limit is None or total_frames < frame_limit:
+            chunk = DECODE_CHUNK_FRAMES if frame_limit is None else min(DECODE_CHUNK_FRAMES, frame_limit - total_frames)
+            with metrics.step('read'):
+                data = f_bin.read(chunk * FRAME_LEN)
+            if not data:
                 break
             
-            total_frames += 1
-            is_valid, data, error = parse_frame(frame_data)
-            
-            if not is_valid:
+            with metrics.step('parse'):
+                columns = decode_frames(data)
+            header_valid = columns['__header_valid']
+            # 帧头错误的帧不输出；CRC 错误只报告，仍然输出
+            for i in np.flatnonzero(~header_valid).tolist():
                 parse_errors += 1
-                if parse_errors <= 10:
-                    print(f"⚠️ 帧 {total_frames}: {error}")
-                continue
-            
-            if not data['__crc_valid']:
+                log.error('解析错误', f"帧 {first_frame + total_frames + i + 1}",
+                          parse_frame(data[i * FRAME_LEN:(i + 1) * FRAME_LEN])[2])
+            for i in np.flatnonzero(header_valid & ~columns['__crc_valid']).tolist():
                 crc_errors += 1
-                if crc_errors <= 10:
-                    print(f"⚠️ 帧 {total_frames}: CRC 错误 "
-                          f"(接收: {data['__received_crc']:04X}, "
-                          f"计算: {data['__calculated_crc']:04X})")
+                log.error('CRC 错误', f"帧 {first_frame + total_frames + i + 1}",
+                          f"接收: {int(columns['__raw_crc'][i]):04X}, 计算: {int(columns['__calculated_crc'][i]):04X}")
             
-            valid_frames += 1
+            with metrics.step('write'):
+                _write_rows(writer, columns, fieldnames, header_valid)
+            frames = len(header_valid)
+            total_frames += frames
+            valid_frames += int(header_valid.sum())
+            log.progress(total_frames, expected_frames)
             
-            # 写入 CSV (只写入需要的字段)
-            row = {k: v for k, v in data.items() if k in fieldnames}
-            writer.writerow(row)
+            if len(data) % FRAME_LEN:
+                log.error('数据不完整', f"帧 {first_frame + total_frames + 1}", f"{len(data) % FRAME_LEN} bytes")
+                break
     
     # 打印统计
     print()
@@ -229,15 +345,284 @@ def convert_bin_to_csv(bin_path, csv_path=None, include_raw=False):
     print(f"  解析错误: {parse_errors}")
     print(f"  CRC 错误: {crc_errors}")
     
+    metrics.count('rows', total_frames)
+    metrics.count('crc_errors', crc_errors)
+    metrics.count('parse_errors', parse_errors)
+    metrics.count_file('bytes_read', bin_path)
+    metrics.count_file('bytes_written', csv_path)
+    log.finish(ok=parse_errors == 0 and crc_errors == 0,
+               frames=total_frames, valid_frames=valid_frames)
+    
     if parse_errors > 0 or crc_errors > 0:
         print()
         print(f"⚠️ 检测到 {parse_errors + crc_errors} 个错误!")
+        print(f"   文件可能有丢失/多余的字节，可使用 --resync 按同步字恢复完整帧")
         return False
     else:
         print()
         print(f"✓ 全部帧校验通过!")
         return True
 
+def _frames_ok(raw):
+    """raw: (n, FRAME_LEN) uint8 数组，返回每帧帧头与 CRC 是否都正确"""
+    import numpy as np
+    sync = np.frombuffer(SYNC_PATTERN, dtype=np.uint8)
+    header_ok = (raw[:, :4] == sync).all(axis=1)
+    received = raw[:, 78].astype(np.uint16) | (raw[:, 79].astype(np.uint16) << 8)
+    return header_ok & (crc16_frames(raw) == received)
+
+def _find_sync(buf, start):
+    """从 start 开始查找下一个帧头与 CRC 都正确的候选位置，找不到返回 -1"""
+    end = len(buf) - FRAME_LEN
+    pos = buf.find(SYNC_PATTERN, start)
+    while 0 <= pos <= end:
+        frame = buf[pos:pos + FRAME_LEN]
+        if calculate_crc16(frame[2:78]) == struct.unpack_from('<H', frame, 78)[0]:
+            return pos
+        pos = buf.find(SYNC_PATTERN, pos + 1)
+    return -1
+
+def scan_frames(buf, block_frames=SCAN_BLOCK_FRAMES):
+    """
+    在可能损坏的字节流中定位所有完整帧
+
+    从当前位置起按 FRAME_LEN 对齐，整块向量化校验帧头和 CRC；遇到第一个坏帧时
+    用 bytes.find 搜索下一个同步字 (55 AA 01 4A)，CRC 正确才视为重新同步，
+    然后从该位置继续对齐校验。重同步后块大小从小块开始倍增，避免损坏密集时
+    反复校验整块。
+    :param buf: bytes 或 mmap
+    :return: (帧起始偏移 int64 数组, 跳过的字节区间列表 [(start, end), ...])
+    """
+    import numpy as np
+    data = np.frombuffer(buf, dtype=np.uint8)
+    size = len(data)
+    offsets = []
+    skipped = []
+    skip_start = None
+    pos = 0
+    block = block_frames
+    while pos + FRAME_LEN <= size:
+        count = min(block, (size - pos) // FRAME_LEN)
+        raw = data[pos:pos + count * FRAME_LEN].reshape(count, FRAME_LEN)
+        bad = np.flatnonzero(~_frames_ok(raw))
+        run = int(bad[0]) if len(bad) else count
+        if run:
+            if skip_start is not None:
+                skipped.append((skip_start, pos))
+                skip_start = None
+            offsets.append(np.arange(pos, pos + run * FRAME_LEN, FRAME_LEN, dtype=np.int64))
+            pos += run * FRAME_LEN
+        if run == count:
+            block = min(block * 4, block_frames)
+            continue
+        block = min(64, block_frames)
+        # pos 处的帧损坏: 搜索下一个有效同步位置
+        if skip_start is None:
+            skip_start = pos
+        pos = _find_sync(buf, pos + 1)
+        if pos < 0:
+            pos = size
+            break
+
+    if skip_start is None and pos < size:
+        skip_start = pos
+    if skip_start is not None and skip_start < size:
+        skipped.append((skip_start, size))
+    offsets = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+    return offsets, skipped
+
+def raw_size(bin_path):
+    """bin 文件的字节数 (.binz 归档为解压后的字节数)"""
+    import bin_archive
+    if bin_archive.is_archive(bin_path):
+        with bin_archive.ArchiveReader(bin_path) as reader:
+            return reader.raw_size
+    return os.path.getsize(bin_path)
+
+def _open_bin(bin_path):
+    """以只读 mmap 打开 bin 文件 (空文件返回 b''，.binz 归档整体解压)"""
+    import bin_archive
+    if bin_archive.is_archive(bin_path):
+        with bin_archive.ArchiveReader(bin_path) as reader:
+            return reader.read(0, reader.raw_size)
+    if os.path.getsize(bin_path) == 0:
+        return b''
+    with open(bin_path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _report_skipped(skipped, log, max_ranges=20):
+    total = sum(end - start for start, end in skipped)
+    print(f"  跳过区间: {len(skipped)} 段, 共 {total} bytes")
+    for start, end in skipped[:max_ranges]:
+        print(f"    [{start}, {end}) {end - start} bytes")
+    if len(skipped) > max_ranges:
+        print(f"    ... 另有 {len(skipped) - max_ranges} 段")
+    for start, end in skipped:
+        log.error('跳过字节', f"{start}-{end}", f"{end - start} bytes")
+    return total
+
+def _convert_resync(bin_path, csv_path, fieldnames, log):
+    """convert_bin_to_csv 的重同步模式"""
+    buf = _open_bin(bin_path)
+    offsets, skipped = scan_frames(buf)
+    frame_count = len(offsets)
+
+    import numpy as np
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f_csv:
+        writer = csv.writer(f_csv)
+        writer.writerow(fieldnames)
+        for i in range(0, frame_count, DECODE_CHUNK_FRAMES):
+            chunk = offsets[i:i + DECODE_CHUNK_FRAMES]
+            frames = raw[chunk[:, None] + np.arange(FRAME_LEN)]
+            _write_rows(writer, decode_frames(frames), fieldnames)
+            log.progress(i + len(chunk), frame_count)
+
+    print()
+    print(f"=" * 60)
+    print(f"重同步转换完成!")
+    print(f"=" * 60)
+    print(f"  恢复帧数: {frame_count}")
+    skipped_bytes = _report_skipped(skipped, log)
+
+    metrics.count('rows', frame_count)
+    metrics.count('skipped_bytes', skipped_bytes)
+    metrics.count_file('bytes_read', bin_path)
+    metrics.count_file('bytes_written', csv_path)
+    log.finish(ok=not skipped, frames=frame_count, skipped_bytes=skipped_bytes)
+
+    print()
+    if skipped:
+        print(f"⚠️ 已跳过 {len(skipped)} 段损坏数据，其余 {frame_count} 帧 CRC 全部正确")
+        return False
+    print(f"✓ 全部帧校验通过!")
+    return True
+
+def _is_packed(bin_path):
+    import packed_frame
+    return packed_frame.is_packed_file(bin_path)
+
+def _has_packed_frames(buf):
+    """
+    缓冲区中是否有 CRC 正确的打包帧
+
+    损坏文件的第一帧可能不完整，_is_packed 只检查文件开头，恢复时用它补充判断。
+    """
+    import packed_frame
+    pos = buf.find(packed_frame.SYNC_PATTERN)
+    while pos >= 0:
+        end = pos + buf[pos + 3] + 6 if pos + 3 < len(buf) else len(buf) + 1
+        if end <= len(buf) and \
+                calculate_crc16(bytes(buf[pos + 2:end - 2])) == struct.unpack_from('<H', buf, end - 2)[0]:
+            return True
+        pos = buf.find(packed_frame.SYNC_PATTERN, pos + 1)
+    return False
+
+def _convert_packed(bin_path, csv_path, fieldnames, log, start=None, end=None):
+    """convert_bin_to_csv 的打包帧 (Cmd 0x02) 模式，可与单样本帧混合"""
+    import bin_index
+    import packed_frame
+    buf = _open_bin(bin_path)
+    frame_count = sample_count = 0
+    skipped = []
+    lo = hi = None
+
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f_csv:
+        writer = csv.DictWriter(f_csv, fieldnames=fieldnames)
+        writer.writeheader()
+        for kind, offset, length, samples in packed_frame.iter_frames(buf):
+            if kind == 'skip':
+                skipped.append((offset, length))
+                continue
+            frame_count += 1
+            if lo is None and (start is not None or end is not None):
+                # 打包帧没有 .idx 索引，按相对首个样本的时间过滤
+                first = samples[0][0]
+                ticks = bin_index.ticks_per_second(first)
+                lo = first + int(round(start * ticks)) if start is not None else None
+                hi = first + int(round(end * ticks)) if end is not None else None
+            for ts, values in samples:
+                if (lo is not None and ts < lo) or (hi is not None and ts >= hi):
+                    continue
+                data = values_to_row([ts] + values)
+                data.update({'__raw_acc_x': values[0], '__raw_acc_y': values[1], '__raw_acc_z': values[2]})
+                writer.writerow({k: v for k, v in data.items() if k in fieldnames})
+                sample_count += 1
+            log.progress(sample_count)
+
+    print()
+    print(f"=" * 60)
+    print(f"打包帧转换完成!")
+    print(f"=" * 60)
+    print(f"  帧数: {frame_count}")
+    print(f"  样本数: {sample_count}")
+    skipped_bytes = _report_skipped(skipped, log) if skipped else 0
+
+    metrics.count('rows', sample_count)
+    metrics.count('skipped_bytes', skipped_bytes)
+    metrics.count_file('bytes_read', bin_path)
+    metrics.count_file('bytes_written', csv_path)
+    log.finish(ok=not skipped, frames=frame_count, samples=sample_count, skipped_bytes=skipped_bytes)
+
+    print()
+    if skipped:
+        print(f"⚠️ 已跳过 {len(skipped)} 段损坏数据，其余 {frame_count} 帧 CRC 全部正确")
+        return False
+    print(f"✓ 全部帧校验通过!")
+    return True
+
+@metrics.timed('recover_bin')
+def recover_bin(bin_path, out_path):
+    """把损坏 bin 文件中的完整帧按顺序写入新的 bin 文件"""
+    if not os.path.exists(bin_path):
+        print(f"✗ 找不到文件: {bin_path}")
+        return False
+    log = stage_log.StageLog('recover_bin', file=bin_path)
+    buf = _open_bin(bin_path)
+    if _is_packed(bin_path) or _has_packed_frames(buf):
+        return _recover_packed(buf, bin_path, out_path, log)
+    offsets, skipped = scan_frames(buf)
+
+    print(f"➜ 恢复: {bin_path} -> {out_path}")
+    with open(out_path, 'wb') as f_out:
+        # 连续的帧合并为一次写入
+        breaks = [0] + [i + 1 for i in range(len(offsets) - 1)
+                        if offsets[i + 1] != offsets[i] + FRAME_LEN] + [len(offsets)]
+        for a, b in zip(breaks[:-1], breaks[1:]):
+            if b > a:
+                start = int(offsets[a])
+                f_out.write(buf[start:start + (b - a) * FRAME_LEN])
+
+    print(f"  恢复帧数: {len(offsets)}")
+    skipped_bytes = _report_skipped(skipped, log)
+    metrics.count('rows', len(offsets))
+    metrics.count('skipped_bytes', skipped_bytes)
+    log.finish(ok=True, frames=len(offsets), skipped_bytes=skipped_bytes)
+    return True
+
+def _recover_packed(buf, bin_path, out_path, log):
+    """recover_bin 的打包帧模式: 帧长不固定，按 packed_frame.iter_frames 逐帧复制"""
+    import packed_frame
+    frame_count = sample_count = 0
+    skipped = []
+
+    print(f"➜ 恢复 (打包帧): {bin_path} -> {out_path}")
+    with open(out_path, 'wb') as f_out:
+        for kind, offset, length, samples in packed_frame.iter_frames(buf):
+            if kind == 'skip':
+                skipped.append((offset, length))
+                continue
+            f_out.write(buf[offset:offset + length])
+            frame_count += 1
+            sample_count += len(samples)
+
+    print(f"  恢复帧数: {frame_count} (样本数: {sample_count})")
+    skipped_bytes = _report_skipped(skipped, log)
+    metrics.count('rows', sample_count)
+    metrics.count('skipped_bytes', skipped_bytes)
+    log.finish(ok=True, frames=frame_count, samples=sample_count, skipped_bytes=skipped_bytes)
+    return True
+
 def compare_csv_files(original_csv, converted_csv, tolerance=1e-6):
     """
     对比原始 CSV 和从 bin 转换回来的 CSV
@@ -338,6 +723,223 @@ def compare_csv_files(original_csv, converted_csv, tolerance=1e-6):
         print(f"⚠️ 发现 {mismatches} 处不匹配")
         return False
 
+def frame_dtype():
+    """帧的 numpy 结构化类型"""
+    import numpy as np
+    dtype = np.dtype(FRAME_FIELDS)
+    assert dtype.itemsize == FRAME_LEN
+    return dtype
+
+def load_frames(bin_path):
+    """
+    以 mmap 方式把 bin 文件映射为结构化数组 (不复制数据)
+
+    文件末尾不足一帧的字节被忽略。.binz 归档会整体解压到内存。
+    """
+    import numpy as np
+    import bin_archive
+    if bin_archive.is_archive(bin_path):
+        with bin_archive.ArchiveReader(bin_path) as reader:
+            return reader.load_frames()
+    if _is_packed(bin_path):
+        raise ValueError(f"{bin_path} 是打包帧 (Cmd 0x02) 文件，帧长不固定，无法映射为结构化数组")
+    count = os.path.getsize(bin_path) // FRAME_LEN
+    if count == 0:
+        return np.zeros(0, dtype=frame_dtype())
+    return np.memmap(bin_path, dtype=frame_dtype(), mode='r', shape=(count,))
+
+def decode_frames(buffer, dtype='float64'):
+    """
+    批量解码帧 (bytes / bytearray / memoryview / mmap / numpy 数组均可，末尾不足一帧的字节忽略)
+
+    :param dtype: 物理量列的浮点类型 ('float64' 或 'float32')
+    :return: {列名: numpy 数组}
+        - CSV_FIELDS 中的各列: 物理量 (time 与 GPS 为原始整数)
+        - '__raw_<帧字段>': 原始整数列 (FRAME_FIELDS 中的每个字段，直接引用缓冲区，不复制)
+        - '__header_valid': 帧头、Cmd、Len 是否正确
+        - '__crc_valid': CRC 是否正确
+        - '__valid': 两者都正确
+        - '__calculated_crc': 重新计算的 CRC
+    """
+    import numpy as np
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'f':
+        raise ValueError(f"物理量列必须是浮点类型: {dtype}")
+    count = len(memoryview(buffer).cast('B')) // FRAME_LEN
+    if count:
+        frames = np.frombuffer(buffer, dtype=frame_dtype(), count=count)
+    else:
+        frames = np.zeros(0, dtype=frame_dtype())
+
+    columns = {f'__raw_{name}': frames[name] for name, _ in FRAME_FIELDS}
+    columns['time'] = frames['time']
+    for col, field, divisors in DECODE_FIELDS:
+        values = frames[field].astype(dtype)
+        for divisor in divisors:
+            values /= dtype.type(divisor)
+        columns[col] = values
+    columns['GPS_Lat'] = frames['gps_lat']
+    columns['GPS_Lon'] = frames['gps_lon']
+    columns['GPS_Speed'] = frames['gps_speed']
+
+    header_valid = ((frames['header0'] == HEADER0) & (frames['header1'] == HEADER1) &
+                    (frames['cmd'] == CMD_TYPE) & (frames['len'] == PAYLOAD_LEN))
+    calculated = crc16_frames(frames)
+    crc_valid = calculated == frames['crc']
+    columns['__header_valid'] = header_valid
+    columns['__crc_valid'] = crc_valid
+    columns['__valid'] = header_valid & crc_valid
+    columns['__calculated_crc'] = calculated
+    return columns
+
+def _write_rows(writer, columns, fieldnames, mask=None):
+    """把 decode_frames 的结果按 fieldnames 的顺序写入 csv.writer"""
+    lists = [(columns[k] if mask is None else columns[k][mask]).tolist() for k in fieldnames]
+    writer.writerows(zip(*lists))
+
+def crc16_frames(frames):
+    """对全部帧并行计算 CRC-16/MODBUS (Cmd + Len + Payload)，返回 uint16 数组"""
+    import numpy as np
+    raw = frames.view(np.uint8).reshape(-1, FRAME_LEN)
+    table = np.array(CRC16_TABLE, dtype=np.uint16)
+    crc = np.full(len(raw), 0xFFFF, dtype=np.uint16)
+    # 按字节列迭代 (76 次)，每次同时处理所有帧
+    for i in range(2, FRAME_LEN - 2):
+        crc = (crc >> 8) ^ table[(crc ^ raw[:, i]) & 0xFF]
+    return crc
+
+def _read_source_columns(source_path, columns):
+    """
+    读取源文件 (CSV 或列式) 的指定列，按 csv_to_bin 的规则转换为数组
+
+    时间列按整数解析 (无法解析记为 0)，其余列按浮点解析 (缺失/无法解析记为 0)。
+    """
+    import numpy as np
+    import pandas as pd
+    import columnar
+
+    if columnar.is_columnar(source_path):
+        present = set(columnar._unique_names(columnar.read_header(source_path)))
+        df = columnar.read_dataframe(source_path, [c for c in columns if c in present])
+    else:
+        df = pd.read_csv(source_path, usecols=lambda c: c in columns, dtype=str,
+                         keep_default_na=False)
+
+    out = {}
+    for col in columns:
+        if col not in df.columns:
+            out[col] = np.zeros(len(df), dtype=np.int64 if col == 'time' else np.float64)
+            continue
+        series = df[col]
+        if col == 'time':
+            if pd.api.types.is_integer_dtype(series):
+                out[col] = series.to_numpy(np.int64)
+            else:
+                text = series.astype(str).str.strip()
+                valid = text.str.fullmatch(r'[+-]?\d+')
+                out[col] = text.where(valid, '0').astype(np.int64).to_numpy()
+        else:
+            values = pd.to_numeric(series, errors='coerce')
+            out[col] = values.fillna(0.0).to_numpy(np.float64)
+    return out, len(df)
+
+@metrics.timed('validate_round_trip')
+def validate_round_trip(bin_path, source_path, max_locations=5):
+    """
+    向量化往返校验: 直接比较源文件各列与 mmap 解码的 bin 各列
+
+    - 帧头 / Cmd / Len / CRC 全部向量化检查
+    - 时间戳必须完全相等，GPS 必须为 0
+    - 其余字段的最大绝对误差必须小于该字段的量化步长
+    不生成中间的 _from_bin.csv。
+    :return: 是否通过
+    """
+    import numpy as np
+
+    print("=" * 60)
+    print("往返校验 (向量化)")
+    print("=" * 60)
+    print(f"  BIN 文件: {bin_path}")
+    print(f"  源文件:   {source_path}")
+
+    for path in (bin_path, source_path):
+        if not os.path.exists(path):
+            print(f"✗ 找不到文件: {path}")
+            return False
+
+    if _is_packed(bin_path):
+        print(f"✗ 往返校验不支持打包帧 (Cmd 0x02) 文件: {bin_path}")
+        print(f"  请先转换为 CSV 后用 -c 对比: python3 bin_to_csv.py {bin_path} -c {source_path}")
+        return False
+
+    frames = load_frames(bin_path)
+    decoded_columns = decode_frames(frames)
+    columns = ['time'] + [col for col, _, _ in ROUND_TRIP_FIELDS]
+    source, source_rows = _read_source_columns(source_path, columns)
+
+    passed = True
+    print(f"  帧数: {len(frames)}, 源行数: {source_rows}")
+    if raw_size(bin_path) % FRAME_LEN:
+        print(f"⚠️ 文件末尾有 {raw_size(bin_path) % FRAME_LEN} 字节不完整数据")
+        passed = False
+    if len(frames) != source_rows:
+        print("⚠️ 行数不匹配! 仅比较前 {} 行".format(min(len(frames), source_rows)))
+        passed = False
+
+    bad_header = ~decoded_columns['__header_valid']
+    bad_crc = ~decoded_columns['__crc_valid']
+    print(f"  帧头错误: {int(bad_header.sum())}, CRC 错误: {int(bad_crc.sum())}")
+    if bad_header.any() or bad_crc.any():
+        passed = False
+        for i in np.flatnonzero(bad_header | bad_crc)[:max_locations]:
+            print(f"    帧 {i + 1}: 接收 CRC {int(frames['crc'][i]):04X}")
+
+    n = min(len(frames), source_rows)
+
+    # 时间戳: 精确匹配
+    time_diff = np.flatnonzero(frames['time'][:n].astype(np.int64) != source['time'][:n])
+    if len(time_diff):
+        passed = False
+        print(f"⚠️ 时间戳不匹配: {len(time_diff)} 行")
+        for i in time_diff[:max_locations]:
+            print(f"    行 {i + 1}: 原始={source['time'][i]}, 转换={int(frames['time'][i])}")
+
+    gps_nonzero = int(((frames['gps_lat'] != 0) | (frames['gps_lon'] != 0) |
+                       (frames['gps_speed'] != 0)).sum())
+    if gps_nonzero:
+        passed = False
+        print(f"⚠️ GPS 字段非零: {gps_nonzero} 帧")
+
+    print()
+    print("字段误差:")
+    print("-" * 86)
+    print(f"{'字段':<18} {'最大绝对误差':<14} {'最大相对误差':<14} {'量化步长':<14} {'超限行数':<8} 结果")
+    print("-" * 86)
+    for col, field, scale in ROUND_TRIP_FIELDS:
+        step = 1.0 / scale
+        orig = source[col][:n]
+        decoded = decoded_columns[col][:n]
+        abs_err = np.abs(orig - decoded)
+        nonzero = np.abs(orig) > 1e-10
+        rel_err = np.divide(abs_err, np.abs(orig), out=abs_err.copy(), where=nonzero)
+
+        # 截断编码的误差上界为一个步长 (额外留出浮点舍入余量)
+        over = np.flatnonzero(abs_err >= step * (1 + 1e-6))
+        max_abs = float(abs_err.max()) if n else 0.0
+        max_rel = float(rel_err.max()) if n else 0.0
+        ok = len(over) == 0
+        passed = passed and ok
+        print(f"{col:<18} {max_abs:<14.6e} {max_rel:<14.6e} {step:<14.6e} {len(over):<8} {'✓' if ok else '✗'}")
+        for i in over[:max_locations]:
+            print(f"    行 {i + 1}: 原始={orig[i]}, 转换={decoded[i]}")
+
+    print()
+    if passed:
+        print("✓ 往返校验通过 (时间戳完全一致，其余字段在量化步长内)!")
+    else:
+        print("⚠️ 往返校验未通过")
+    return passed
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='将 BIN 文件转换为 CSV 并校验')
@@ -345,11 +947,27 @@ def main():
     parser.add_argument('-o', '--output', help='输出的 CSV 文件路径')
     parser.add_argument('-c', '--compare', help='用于对比的原始 CSV 文件')
     parser.add_argument('--raw', action='store_true', help='包含原始整数值')
+    parser.add_argument('--validate', metavar='SOURCE',
+                        help='与源 CSV/列式文件做向量化往返校验 (不生成中间 CSV)')
+    parser.add_argument('--resync', action='store_true',
+                        help='按同步字重新定位帧 (恢复丢字节/插入字节后的完整帧)')
+    parser.add_argument('--recover', metavar='OUT_BIN',
+                        help='把完整帧写入新的 bin 文件 (不生成 CSV)')
+    parser.add_argument('--start', type=float, help='只导出相对首帧该秒数之后的帧 (使用 .idx 索引定位)')
+    parser.add_argument('--end', type=float, help='只导出相对首帧该秒数之前的帧')
     
     args = parser.parse_args()
+    if args.resync and (args.start is not None or args.end is not None):
+        parser.error("--resync 不能与 --start / --end 同时使用")
+    
+    if args.validate:
+        sys.exit(0 if validate_round_trip(args.bin_file, args.validate) else 1)
+    
+    if args.recover:
+        sys.exit(0 if recover_bin(args.bin_file, args.recover) else 1)
     
     # 转换
-    success = convert_bin_to_csv(args.bin_file, args.output, args.raw)
+    success = convert_bin_to_csv(args.bin_file, args.output, args.raw, args.resync, args.start, args.end)
     
     # 如果指定了对比文件，进行对比
     if args.compare and success:
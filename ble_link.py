@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+BLE 链路模拟 (回放输出端前的一级)
+
+真实设备通过 BLE 通知 (notification) 发送帧: 每个 ATT 包最多 MTU-3 字节，
+只能在连接事件 (每个连接间隔一次) 中发送，每个事件最多发送若干个包。
+LinkEmulator 包装 playback.Sink，对写入的帧做同样的处理:
+
+- 每帧按 MTU 拆分为 ATT 包 (帧长不超过 MTU-3 时一帧一个包)，放入发送队列
+- 每个连接间隔从队列取出最多 packets_per_event 个包
+- 每个包按丢包率丢弃；按乱序概率推迟到下一个连接事件；再按时延分布延迟后
+  写入下层输出端 (UDP 下一个包一个数据报)
+- 队列超过 QUEUE_BYTES 时视为阻塞: wait 策略暂停回放，drop 策略丢弃新帧
+
+随机数使用固定种子，同样的参数得到同样的丢包/乱序/时延序列。结束时报告
+实际吞吐量、链路容量 (按实际每帧包数折算为帧/秒) 和包从入队到送达的时延，
+用于评估某个链路配置能承载多高的传感器采样率:
+
+    python3 playback.py WTR1_data/WTR1_50hz.bin --target udp://127.0.0.1:9001 --speed 10 \\
+        --link --mtu 23 --conn-interval-ms 30 --packets-per-event 4 --loss 0.01 --seed 1
+"""
+import asyncio
+import collections
+import math
+import random
+import time
+
+import playback
+
+# ATT 通知的协议开销 (opcode 1 + handle 2)
+ATT_HEADER = 3
+
+DEFAULT_MTU = 247
+DEFAULT_CONN_INTERVAL = 0.015
+DEFAULT_PACKETS_PER_EVENT = 4
+
+# 发送队列的高水位 (字节)
+QUEUE_BYTES = 16 * 1024
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'exponential')
+
+class LinkEmulator:
+    """
+    模拟 BLE 链路的输出端，接口与 playback.Sink 相同
+
+    :param mtu: ATT_MTU (每个包最多 mtu - 3 字节)
+    :param interval: 连接间隔 (秒)
+    :param packets_per_event: 每个连接事件最多发送的包数
+    :param loss: 丢包率
+    :param reorder: 包被推迟到下一个连接事件的概率
+    :param latency: 送达时延的基准值 (秒)
+    :param latency_jitter: 时延分布的离散程度 (秒，uniform 为半宽，normal 为标准差，exponential 为均值)
+    :param latency_dist: 时延分布 (LATENCY_DISTRIBUTIONS)
+    :param seed: 随机数种子
+    """
+
+    def __init__(self, sink, mtu=DEFAULT_MTU, interval=DEFAULT_CONN_INTERVAL,
+                 packets_per_event=DEFAULT_PACKETS_PER_EVENT, loss=0.0, reorder=0.0,
+                 latency=0.0, latency_jitter=0.0, latency_dist='normal', seed=0,
+                 queue_bytes=QUEUE_BYTES):
+        if mtu <= ATT_HEADER:
+            raise ValueError(f"MTU 必须大于 {ATT_HEADER}: {mtu}")
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"未知的时延分布: {latency_dist}")
+        self.sink = sink
+        self.mtu = mtu
+        self.interval = interval
+        self.packets_per_event = packets_per_event
+        self.loss = loss
+        self.reorder = reorder
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.latency_dist = latency_dist
+        self.queue_bytes_limit = queue_bytes
+        self.rng = random.Random(seed)
+        self.policy = sink.policy
+        self._dropped_frames = 0
+
+        self._queue = collections.deque()
+        self._queue_bytes = 0
+        self._next_frame = 0
+        self._lost_frames = set()
+        self._in_flight = 0
+        self._queued = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = None
+
+        self.counts = {
+            'frames_offered': 0, 'bytes_offered': 0,
+            'packets_sent': 0, 'packets_lost': 0, 'packets_reordered': 0,
+            'packets_delivered': 0, 'bytes_delivered': 0,
+            'frames_delivered': 0, 'frames_lost': 0,
+            'connection_events': 0, 'max_queue_bytes': 0,
+        }
+        self.delay = playback.JitterStats()
+        self._first_send = None
+        self._last_delivery = None
+
+    @property
+    def description(self):
+        return (f"{self.sink.description} (BLE MTU {self.mtu}, "
+                f"{self.interval * 1000:g} ms x {self.packets_per_event} 包)")
+
+    @property
+    def clients(self):
+        return self.sink.clients
+
+    @property
+    def listening(self):
+        return self.sink.listening
+
+    @property
+    def bytes_sent(self):
+        return self.sink.bytes_sent
+
+    @property
+    def dropped_frames(self):
+        return self._dropped_frames + self.sink.dropped_frames
+
+    @property
+    def blocked(self):
+        return self._queue_bytes > self.queue_bytes_limit or self.sink.blocked
+
+    @property
+    def undelivered_frames(self):
+        """已提交但尚未送达也未确认丢失的帧数 (仍在发送队列或传输中)"""
+        c = self.counts
+        return c['frames_offered'] - c['frames_delivered'] - c['frames_lost']
+
+    @property
+    def pending_seconds(self):
+        """按连接间隔发完当前队列、再经基准时延送达所需的时间 (秒)"""
+        events = math.ceil(len(self._queue) / self.packets_per_event)
+        return (events + 1) * self.interval + self.latency
+
+    @property
+    def capacity(self):
+        """链路容量 (字节/秒，每个包都装满时)"""
+        return self.packets_per_event * (self.mtu - ATT_HEADER) / self.interval
+
+    async def start(self, wait_clients=1):
+        await self.sink.start(wait_clients)
+        self._task = asyncio.ensure_future(self._run())
+
+    def send(self, data, frames, bounds=None):
+        """把帧拆分为 ATT 包放入发送队列"""
+        if self.policy == 'drop' and self._queue_bytes > self.queue_bytes_limit:
+            self._dropped_frames += frames
+            return
+        if self._first_send is None:
+            self._first_send = time.perf_counter()
+        now = time.perf_counter()
+        size = self.mtu - ATT_HEADER
+        bounds = bounds or [(a, a + playback.FRAME_LEN) for a in range(0, len(data), playback.FRAME_LEN)]
+        for start, end in bounds:
+            frame_id = self._next_frame
+            self._next_frame += 1
+            for offset in range(start, end, size):
+                packet = bytes(data[offset:min(offset + size, end)])
+                last = offset + size >= end
+                self._queue.append((frame_id, last, packet, now))
+                self._queue_bytes += len(packet)
+        self.counts['frames_offered'] += len(bounds)
+        self.counts['bytes_offered'] += len(data)
+        self.counts['max_queue_bytes'] = max(self.counts['max_queue_bytes'], self._queue_bytes)
+        if self._queue_bytes > self.queue_bytes_limit:
+            self._space.clear()
+        self._idle.clear()
+        self._queued.set()
+
+    def _latency(self):
+        jitter, dist = self.latency_jitter, self.latency_dist
+        if dist == 'fixed' or jitter <= 0:
+            extra = 0.0
+        elif dist == 'uniform':
+            extra = self.rng.uniform(-jitter, jitter)
+        elif dist == 'normal':
+            extra = self.rng.gauss(0.0, jitter)
+        else:
+            extra = self.rng.expovariate(1.0 / jitter)
+        return max(0.0, self.latency + extra)
+
+    async def _run(self):
+        """每个连接间隔发送一次 (空闲时按连接间隔的网格对齐下一个事件)"""
+        loop = asyncio.get_running_loop()
+        origin = last_event = loop.time() - self.interval
+        while True:
+            if not self._queue:
+                self._queued.clear()
+                if not self._in_flight:
+                    self._idle.set()
+                await self._queued.wait()
+            now = loop.time()
+            event = origin + math.ceil((now - origin) / self.interval) * self.interval
+            event = max(event, last_event + self.interval)
+            await asyncio.sleep(event - now)
+            last_event = event
+            self._connection_event(loop)
+
+    def _connection_event(self, loop):
+        self.counts['connection_events'] += 1
+        for _ in range(min(self.packets_per_event, len(self._queue))):
+            frame_id, last, packet, queued_at = self._queue.popleft()
+            self._queue_bytes -= len(packet)
+            self.counts['packets_sent'] += 1
+            if self.rng.random() < self.loss:
+                self.counts['packets_lost'] += 1
+                self._lost_frames.add(frame_id)
+                if last:
+                    self._finish_frame(frame_id)
+                continue
+            delay = self._latency()
+            if self.rng.random() < self.reorder:
+                # 推迟到下一个连接事件，落在之后发送的包后面
+                self.counts['packets_reordered'] += 1
+                delay += self.interval
+            self._in_flight += 1
+            loop.call_later(delay, self._deliver, frame_id, last, packet, queued_at)
+        if self._queue_bytes <= self.queue_bytes_limit // 2:
+            self._space.set()
+
+    def _finish_frame(self, frame_id):
+        if frame_id in self._lost_frames:
+            self._lost_frames.discard(frame_id)
+            self.counts['frames_lost'] += 1
+        else:
+            self.counts['frames_delivered'] += 1
+
+    def _deliver(self, frame_id, last, packet, queued_at):
+        self._in_flight -= 1
+        self.sink.send(packet, 1 if last else 0, [(0, len(packet))])
+        now = time.perf_counter()
+        self._last_delivery = now
+        self.delay.add([now - queued_at])
+        self.counts['packets_delivered'] += 1
+        self.counts['bytes_delivered'] += len(packet)
+        if last:
+            self._finish_frame(frame_id)
+        if not self._in_flight and not self._queue:
+            self._idle.set()
+
+    async def drain(self):
+        """等待发送队列降到高水位的一半以下"""
+        await self._space.wait()
+        await self.sink.drain()
+
+    async def flush(self, timeout=None):
+        """
+        等待队列中的包全部发送并送达 (或超时)
+        :param timeout: 在按剩余队列估算的发送时间 (pending_seconds) 之外再等待的秒数，None 表示不限
+        """
+        if timeout is not None:
+            timeout += self.pending_seconds
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.sink.close()
+
+    def summary(self):
+        """链路统计: 实际吞吐量、容量和包时延"""
+        c = dict(self.counts)
+        elapsed = (self._last_delivery - self._first_send) if self._last_delivery else 0.0
+        packets_per_frame = c['packets_sent'] / max(1, c['frames_lost'] + c['frames_delivered']) \
+            if c['packets_sent'] else math.ceil(playback.FRAME_LEN / (self.mtu - ATT_HEADER))
+        events_per_second = 1.0 / self.interval
+        c.update({
+            'mtu': self.mtu,
+            'conn_interval_ms': round(self.interval * 1000, 3),
+            'packets_per_event': self.packets_per_event,
+            'loss': self.loss,
+            'reorder': self.reorder,
+            'latency_ms': round(self.latency * 1000, 3),
+            'latency_jitter_ms': round(self.latency_jitter * 1000, 3),
+            'latency_dist': self.latency_dist,
+            'queued_bytes': self._queue_bytes,
+            'queued_packets': len(self._queue),
+            'in_flight_packets': self._in_flight,
+            'frames_undelivered': self.undelivered_frames,
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_bytes_per_second': round(c['bytes_delivered'] / elapsed, 1) if elapsed else None,
+            'frames_per_second': round(c['frames_delivered'] / elapsed, 2) if elapsed else None,
+            'capacity_bytes_per_second': round(self.capacity, 1),
+            'capacity_frames_per_second': round(self.packets_per_event * events_per_second / packets_per_frame, 2),
+            'packet_delay': self.delay.summary(),
+        })
+        return c
+
+def print_summary(summary, label=''):
+    s = summary
+    print(f"  {label}BLE 链路: MTU {s['mtu']}, 连接间隔 {s['conn_interval_ms']} ms, 每事件 {s['packets_per_event']} 包, "
+          f"丢包 {s['loss']:.2%}, 乱序 {s['reorder']:.2%}")
+    print(f"    提交 {s['frames_offered']} 帧 / {s['bytes_offered']} bytes, 送达 {s['frames_delivered']} 帧 "
+          f"(丢失 {s['frames_lost']}), 剩余队列 {s['queued_bytes']} bytes, 最大队列 {s['max_queue_bytes']} bytes")
+    if s['frames_undelivered']:
+        print(f"    ⚠️ 未送达 {s['frames_undelivered']} 帧: 结束时队列中还有 {s['queued_packets']} 个包, "
+              f"{s['in_flight_packets']} 个包在传输中")
+    print(f"    吞吐量 {s['throughput_bytes_per_second']} bytes/s ({s['frames_per_second']} 帧/秒), "
+          f"链路容量 {s['capacity_bytes_per_second']} bytes/s (约 {s['capacity_frames_per_second']} 帧/秒)")
+    delay = s['packet_delay']
+    if delay:
+        print(f"    包时延 (入队到送达): 平均 {delay['mean_us'] / 1000:.2f} ms, P50 {delay['p50_us'] / 1000:.2f} ms, "
+              f"P99 {delay['p99_us'] / 1000:.2f} ms, 最大 {delay['max_us'] / 1000:.2f} ms")
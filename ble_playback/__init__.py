@@ -0,0 +1,36 @@
+"""
+BLE 数据处理工具包
+
+各工具仍是仓库根目录下的独立脚本 (run.sh 与文档中的 python3 xxx.py 用法不变)，
+本包提供:
+
+- 统一命令行: python3 -m ble_playback <命令> [参数...] (见 cli.py)
+- 按需加载的模块访问: ble_playback.bin_to_csv.decode_frames(...)，
+  子模块在第一次访问属性时才导入，import ble_playback 本身不导入任何工具模块
+"""
+import importlib
+import os
+import sys
+
+# 工具脚本所在目录 (仓库根目录)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 可通过 ble_playback.<名称> 访问的工具模块
+MODULES = (
+    'align_barometer', 'bin_archive', 'bin_index', 'bin_to_csv', 'ble_link',
+    'columnar', 'convert_timestamp', 'csv_to_bin', 'dataset_stats', 'downsample_50hz',
+    'ingest', 'metrics', 'packed_frame', 'playback', 'split_by_device', 'stage_log', 'stages',
+    'verify_csv', 'verify_split', 'verify_timestamp',
+)
+
+def __getattr__(name):
+    if name in MODULES:
+        module = importlib.import_module(name)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(MODULES))
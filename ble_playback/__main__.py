@@ -0,0 +1,5 @@
+import sys
+
+from ble_playback import cli
+
+sys.exit(cli.main())
@@ -0,0 +1,76 @@
+"""
+统一命令行入口
+
+    python3 -m ble_playback split data.txt
+    python3 -m ble_playback decode WTR1_data/WTR1_50hz.bin --validate WTR1_data/WTR1_50hz.csv
+    python3 -m ble_playback verify timestamp --audit --json timestamp_audit.json
+    python3 -m ble_playback play WTR1_data/WTR1_50hz.bin --target udp://127.0.0.1:9001
+
+每个命令对应一个根目录脚本，以 runpy 按 __main__ 运行 (与 python3 xxx.py 完全一致，
+参数原样传给脚本自己的 argparse)。只导入被选中的脚本，numpy / pandas 等重依赖
+仍在脚本内部首次使用时才导入，因此 --help 和轻量命令的启动开销接近解释器本身。
+"""
+import runpy
+import sys
+
+import ble_playback  # noqa: F401  (把仓库根目录加入 sys.path)
+
+# 命令 -> (脚本模块, 说明)
+COMMANDS = {
+    'split': ('split_by_device', '按设备拆分原始数据'),
+    'align': ('align_barometer', '对齐气压计数据'),
+    'downsample': ('downsample_50hz', '降采样到 50Hz 并生成 BIN'),
+    'encode': ('csv_to_bin', 'CSV 转换为 BIN'),
+    'decode': ('bin_to_csv', 'BIN 转换为 CSV / 往返校验 / 恢复'),
+    'verify': (None, '验证 (timestamp / split / csv)'),
+    'play': ('playback', '按时间戳实时回放 BIN'),
+    'archive': ('bin_archive', '压缩 / 解压 .binz 归档'),
+    'index': ('bin_index', '生成 / 查看 .idx 时间索引'),
+    'ingest': ('ingest', '从 TCP 实时采集并分段写入 BIN'),
+}
+
+# verify 的子命令
+VERIFY_COMMANDS = {
+    'timestamp': ('verify_timestamp', '时间戳格式验证 / 审计'),
+    'split': ('verify_split', '拆分结果与原始数据对比'),
+    'csv': ('verify_csv', '设备 CSV 与原始数据逐行对比'),
+}
+
+def _usage(commands, prog):
+    lines = [f"用法: {prog} <命令> [参数...]", "", "命令:"]
+    width = max(len(name) for name in commands)
+    for name, (_, help_text) in commands.items():
+        lines.append(f"  {name:<{width}}  {help_text}")
+    lines.append("")
+    lines.append(f"各命令的参数见 {prog} <命令> --help")
+    return "\n".join(lines)
+
+def _resolve(argv):
+    """解析命令 -> (脚本模块, 脚本参数, 0)；无法解析时返回 (None, 帮助或错误信息, 退出码)"""
+    prog = 'python3 -m ble_playback'
+    commands = COMMANDS
+    while True:
+        if not argv:
+            return None, _usage(commands, prog), 2
+        if argv[0] in ('-h', '--help'):
+            return None, _usage(commands, prog), 0
+        name, argv = argv[0], argv[1:]
+        if name not in commands:
+            return None, f"未知命令: {name}\n\n{_usage(commands, prog)}", 2
+        module = commands[name][0]
+        if module is not None:
+            return module, argv, 0
+        # verify 等带子命令的命令
+        prog = f"{prog} {name}"
+        commands = VERIFY_COMMANDS
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    module, args, code = _resolve(argv)
+    if module is None:
+        print(args, file=sys.stderr if code else sys.stdout)
+        return code
+    # 以脚本方式运行 (sys.argv[0] 被替换为脚本路径，其余参数原样传入)
+    sys.argv = [module] + args
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+    return 0
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+列式中间格式 (Parquet / Feather)
+
+拆分、对齐、降采样各阶段之间默认通过 CSV 交接。设置环境变量
+BLE_INTERMEDIATE_FORMAT=parquet (或 feather) 后，各阶段改为写入带类型、
+按列压缩的列式文件；csv_to_bin 与 /api/stats 直接按列读取，不再解析文本。
+需要 CSV 时可随时导出:
+
+    python3 columnar.py export WTR1_data/WTR1_50hz.parquet
+
+列类型固定: WT 数值列与气压计列 (FLOAT_COLUMNS) 为 float64，'null' 与空串记为空值；
+time 列按第一批确定为 int64 (16 位微秒时间戳) 或字符串；其余列为字符串 (Parquet 中
+字典编码)。每批行整体交给 pyarrow.csv 按列转换，值不符合列类型时报错而不是记为空值。
+原始表头 (含重复列名) 保存在文件元数据中，导出 CSV 时原样恢复。
+
+依赖 pyarrow (可选，仅在使用列式格式时需要)。
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+# 中间格式: csv / parquet / feather
+INTERMEDIATE_FORMAT = os.environ.get('BLE_INTERMEDIATE_FORMAT', 'csv').lower()
+
+COLUMNAR_SUFFIXES = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+# 每批写入的行数 (同时也是类型推断使用的行数)
+BATCH_ROWS = 65536
+
+HEADER_METADATA_KEY = b'ble.header'
+
+NULL_TOKENS = ('', 'null')
+
+TIME_COLUMN = 'time'
+
+# WT 上位机导出的数值列与 align_barometer 追加的气压计列 (float64，'null' 与空串为空值)
+FLOAT_COLUMNS = frozenset([
+    'AccX(g)', 'AccY(g)', 'AccZ(g)',
+    'AsX(°/s)', 'AsY(°/s)', 'AsZ(°/s)',
+    'AngleX(°)', 'AngleY(°)', 'AngleZ(°)',
+    'HX(uT)', 'HY(uT)', 'HZ(uT)',
+    'Q0()', 'Q1()', 'Q2()', 'Q3()',
+    'Temperature(°C)', 'Battery level(%)',
+    'TrajectoryX(m)', 'TrajectoryY(m)', 'TrajectoryZ(m)',
+    'SpeedX(m/s)', 'SpeedY(m/s)',
+    'seconds_elapsed', 'relativeAltitude', 'pressure',
+])
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("使用列式中间格式需要安装 pyarrow: pip install pyarrow")
+    return pyarrow
+
+def output_path(csv_path, fmt=None):
+    """根据中间格式，返回某个 CSV 路径对应的实际输出路径"""
+    fmt = (fmt or INTERMEDIATE_FORMAT).lower()
+    if fmt == 'csv':
+        return csv_path
+    if fmt not in COLUMNAR_SUFFIXES:
+        raise ValueError(f"未知的中间格式: {fmt}")
+    return os.path.splitext(csv_path)[0] + COLUMNAR_SUFFIXES[fmt]
+
+def is_columnar(path):
+    return os.path.splitext(str(path))[1].lower() in COLUMNAR_SUFFIXES.values()
+
+def resolve_input(csv_path):
+    """
+    返回某个 CSV 路径实际存在的中间文件
+
+    优先当前格式，其次 CSV，最后其他列式格式；都不存在时返回当前格式的路径。
+    """
+    candidates = [output_path(csv_path), csv_path]
+    candidates += [os.path.splitext(csv_path)[0] + suffix for suffix in COLUMNAR_SUFFIXES.values()]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return candidates[0]
+
+def _unique_names(header):
+    """列名去重 (与 pandas 相同: 'SpeedY' 第二次出现记为 'SpeedY.1')"""
+    seen = {}
+    names = []
+    for name in header:
+        if name in seen:
+            seen[name] += 1
+            names.append(f"{name}.{seen[name]}")
+        else:
+            seen[name] = 0
+            names.append(name)
+    return names
+
+def _rows_to_table(names, rows, types):
+    """把一批等长的字符串行按 types 转换为 Arrow 表"""
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return _parse_csv(names, text.getvalue(), types)
+
+def _parse_csv(names, text, types):
+    """不含表头的 CSV 文本按 types 转换为 Arrow 表 (pyarrow.csv 按列向量化解析)"""
+    pa = _require_pyarrow()
+    import pyarrow.csv as pcsv
+    try:
+        return pcsv.read_csv(
+            io.BytesIO(text.encode('utf-8')),
+            read_options=pcsv.ReadOptions(column_names=names),
+            parse_options=pcsv.ParseOptions(newlines_in_values=True),
+            convert_options=pcsv.ConvertOptions(column_types=dict(zip(names, types)),
+                                                null_values=list(NULL_TOKENS),
+                                                strings_can_be_null=False))
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"不符合列类型: {e}") from None
+
+def column_type(name):
+    """
+    已知列的固定类型: WT 数值列与气压计列为 float64 (可为空)，其余为字符串
+    (time 列不在此列，由 ColumnarWriter 按第一批确定)
+    """
+    pa = _require_pyarrow()
+    return pa.float64() if name in FLOAT_COLUMNS else pa.string()
+
+class ColumnarWriter:
+    """
+    逐行写入列式文件，接口与 csv.writer 的 writerow/writerows 一致
+
+    列类型固定 (column_type)，不逐值推断。行先由 csv.writer 写入内存中的文本，
+    每 batch_rows 行整批交给 pyarrow.csv 按类型转换为记录批次写出，内存占用与文件
+    大小无关。值不符合列类型时抛出 ValueError。
+    """
+
+    def __init__(self, path, header, fmt=None, batch_rows=BATCH_ROWS):
+        self.path = str(path)
+        self.header = list(header)
+        self.names = _unique_names(self.header)
+        self.fmt = fmt or ('feather' if self.path.endswith('.feather') else 'parquet')
+        self.batch_rows = batch_rows
+        self.pending = 0
+        self.row_count = 0
+        self._width = len(self.names)
+        self._text = io.StringIO()
+        self._csv = csv.writer(self._text)
+        self._schema = None
+        self._writer = None
+
+    def writerow(self, row):
+        if len(row) != self._width:
+            # 列式文件每行列数固定: 短行补空串，长行截断
+            row = (list(row) + [''] * self._width)[:self._width]
+        self._csv.writerow(row)
+        self.pending += 1
+        if self.pending >= self.batch_rows:
+            self._flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def _types(self, time_type):
+        return [time_type if name == TIME_COLUMN else column_type(name) for name in self.header]
+
+    def _open(self, types):
+        pa = _require_pyarrow()
+        metadata = {HEADER_METADATA_KEY: json.dumps(self.header, ensure_ascii=False).encode('utf-8')}
+        self._schema = pa.schema([pa.field(n, t) for n, t in zip(self.names, types)], metadata=metadata)
+
+        if self.fmt == 'feather':
+            options = pa.ipc.IpcWriteOptions(compression='zstd')
+            self._writer = pa.ipc.new_file(self.path, self._schema, options=options)
+        else:
+            import pyarrow.parquet as pq
+            floats = [n for n, t in zip(self.names, types) if pa.types.is_floating(t)]
+            strings = [n for n, t in zip(self.names, types) if pa.types.is_string(t)]
+            # 按列选择编码与压缩: 浮点列字节拆分 + zstd，整数列 zstd，字符串列字典编码
+            compression = {n: ('snappy' if n in strings else 'zstd') for n in self.names}
+            self._writer = pq.ParquetWriter(self.path, self._schema,
+                                            compression=compression,
+                                            use_dictionary=strings,
+                                            use_byte_stream_split=floats)
+
+    def _parse(self, types):
+        try:
+            return _parse_csv(self.names, self._text.getvalue(), types)
+        except ValueError as e:
+            raise ValueError(f"{self.path}: 第 {self.row_count + 1} 行起的一批数据{e}") from None
+
+    def _flush(self):
+        pa = _require_pyarrow()
+        if self._writer is None:
+            # time 列: 第一批全部是整数 (16 位微秒时间戳) 时为 int64，否则 (转换前的文本时间) 为字符串
+            time_type, table = pa.int64(), None
+            if self.pending:
+                try:
+                    table = self._parse(self._types(time_type))
+                except ValueError:
+                    time_type = pa.string()
+                    table = self._parse(self._types(time_type))
+            self._open(self._types(time_type))
+        elif self.pending:
+            table = self._parse(self._schema.types)
+        else:
+            table = None
+        if table is not None:
+            if self.fmt == 'feather':
+                for batch in table.to_batches():
+                    self._writer.write_batch(batch)
+            else:
+                self._writer.write_table(table)
+            self.row_count += self.pending
+        self.pending = 0
+        self._text.seek(0)
+        self._text.truncate()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _CsvRowWriter:
+    """与 ColumnarWriter 接口一致的 CSV 写入器"""
+
+    def __init__(self, path, header):
+        self.path = str(path)
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(header)
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def writerows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_row_writer(path, header):
+    """按扩展名打开行写入器 (CSV 或列式)"""
+    if is_columnar(path):
+        return ColumnarWriter(path, header)
+    return _CsvRowWriter(path, header)
+
+def _open_reader(path):
+    pa = _require_pyarrow()
+    if str(path).endswith('.feather'):
+        return pa.ipc.open_file(pa.memory_map(str(path), 'r'))
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(str(path))
+
+def _schema_of(reader):
+    return reader.schema_arrow if hasattr(reader, 'schema_arrow') else reader.schema
+
+def read_header(path):
+    """读取列式文件的原始表头"""
+    schema = _schema_of(_open_reader(path))
+    metadata = schema.metadata or {}
+    if HEADER_METADATA_KEY in metadata:
+        return json.loads(metadata[HEADER_METADATA_KEY].decode('utf-8'))
+    return schema.names
+
+def iter_batches(path, columns=None):
+    """按记录批次读取列式文件 (columns 使用去重后的列名)"""
+    reader = _open_reader(path)
+    if hasattr(reader, 'iter_batches'):
+        yield from reader.iter_batches(columns=columns)
+    else:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            yield batch.select(columns) if columns else batch
+
+def read_dataframe(path, columns=None):
+    """读取为 pandas DataFrame (列名为去重后的列名)"""
+    pa = _require_pyarrow()
+    batches = list(iter_batches(path, columns))
+    if not batches:
+        schema = _schema_of(_open_reader(path))
+        table = schema.empty_table()
+        if columns:
+            table = table.select(columns)
+    else:
+        table = pa.Table.from_batches(batches)
+    return table.to_pandas()
+
+def _table_rows(table):
+    """
+    记录批次 / 表转换为字符串行 (pyarrow.csv 整批格式化: 数值为最短的往返文本，空值为空串)
+
+    不逐值调用 to_pylist 再格式化，也不经 pyarrow.compute (导入较慢)。
+    """
+    import pyarrow.csv as pcsv
+    buf = io.BytesIO()
+    pcsv.write_csv(table, buf, pcsv.WriteOptions(include_header=False))
+    return csv.reader(io.StringIO(buf.getvalue().decode('utf-8'), newline=''))
+
+def normalize_value(value):
+    """
+    与原始 CSV 对比时的规范形式
+
+    列式文件按类型存储，数值的文本形式可能与原始 CSV 不同 ('1013.250' -> '1013.25',
+    浮点列中的 '100' -> '100'、'0.000' -> '0')。两边都按此规范化后再比较: 空值 -> ''，
+    数值 -> 最短文本 (整数值不带小数部分)，其余原样。
+    """
+    if value in NULL_TOKENS:
+        return ''
+    try:
+        return str(int(value))
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if number.is_integer() and abs(number) < 2 ** 53:
+        return str(int(number))
+    return repr(number)
+
+def normalize_row(row):
+    return [normalize_value(v) for v in row]
+
+def normalize_rows(header, rows, batch_rows=BATCH_ROWS):
+    """
+    把 CSV 行转换为列式文件读出的文本形式，可与 iter_rows 的输出直接比较
+
+    按 ColumnarWriter 的列类型整批经 Arrow 转换 (浮点列 '0.000' -> '0'、'null' -> '')，
+    time 与其余字符串列原样。列数与表头不同或含无法按列类型解析的值的行原样输出
+    (写入列式文件时这些行会被补齐或报错，比较时应视为不一致)。
+    """
+    pa = _require_pyarrow()
+    names = _unique_names(header)
+    types = [pa.string() if name == TIME_COLUMN else column_type(name) for name in header]
+    width = len(names)
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_rows))
+        if not batch:
+            return
+        regular = [row for row in batch if len(row) == width]
+        try:
+            table = _rows_to_table(names, regular, types) if regular else None
+        except ValueError:
+            table = None
+        if table is None:
+            yield from batch
+            continue
+        converted = _table_rows(table)
+        for row in batch:
+            yield next(converted) if len(row) == width else row
+
+def normalize_file(path, header, rows, delimiter=','):
+    """
+    normalize_rows 的整文件版本: 由 pyarrow.csv 直接流式解析文件 (跳过表头)，不经
+    Python 逐行读写。某个块无法按列类型解析 (列数不符、空行、坏值) 时，从该块起改用
+    normalize_rows 处理 rows。
+    :param rows: 同一文件尚未读取的数据行迭代器
+    """
+    pa = _require_pyarrow()
+    import pyarrow.csv as pcsv
+    names = _unique_names(header)
+    types = [pa.string() if name == TIME_COLUMN else column_type(name) for name in header]
+    done = 0
+    try:
+        reader = pcsv.open_csv(
+            path,
+            read_options=pcsv.ReadOptions(column_names=names, skip_rows=1),
+            parse_options=pcsv.ParseOptions(delimiter=delimiter, newlines_in_values=True,
+                                            ignore_empty_lines=False),
+            convert_options=pcsv.ConvertOptions(column_types=dict(zip(names, types)),
+                                                null_values=list(NULL_TOKENS),
+                                                strings_can_be_null=False))
+        for batch in reader:
+            yield from _table_rows(batch)
+            done += batch.num_rows
+    except pa.ArrowInvalid:
+        yield from normalize_rows(header, islice(rows, done, None))
+
+def iter_rows(path):
+    """逐行读取列式文件，产生与 csv.reader 相同形式的字符串列表"""
+    for batch in iter_batches(path):
+        yield from _table_rows(batch)
+
+def open_rows(path):
+    """
+    打开 CSV 或列式文件
+    :return: (表头, 数据行迭代器)
+    """
+    if is_columnar(path):
+        return read_header(path), iter_rows(path)
+
+    def _csv_rows():
+        with open(path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+    with open(path, 'r', encoding='utf-8') as f:
+        header = next(csv.reader(f), [])
+    return header, _csv_rows()
+
+def export_csv(path, csv_path=None):
+    """将列式文件导出为 CSV"""
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0] + '.csv'
+    header, rows = open_rows(path)
+    count = 0
+    with _CsvRowWriter(csv_path, header) as writer:
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    print(f"✓ 已导出 {count} 行: {csv_path}")
+    return csv_path
+
+def convert_csv(csv_path, fmt='parquet'):
+    """将 CSV 文件转换为列式文件"""
+    target = output_path(csv_path, fmt)
+    header, rows = open_rows(csv_path)
+    with ColumnarWriter(target, header, fmt) as writer:
+        writer.writerows(rows)
+    print(f"✓ 已转换 {writer.row_count} 行: {target}")
+    return target
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='列式中间格式工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_export = sub.add_parser('export', help='列式文件导出为 CSV')
+    p_export.add_argument('path')
+    p_export.add_argument('-o', '--output', help='输出 CSV 路径')
+
+    p_convert = sub.add_parser('convert', help='CSV 转换为列式文件')
+    p_convert.add_argument('path')
+    p_convert.add_argument('--format', choices=sorted(COLUMNAR_SUFFIXES), default='parquet')
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_csv(args.path, args.output)
+    else:
+        convert_csv(args.path, args.format)
+
+if __name__ == '__main__':
+    main()
@@ -1,61 +1,41 @@
 import pandas as pd
-import numpy as np
+
+import dataset_stats
 
 FILE_ORIG = 'WTB1_data/WTB1.csv'
 FILE_CONV = 'converted_WTB1_format.csv'
 
-def clean_numeric(df, col):
-    """Convers 'null' strings to NaN and numericizes."""
-    if col in df.columns:
-        # Force coerce to numeric, 'null' becomes NaN
-        return pd.to_numeric(df[col], errors='coerce')
-    return pd.Series([np.nan] * len(df))
+# Sensor columns summarised in the report
+NUMERIC_COLS = ['AccX(g)', 'AsX(°/s)', 'HX(uT)', 'Temperature(°C)', 'pressure']
 
-def get_stats(df, label):
+def stats_from_summary(result, label):
+    """Build one report column from dataset_stats streaming results."""
     stats = {}
     stats['Source'] = label
-    stats['Rows'] = len(df)
-    
-    # Time analysis
-    if 'time' in df.columns:
-        t = pd.to_numeric(df['time'], errors='coerce')
-        t = t.dropna().sort_values()
-        if len(t) > 1:
-            duration_us = t.iloc[-1] - t.iloc[0]
-            stats['Duration(s)'] = duration_us / 1_000_000.0
-            
-            # Estimate Hz
-            # diffs = t.diff().dropna()
-            # mean_diff_us = diffs.mean()
-            # if mean_diff_us > 0:
-            #    stats['Est. Freq(Hz)'] = 1_000_000.0 / mean_diff_us
-            stats['Est. Freq(Hz)'] = len(t) / (duration_us / 1_000_000.0)
-        else:
-            stats['Duration(s)'] = 0
-            stats['Est. Freq(Hz)'] = 0
-            
-    # Sensor Stats (Mean/Max/Min for AccX to see range)
-    numeric_cols = ['AccX(g)', 'AsX(°/s)', 'HX(uT)', 'Temperature(°C)', 'pressure']
-    
-    for col in numeric_cols:
-        series = clean_numeric(df, col)
-        stats[f'{col}_Mean'] = series.mean()
-        stats[f'{col}_Min'] = series.min()
-        stats[f'{col}_Max'] = series.max()
-        stats[f'{col}_Std'] = series.std()
-        stats[f'{col}_NullCount'] = series.isna().sum()
+    stats['Rows'] = result['rows']
+
+    t = result['columns']['time']
+    if t.count > 1:
+        duration_us = t.max - t.min
+        stats['Duration(s)'] = duration_us / 1_000_000.0
+        stats['Est. Freq(Hz)'] = t.count / (duration_us / 1_000_000.0)
+    else:
+        stats['Duration(s)'] = 0
+        stats['Est. Freq(Hz)'] = 0
+
+    for col in NUMERIC_COLS:
+        summary = result['columns'][col].summary()
+        for metric in ('Mean', 'Min', 'Max', 'Std', 'P50', 'P99', 'NullCount'):
+            stats[f'{col}_{metric}'] = summary[metric]
 
     return stats
 
 def main():
-    print("Loading datasets...")
-    # Read csv, all as string initially to handle 'null' literal
-    df_orig = pd.read_csv(FILE_ORIG, dtype=str)
-    df_conv = pd.read_csv(FILE_CONV, dtype=str)
-    
-    print("Calculating statistics...")
-    stats_orig = get_stats(df_orig, "Original (WTB1.csv)")
-    stats_conv = get_stats(df_conv, "Converted (App Data)")
+    print("Calculating statistics (chunked, typed columns)...")
+    # Only the needed columns are parsed, each dataset in its own process
+    results = dataset_stats.compare([FILE_ORIG, FILE_CONV], ['time'] + NUMERIC_COLS)
+    stats_orig = stats_from_summary(results[0], "Original (WTB1.csv)")
+    stats_conv = stats_from_summary(results[1], "Converted (App Data)")
     
     # Print comparison table
     df_res = pd.DataFrame([stats_orig, stats_conv])
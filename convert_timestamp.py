@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 """
-将三个设备CSV文件中的时间列转换为13位毫秒级时间戳
-时间格式: "2025-10-30 18:33:55.98" -> 1730281235980
+将三个设备CSV文件中的时间列转换为16位微秒级时间戳
+时间格式: "2025-10-30 18:33:55.98" -> 1761820435980000 (Asia/Shanghai)
 """
 import csv
 import os
-from datetime import datetime
+import re
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+import columnar
+import metrics
+import stage_log
 
 # 设备文件列表
 DEVICE_FILES = [
@@ -14,6 +24,18 @@ DEVICE_FILES = [
     'WTB1_data/WTB1.csv'
 ]
 
+# 原始时间字符串所在的时区 (显式指定，不依赖运行环境的本地时区)
+SOURCE_TIMEZONE = 'Asia/Shanghai'
+
+# 每批转换的行数
+CHUNK_ROWS = 100000
+
+_EPOCH = datetime(1970, 1, 1)
+
+# NumPy datetime64 也接受 "2025"、"2025-10-30T18:33" 等其他写法 (纯数字会被当作年份),
+# 只有完全符合该格式的前缀才交给 NumPy 批量解析
+_PREFIX_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+
 def parse_time_to_timestamp(time_str):
     """
     将时间字符串转换为16位微秒级时间戳
@@ -85,15 +107,175 @@ def convert_file(filepath):
     
     return True
 
+def _resolve_seconds(prefixes, tz, cache):
+    """
+    将 "YYYY-mm-dd HH:MM:SS" 前缀批量转换为 UTC 秒, 结果写入 cache
+
+    连续的行大多落在同一秒内, 因此只需解析去重后的新前缀;
+    格式规整的前缀整列交给 NumPy datetime64 解析, 其余 (或 NumPy 解析失败时)
+    逐个回退到 strptime。无法解析的前缀在 cache 中记为 None。
+    """
+    missing = [p for p in set(prefixes) if p not in cache]
+    if not missing:
+        return
+
+    import numpy as np
+
+    shaped = [p for p in missing if _PREFIX_PATTERN.fullmatch(p)]
+    others = [p for p in missing if not _PREFIX_PATTERN.fullmatch(p)]
+    try:
+        wall_seconds = np.array(shaped, dtype='datetime64[s]').astype(np.int64).tolist()
+    except ValueError:
+        others += shaped
+        shaped, wall_seconds = [], []
+    missing = shaped + others
+    for prefix in others:
+        try:
+            dt = datetime.strptime(prefix, '%Y-%m-%d %H:%M:%S')
+            wall_seconds.append(int((dt - _EPOCH).total_seconds()))
+        except ValueError:
+            wall_seconds.append(None)
+
+    for prefix, wall in zip(missing, wall_seconds):
+        if wall is None:
+            cache[prefix] = None
+            continue
+        # 按墙上时间查询该时刻的 UTC 偏移 (正确处理夏令时)
+        offset = tz.utcoffset(_EPOCH + timedelta(seconds=wall))
+        cache[prefix] = wall - int(offset.total_seconds())
+
+def convert_times(time_strs, tz, cache):
+    """
+    批量将时间字符串转换为16位微秒级时间戳字符串
+
+    :param time_strs: 时间字符串列表, 格式同 parse_time_to_timestamp
+    :param tz: ZoneInfo, 时间字符串所在时区
+    :param cache: 前缀 -> UTC 秒 的缓存字典 (跨批次复用)
+    :return: (转换后的字符串列表, 解析失败的下标列表)
+    """
+    import numpy as np
+
+    prefixes = []
+    fracs = []
+    for time_str in time_strs:
+        main_part, sep, frac_part = time_str.rpartition('.')
+        if sep:
+            prefixes.append(main_part)
+            fracs.append(frac_part)
+        else:
+            prefixes.append(time_str)
+            fracs.append('')
+
+    _resolve_seconds(prefixes, tz, cache)
+
+    # 补齐微秒到6位 (超出部分截断)
+    frac_arr = np.char.ljust(np.array(fracs, dtype='U6'), 6, '0')
+    frac_ok = np.char.isdigit(frac_arr)
+    frac_us = np.where(frac_ok, frac_arr, '0').astype(np.int64)
+
+    seconds = np.array([cache[p] if cache[p] is not None else -1 for p in prefixes], dtype=np.int64)
+    ok = frac_ok & np.array([cache[p] is not None for p in prefixes], dtype=bool)
+
+    result = (seconds * 1000000 + frac_us).astype(str).tolist()
+    failed = np.flatnonzero(~ok).tolist()
+    for i in failed:
+        result[i] = time_strs[i]  # 返回原值
+
+    return result, failed
+
+@metrics.timed('convert_timestamp')
+def convert_file_fast(filepath, tz_name=SOURCE_TIMEZONE, chunk_rows=CHUNK_ROWS):
+    """
+    转换单个文件的时间列 (批量 + 流式版本)
+
+    按 chunk_rows 行一批整列转换, 结果流式写入同目录临时文件,
+    全部完成后原子替换原文件, 内存占用与文件大小无关。
+    filepath 按 columnar.resolve_input 解析, 列式文件转换后仍写为同格式。
+    """
+    filepath = columnar.resolve_input(filepath)
+    print(f"\n处理文件: {filepath}")
+    
+    if not os.path.exists(filepath):
+        print(f"  ✗ 文件不存在!")
+        return False
+    
+    tz = ZoneInfo(tz_name)
+    cache = {}
+    row_count = 0
+    failed_count = 0
+    first_value = None
+    log = stage_log.StageLog('convert_timestamp', file=filepath)
+    
+    # 临时文件保留原扩展名, open_row_writer 据此选择 CSV 或列式写入器
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filepath)),
+                                    suffix='.tmp' + os.path.splitext(filepath)[1])
+    os.close(fd)
+    try:
+        header, reader = columnar.open_rows(filepath)
+        with columnar.open_row_writer(tmp_path, header) as writer:
+            
+            def flush(rows):
+                nonlocal failed_count, first_value
+                with metrics.step('parse'):
+                    # 保留在 rows 中的下标: 空行不参与转换，但错误行号要按原始行计算
+                    targets = [(k, row) for k, row in enumerate(rows) if row]
+                    converted, failed = convert_times([row[0] for _, row in targets], tz, cache)
+                    for (_, row), value in zip(targets, converted):
+                        row[0] = value
+                for i in failed:
+                    k, row = targets[i]
+                    log.error('时间解析失败', f"行 {row_count - len(rows) + k + 2}", row[0])
+                failed_count += len(failed)
+                if first_value is None and targets:
+                    first_value = targets[0][1][0]
+                with metrics.step('write'):
+                    writer.writerows(rows)
+            
+            while True:
+                with metrics.step('read'):
+                    rows = list(islice(reader, chunk_rows))
+                if not rows:
+                    break
+                row_count += len(rows)
+                flush(rows)
+                log.progress(row_count)
+        
+        # mkstemp 创建的文件权限为 0600，替换前沿用原文件的权限
+        shutil.copymode(filepath, tmp_path)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    print(f"  ✓ 完成! 共转换 {row_count} 行数据 (时区: {tz_name})")
+    metrics.count('rows', row_count)
+    metrics.count('failed', failed_count)
+    metrics.count_file('bytes_written', filepath)
+    if failed_count:
+        print(f"  ⚠️ {failed_count} 行时间解析失败, 已保留原值")
+    log.finish(rows=row_count, failed=failed_count)
+    
+    # 显示转换示例
+    if first_value is not None:
+        print(f"  示例: {first_value} (第一行数据的时间戳)")
+    
+    return True
+
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='将设备 CSV 的时间列转换为16位微秒时间戳')
+    parser.add_argument('--tz', default=SOURCE_TIMEZONE,
+                        help=f'原始时间所在时区 (IANA 名称, 默认 {SOURCE_TIMEZONE})')
+    args = parser.parse_args()
+
     print("=" * 60)
-    print("时间格式转换 - 转为13位毫秒时间戳")
+    print("时间格式转换 - 转为16位微秒时间戳")
     print("=" * 60)
     
     success_count = 0
     
     for filepath in DEVICE_FILES:
-        if convert_file(filepath):
+        if convert_file_fast(filepath, args.tz):
             success_count += 1
     
     print("\n" + "=" * 60)
@@ -103,4 +285,4 @@ def main():
     return success_count == len(DEVICE_FILES)
 
 if __name__ == '__main__':
-    main()
+    sys.exit(0 if main() else 1)
@@ -3,17 +3,25 @@
 将 data.txt (Tab分隔) 转换为 CSV 格式
 """
 import csv
+import io
+
+import metrics
 
 INPUT_FILE = 'data.txt'
 OUTPUT_FILE = 'data.csv'
 
+# 快速转换每次读取的块大小
+BLOCK_SIZE = 8 * 1024 * 1024
+
+_TAB_TO_COMMA = bytes.maketrans(b'\t', b',')
+
 def convert_txt_to_csv():
     """将 Tab 分隔的 txt 文件转换为 CSV"""
     with open(INPUT_FILE, 'r', encoding='utf-8') as infile:
         with open(OUTPUT_FILE, 'w', encoding='utf-8', newline='') as outfile:
             reader = csv.reader(infile, delimiter='\t')
             writer = csv.writer(outfile)
-            
+
             line_count = 0
             for row in reader:
                 # 移除每行末尾可能的 \r
@@ -21,14 +29,125 @@ def convert_txt_to_csv():
                     row[-1] = row[-1].rstrip('\r')
                 writer.writerow(row)
                 line_count += 1
-                
+
                 # 每10万行打印进度
                 if line_count % 100000 == 0:
                     print(f"已处理 {line_count} 行...")
-    
+
     print(f"转换完成！共处理 {line_count} 行")
     print(f"输出文件: {OUTPUT_FILE}")
     return line_count
 
+def _convert_line_csv(line):
+    """用 csv 模块转换单行 (bytes, 不含换行符)，与 convert_txt_to_csv 输出一致"""
+    row = next(csv.reader([line.decode('utf-8')], delimiter='\t'), [])
+    buf = io.StringIO()
+    csv.writer(buf).writerow(row)
+    return buf.getvalue().encode('utf-8')
+
+def _convert_block(block):
+    """
+    转换一个以完整行结尾的数据块
+
+    :return: 转换后的 bytes; 块中含引号或孤立 \\r 时返回 None (需要回退到 csv 流式解析)
+    """
+    if b'"' in block:
+        return None
+
+    # 行尾统一为 \n，与文本模式的换行转换一致
+    block = block.replace(b'\r\n', b'\n')
+    if b'\r' in block:
+        return None
+    if b',' not in block:
+        # 没有任何字段需要转义: 直接把 Tab 换成逗号
+        return block.translate(_TAB_TO_COMMA).replace(b'\n', b'\r\n')
+
+    # 只对需要转义的行使用 csv 模块
+    out = []
+    for line in block.split(b'\n')[:-1]:
+        if b',' in line:
+            out.append(_convert_line_csv(line))
+        else:
+            out.append(line.translate(_TAB_TO_COMMA) + b'\r\n')
+    return b''.join(out)
+
+@metrics.timed('convert_to_csv')
+def convert_txt_to_csv_fast(input_file=INPUT_FILE, output_file=OUTPUT_FILE, block_size=BLOCK_SIZE):
+    """
+    按二进制大块将 Tab 分隔的 txt 转换为 CSV，输出与 convert_txt_to_csv 逐字节一致
+
+    每个块单独决定处理方式: 无需转义时直接替换分隔符; 含逗号的行单独交给
+    csv 模块; 一旦遇到引号 (可能跨行) 或孤立的 \\r，从该块起回退到 csv 流式转换。
+    """
+    line_count = 0
+    offset = 0
+
+    with open(input_file, 'rb') as infile, open(output_file, 'wb') as outfile:
+        pending = b''
+        while True:
+            data = infile.read(block_size)
+            if not data:
+                if not pending:
+                    break
+                # 最后一行没有换行符
+                block, pending = pending + b'\n', b''
+            else:
+                data = pending + data
+                cut = data.rfind(b'\n') + 1
+                if cut == 0:
+                    pending = data
+                    continue
+                block, pending = data[:cut], data[cut:]
+
+            converted = _convert_block(block)
+            if converted is None:
+                # 回退: 从当前块的起始位置开始用 csv 模块转换剩余内容
+                outfile.flush()
+                line_count += _convert_stream_from(input_file, offset, outfile)
+                break
+
+            outfile.write(converted)
+            line_count += block.count(b'\n')
+            offset += len(block)
+            print(f"已处理 {line_count} 行...")
+
+    print(f"转换完成！共处理 {line_count} 行")
+    print(f"输出文件: {output_file}")
+    metrics.count('rows', line_count)
+    metrics.count_file('bytes_read', input_file)
+    metrics.count_file('bytes_written', output_file)
+    return line_count
+
+def _convert_stream_from(input_file, offset, outfile):
+    """从 input_file 的字节偏移 offset 开始，用 csv 模块转换并写入 outfile"""
+    with open(input_file, 'rb') as raw:
+        raw.seek(offset)
+        text = io.TextIOWrapper(raw, encoding='utf-8')
+        out_text = io.TextIOWrapper(outfile, encoding='utf-8', newline='')
+        reader = csv.reader(text, delimiter='\t')
+        writer = csv.writer(out_text)
+
+        line_count = 0
+        for row in reader:
+            if row and row[-1].endswith('\r'):
+                row[-1] = row[-1].rstrip('\r')
+            writer.writerow(row)
+            line_count += 1
+        out_text.flush()
+        out_text.detach()
+    return line_count
+
+def iter_txt_rows(input_file=INPUT_FILE):
+    """
+    直接逐行读取 Tab 分隔的 txt，产生与读取转换后 CSV 相同的行
+
+    供拆分等后续步骤直接使用，无需生成中间文件 data.csv。
+    """
+    with open(input_file, 'r', encoding='utf-8') as infile:
+        for row in csv.reader(infile, delimiter='\t'):
+            if row and row[-1].endswith('\r'):
+                row[-1] = row[-1].rstrip('\r')
+            yield row
+
 if __name__ == '__main__':
-    convert_txt_to_csv()
+    convert_txt_to_csv_fast()
@@ -4,9 +4,17 @@
 协议格式: Header(2) + Cmd(1) + Len(1) + Payload(74) + CRC(2) = 80 Bytes
 """
 import csv
+import io
 import struct
 import os
 import glob
+from itertools import islice
+
+import bin_index
+import columnar
+import metrics
+import stage_log
+import stages
 
 # 配置
 FILES_TO_PROCESS = [
@@ -22,6 +30,9 @@ CMD_TYPE = 0x01
 PAYLOAD_LEN = 74  # 0x4A
 FRAME_LEN = 80
 
+# 每批读取 / 编码 / 写入的行数
+BATCH_ROWS = 10000
+
 # CRC16-MODBUS 表 (也可实时计算，查表更快)
 CRC16_TABLE = [
     0x0000, 0xC0C1, 0xC181, 0x0140, 0xC301, 0x03C0, 0x0280, 0xC241,
@@ -78,131 +89,421 @@ def safe_int(val, default=0):
     except (ValueError, TypeError):
         return default
 
-def process_single_file(csv_path):
-    """处理单个 CSV 文件并生成 .bin"""
+def iter_records(csv_path):
+    """逐行读取 CSV 或列式中间文件，产生 {列名: 值} 字典"""
+    if columnar.is_columnar(csv_path):
+        # 列式文件按批次直接读取已带类型的列
+        for batch in columnar.iter_batches(csv_path):
+            yield from batch.to_pylist()
+        return
+
+    with open(csv_path, 'r', encoding='utf-8') as f_csv:
+        yield from csv.DictReader(f_csv)
+
+# 预先构建 Header (前4字节)
+# B: uchar (1 byte), B: uchar, B: uchar, B: uchar
+HEADER_BYTES = struct.pack('<BBBB', HEADER0, HEADER1, CMD_TYPE, PAYLOAD_LEN)
+
+# Python struct 格式化字符:
+# <: Little Endian
+# Q: uint64 (8)
+# i: int32 (4)
+# h: int16 (2)
+PAYLOAD_FMT = '<Q iii iii iii iii iii i h'
+
+G_TO_MS2 = 9.80665
+
+def row_values(row):
+    """
+    把一行 {列名: 值} 转换为协议中的整数值
+    :return: (时间戳, Payload 中时间戳之后的 17 个整数，顺序与 PAYLOAD_FMT 一致)
+    """
+    # 提取並转换数据 (根据 Payload 定义)
+    
+    # Timestamp (8 bytes, uint64)
+    ts = safe_int(row.get('time'), 0)
+    
+    # Acc (4 bytes each, int32) - 原始单位 g, 需转 m/s^2 (* 9.80665) 再 * 1000
+    acc_x = int(safe_float(row.get('AccX(g)')) * G_TO_MS2 * 1000)
+    acc_y = int(safe_float(row.get('AccY(g)')) * G_TO_MS2 * 1000)
+    acc_z = int(safe_float(row.get('AccZ(g)')) * G_TO_MS2 * 1000)
+    
+    # Gyro (4 bytes each, int32) - 原始单位 deg/s, * 1000
+    gyro_x = int(safe_float(row.get('AsX(°/s)')) * 1000)
+    gyro_y = int(safe_float(row.get('AsY(°/s)')) * 1000)
+    gyro_z = int(safe_float(row.get('AsZ(°/s)')) * 1000)
+    
+    # Mag (4 bytes each, int32) - 原始单位 uT, * 100
+    mag_x = int(safe_float(row.get('HX(uT)')) * 100)
+    mag_y = int(safe_float(row.get('HY(uT)')) * 100)
+    mag_z = int(safe_float(row.get('HZ(uT)')) * 100)
+    
+    # Euler (4 bytes each, int32) - 原始单位 deg, * 10000
+    roll = int(safe_float(row.get('AngleX(°)')) * 10000)
+    pitch = int(safe_float(row.get('AngleY(°)')) * 10000)
+    yaw = int(safe_float(row.get('AngleZ(°)')) * 10000)
+    
+    # GPS (4 bytes each, int32) - 暂无数据，填 0
+    gps_lat = 0
+    gps_lon = 0
+    gps_speed = 0
+    
+    # Pressure (4 bytes, int32) - 原始单位 hPa (mbar), * 100
+    # 注意: align_barometer.py 添加的列名为 'pressure'
+    pressure = int(safe_float(row.get('pressure', 0)) * 100)
+    
+    # Temp (2 bytes, int16) - 原始单位 C, * 100
+    temp = int(safe_float(row.get('Temperature(°C)')) * 100)
+    
+    return ts, (
+        acc_x, acc_y, acc_z,
+        gyro_x, gyro_y, gyro_z,
+        mag_x, mag_y, mag_z,
+        roll, pitch, yaw,
+        gps_lat, gps_lon, gps_speed,
+        pressure,
+        temp
+    )
+
+def encode_row(row):
+    """把一行 {列名: 值} 编码为一帧 (Header + Payload + CRC, 80 字节)"""
+    # 1. 提取並转换数据
+    ts, values = row_values(row)
+    
+    # 2. 打包 Payload
+    payload_data = struct.pack(PAYLOAD_FMT, ts, *values)
+    
+    # 3. 计算 CRC (Range: Cmd + Len + Payload)
+    #Exclude Header0 (0x55) and Header1 (0xAA) from CRC
+    data_to_checksum = HEADER_BYTES[2:] + payload_data
+    crc = calculate_crc16(data_to_checksum)
+    crc_bytes = struct.pack('<H', crc) # H: uint16
+    
+    # 4. 全帧: Header + Payload + CRC
+    return HEADER_BYTES + payload_data + crc_bytes
+
+def _read_last_frame(bin_path):
+    """
+    检查已有 bin 文件的末尾
+    :return: (完整帧数, 最后一帧) ；没有完整帧或最后一帧损坏时返回 None
+    """
+    size = os.path.getsize(bin_path)
+    frames = size // FRAME_LEN
+    if frames == 0:
+        return None
+    with open(bin_path, 'rb') as f:
+        f.seek((frames - 1) * FRAME_LEN)
+        frame = f.read(FRAME_LEN)
+    if frame[:4] != HEADER_BYTES:
+        return None
+    if calculate_crc16(frame[2:78]) != struct.unpack_from('<H', frame, 78)[0]:
+        return None
+    return frames, frame
+
+def _line_from(f, pos, data_start):
+    """返回 pos 处或之后第一个完整行的 (起始偏移, 内容)"""
+    if pos <= data_start:
+        f.seek(data_start)
+    else:
+        f.seek(pos - 1)
+        f.readline()
+    start = f.tell()
+    return start, f.readline()
+
+def _line_time(line, time_idx):
+    fields = next(csv.reader([line.decode('utf-8')]), [])
+    return safe_int(fields[time_idx] if time_idx < len(fields) else None, 0)
+
+def _search_csv(f, data_start, size, time_idx, ts, strict):
+    """二分查找第一个 time > ts (strict) 或 time >= ts 的行，返回其字节偏移"""
+    lo, hi = data_start, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, line = _line_from(f, mid, data_start)
+        if not line:
+            hi = mid
+            continue
+        t = _line_time(line, time_idx)
+        if t > ts or (not strict and t == ts):
+            hi = mid
+        else:
+            lo = mid + 1
+    return _line_from(f, lo, data_start)[0]
+
+def _resume_csv(csv_path, last_ts):
+    """
+    在 CSV 中定位续写位置 (要求时间列非递减)
+    :return: (最后一条已编码的行, 之后各行的迭代器, 剩余字节数)；找不到时返回 None
+    """
+    with open(csv_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]), [])
+        if 'time' not in header:
+            return None
+        time_idx = header.index('time')
+        data_start = f.tell()
+        size = os.path.getsize(csv_path)
+
+        first = _search_csv(f, data_start, size, time_idx, last_ts, strict=False)
+        resume = _search_csv(f, data_start, size, time_idx, last_ts, strict=True)
+        f.seek(first)
+        lines = f.read(resume - first).splitlines()
+    if not lines:
+        return None
+    last_row = dict(zip(header, next(csv.reader([lines[-1].decode('utf-8')]))))
+
+    def rows():
+        # 开始迭代时才重新打开文件: 调用方放弃续写 (不迭代) 时不会留下打开的句柄
+        with open(csv_path, 'rb') as f:
+            f.seek(resume)
+            text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            yield from csv.DictReader(text, fieldnames=header)
+
+    return last_row, rows(), size - resume
+
+def _resume_columnar(path, last_ts):
+    """在列式文件中定位续写位置 (按时间列 searchsorted)"""
+    import numpy as np
+    if 'time' not in columnar._unique_names(columnar.read_header(path)):
+        return None
+    times = [batch.column(0).to_numpy(zero_copy_only=False)
+             for batch in columnar.iter_batches(path, ['time'])]
+    times = np.concatenate(times).astype(np.int64) if times else np.zeros(0, dtype=np.int64)
+    first = int(np.searchsorted(times, last_ts, side='left'))
+    resume = int(np.searchsorted(times, last_ts, side='right'))
+    if resume == first:
+        return None
+
+    def rows(start):
+        for batch in columnar.iter_batches(path):
+            if start >= batch.num_rows:
+                start -= batch.num_rows
+                continue
+            yield from batch.slice(start).to_pylist()
+            start = 0
+
+    records = rows(resume - 1)
+    last_row = next(records)
+    return last_row, records, None
+
+def find_resume_point(csv_path, bin_path):
+    """
+    追加模式: 根据已有 bin 的最后一帧，在源文件中找到续写位置
+
+    先检查 bin 末尾帧的帧头与 CRC，再按其时间戳二分查找源文件，并确认对应行
+    重新编码后与最后一帧完全一致。
+    :return: (已有帧数, 新行迭代器, 剩余字节数或 None)；无法续写时返回 None
+    """
+    tail = _read_last_frame(bin_path)
+    if tail is None:
+        print(f"  ⚠️ 已有 bin 文件为空或最后一帧损坏，重新生成")
+        return None
+    frames, last_frame = tail
+    last_ts = struct.unpack_from('<Q', last_frame, 4)[0]
+
+    if columnar.is_columnar(csv_path):
+        found = _resume_columnar(csv_path, last_ts)
+    else:
+        found = _resume_csv(csv_path, last_ts)
+    if found is None:
+        print(f"  ⚠️ 源文件中找不到最后一帧的时间戳 {last_ts}，重新生成")
+        return None
+    last_row, records, remaining = found
+    if encode_row(last_row) != last_frame:
+        records.close()
+        print(f"  ⚠️ 源文件中时间戳 {last_ts} 的行与最后一帧不一致，重新生成")
+        return None
+    print(f"  续写: 已有 {frames} 帧，最后时间戳 {last_ts}")
+    return frames, records, remaining
+
+def process_single_file(csv_path, append=False, bin_path=None):
+    """
+    处理单个 CSV 文件并生成 .bin
+    :param append: 追加模式，只编码已有 bin 最后一帧之后的新行
+    :param bin_path: 输出路径 (默认与输入同名的 .bin)
+    :return: stages.StageResult
+    """
+    with stages.measure('csv_to_bin', file=csv_path) as result:
+        _encode(csv_path, append, bin_path or os.path.splitext(csv_path)[0] + '.bin', result)
+    return result
+
+def _encode(csv_path, append, bin_path, result):
     if not os.path.exists(csv_path):
         print(f"✗ 找不到文件: {csv_path}")
-        return False
+        result.fail(f"找不到文件: {csv_path}")
+        return
 
-    bin_path = os.path.splitext(csv_path)[0] + '.bin'
     print(f"➜ 正在处理: {csv_path}")
     print(f"  目标输出: {bin_path}")
 
     frame_count = 0
+    existing_frames = 0
+    bytes_read = os.path.getsize(csv_path)
+    log = stage_log.StageLog('csv_to_bin', file=csv_path)
     
-    with open(csv_path, 'r', encoding='utf-8') as f_csv, open(bin_path, 'wb') as f_bin:
-        reader = csv.DictReader(f_csv)
-        
-        # 预先构建 Header (前4字节)
-        # B: uchar (1 byte), B: uchar, B: uchar, B: uchar
-        header_bytes = struct.pack('<BBBB', HEADER0, HEADER1, CMD_TYPE, PAYLOAD_LEN)
-        
-        for row in reader:
-            try:
-                # 1. 提取並转换数据 (根据 Payload 定义)
-                
-                # Timestamp (8 bytes, uint64)
-                ts = safe_int(row.get('time'), 0)
-                
-                # Acc (4 bytes each, int32) - 原始单位 g, 需转 m/s^2 (* 9.80665) 再 * 1000
-                G_TO_MS2 = 9.80665
-                acc_x = int(safe_float(row.get('AccX(g)')) * G_TO_MS2 * 1000)
-                acc_y = int(safe_float(row.get('AccY(g)')) * G_TO_MS2 * 1000)
-                acc_z = int(safe_float(row.get('AccZ(g)')) * G_TO_MS2 * 1000)
-                
-                # Gyro (4 bytes each, int32) - 原始单位 deg/s, * 1000
-                gyro_x = int(safe_float(row.get('AsX(°/s)')) * 1000)
-                gyro_y = int(safe_float(row.get('AsY(°/s)')) * 1000)
-                gyro_z = int(safe_float(row.get('AsZ(°/s)')) * 1000)
-                
-                # Mag (4 bytes each, int32) - 原始单位 uT, * 100
-                mag_x = int(safe_float(row.get('HX(uT)')) * 100)
-                mag_y = int(safe_float(row.get('HY(uT)')) * 100)
-                mag_z = int(safe_float(row.get('HZ(uT)')) * 100)
-                
-                # Euler (4 bytes each, int32) - 原始单位 deg, * 10000
-                roll = int(safe_float(row.get('AngleX(°)')) * 10000)
-                pitch = int(safe_float(row.get('AngleY(°)')) * 10000)
-                yaw = int(safe_float(row.get('AngleZ(°)')) * 10000)
-                
-                # GPS (4 bytes each, int32) - 暂无数据，填 0
-                gps_lat = 0
-                gps_lon = 0
-                gps_speed = 0
-                
-                # Pressure (4 bytes, int32) - 原始单位 hPa (mbar), * 100
-                # 注意: align_barometer.py 添加的列名为 'pressure'
-                pressure = int(safe_float(row.get('pressure', 0)) * 100)
-                
-                # Temp (2 bytes, int16) - 原始单位 C, * 100
-                temp = int(safe_float(row.get('Temperature(°C)')) * 100)
-                
-                # 2. 打包 Payload
-                # Python struct 格式化字符:
-                # <: Little Endian
-                # Q: uint64 (8)
-                # i: int32 (4)
-                # h: int16 (2)
-                
-                payload_fmt = '<Q iii iii iii iii iii i h'
-                payload_data = struct.pack(
-                    payload_fmt,
-                    ts,
-                    acc_x, acc_y, acc_z,
-                    gyro_x, gyro_y, gyro_z,
-                    mag_x, mag_y, mag_z,
-                    roll, pitch, yaw,
-                    gps_lat, gps_lon, gps_speed,
-                    pressure,
-                    temp
-                )
-                
-                if len(payload_data) != PAYLOAD_LEN:
-                    print(f"⚠️ Payload 长度错误: {len(payload_data)}, 预期 {PAYLOAD_LEN}")
-                    return False
-
-                # 3. 计算 CRC (Range: Cmd + Len + Payload)
-                #Exclude Header0 (0x55) and Header1 (0xAA) from CRC
-                data_to_checksum = header_bytes[2:] + payload_data
-                crc = calculate_crc16(data_to_checksum)
-                crc_bytes = struct.pack('<H', crc) # H: uint16
-                
-                # 4. 写入文件 (全帧: Header + Payload + CRC)
-                full_frame = header_bytes + payload_data + crc_bytes
-                f_bin.write(full_frame)
-                
-                frame_count += 1
-                
-            except Exception as e:
-                print(f"⚠️ 处理行 {frame_count+1} 时出错: {e}")
-                continue
+    resume = find_resume_point(csv_path, bin_path) if append and os.path.exists(bin_path) else None
+    # 追加前读取索引 (之后文件的大小和修改时间会变化)
+    old_index = bin_index.load_index(bin_path) if resume is not None else None
+    if resume is not None:
+        existing_frames, reader, remaining = resume
+        if remaining is not None:
+            bytes_read = remaining
+        # 去掉上次中断时写了一半的帧
+        with open(bin_path, 'r+b') as f_bin:
+            f_bin.truncate(existing_frames * FRAME_LEN)
+        mode = 'ab'
+    else:
+        reader = iter_records(csv_path)
+        mode = 'wb'
+    
+    with open(bin_path, mode) as f_bin:
+        while True:
+            with metrics.step('read'):
+                batch = list(islice(reader, BATCH_ROWS))
+            if not batch:
+                break
+            
+            frames = []
+            with metrics.step('parse'):
+                for row in batch:
+                    try:
+                        frames.append(encode_row(row))
+                    except Exception as e:
+                        line = existing_frames + frame_count + len(frames) + log.error_count + 1
+                        log.error(type(e).__name__, f"行 {line}", e)
+            
+            with metrics.step('write'):
+                f_bin.write(b''.join(frames))
+            frame_count += len(frames)
+            log.progress(frame_count)
 
     file_size = os.path.getsize(bin_path)
-    print(f"  ✓ 完成。生成 {frame_count} 帧")
+    if mode == 'ab':
+        print(f"  ✓ 完成。追加 {frame_count} 帧 (共 {existing_frames + frame_count} 帧)")
+    else:
+        print(f"  ✓ 完成。生成 {frame_count} 帧")
+    metrics.count('rows', frame_count)
+    metrics.count('bytes_read', bytes_read)
+    metrics.count('bytes_written', frame_count * FRAME_LEN)
+    metrics.count('errors', log.error_count)
     print(f"  文件大小: {file_size / 1024 / 1024:.2f} MB")
     
     # 简单验证文件大小
-    expected_size = frame_count * FRAME_LEN
+    expected_size = (existing_frames + frame_count) * FRAME_LEN
     if file_size == expected_size:
         print(f"  验证通过: 文件大小正确 ({file_size} bytes)")
     else:
         print(f"  ⚠️ 验证失败: 文件大小 {file_size} != 预期 {expected_size}")
-        
-    return True
+    
+    # 时间戳索引: 追加模式下只为新增帧补充
+    if old_index is not None:
+        index = bin_index.extend_index(old_index)
+    else:
+        index = bin_index.build_index(bin_path)
+    bin_index.write_index(index)
+    print(f"  索引: {bin_index.index_path(bin_path)} ({len(index.entries)} 个桶)")
+    
+    log.finish(ok=file_size == expected_size, frames=frame_count,
+               appended_to=existing_frames, bytes=file_size)
+    result.outputs.update({'bin': bin_path, 'index': bin_index.index_path(bin_path)})
+    result.details = {'frames': frame_count, 'appended_to': existing_frames, 'bytes': file_size}
+    # 与原先一致: 文件大小不符只提示，不视为失败
+    result.ok = True
+
+def process_packed_file(csv_path, bin_path=None):
+    """
+    处理单个 CSV 文件并生成打包帧 (Cmd 0x02) 的 <名称>_packed.bin
+    :param bin_path: 输出路径 (默认 <名称>_packed.bin)
+    :return: stages.StageResult
+    """
+    with stages.measure('csv_to_bin_packed', file=csv_path) as result:
+        _encode_packed(csv_path, bin_path or os.path.splitext(csv_path)[0] + '_packed.bin', result)
+    return result
+
+def _encode_packed(csv_path, bin_path, result):
+    import packed_frame
+    if not os.path.exists(csv_path):
+        print(f"✗ 找不到文件: {csv_path}")
+        result.fail(f"找不到文件: {csv_path}")
+        return
+
+    print(f"➜ 正在处理: {csv_path}")
+    print(f"  目标输出: {bin_path}")
+
+    encoder = packed_frame.PackedEncoder()
+    log = stage_log.StageLog('csv_to_bin_packed', file=csv_path)
+    reader = iter_records(csv_path)
+    with open(bin_path, 'wb') as f_bin:
+        while True:
+            with metrics.step('read'):
+                batch = list(islice(reader, BATCH_ROWS))
+            if not batch:
+                break
+            
+            frames = []
+            with metrics.step('parse'):
+                for row in batch:
+                    try:
+                        ts, values = row_values(row)
+                        frames.extend(encoder.add(ts, values))
+                    except Exception as e:
+                        log.error(type(e).__name__, f"行 {encoder.samples + log.error_count + 1}", e)
+            
+            with metrics.step('write'):
+                f_bin.write(b''.join(frames))
+            log.progress(encoder.samples)
+        tail = encoder.flush()
+        if tail:
+            f_bin.write(tail)
+
+    file_size = os.path.getsize(bin_path)
+    per_sample = file_size / encoder.samples if encoder.samples else 0.0
+    print(f"  ✓ 完成。{encoder.samples} 个样本打包为 {encoder.frames} 帧")
+    print(f"  文件大小: {file_size / 1024 / 1024:.2f} MB, 平均 {per_sample:.1f} 字节/样本 "
+          f"(单样本帧 {FRAME_LEN} 字节, {FRAME_LEN / per_sample if per_sample else 0:.2f}x)")
+    metrics.count('rows', encoder.samples)
+    metrics.count('bytes_read', os.path.getsize(csv_path))
+    metrics.count('bytes_written', file_size)
+    metrics.count('errors', log.error_count)
+    log.finish(samples=encoder.samples, frames=encoder.frames, bytes=file_size)
+    result.outputs['bin'] = bin_path
+    result.details = {'samples': encoder.samples, 'frames': encoder.frames, 'bytes': file_size}
+    result.ok = True
 
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='CSV 转 二进制文件 (Protocol Bin)')
+    parser.add_argument('files', nargs='*', default=FILES_TO_PROCESS,
+                        help='要处理的 CSV / 列式文件 (默认: 三个设备文件)')
+    parser.add_argument('--append', action='store_true',
+                        help='追加模式: 只编码已有 bin 最后一帧之后的新行')
+    parser.add_argument('--packed', action='store_true',
+                        help='输出多样本打包帧 (Cmd 0x02) 到 <名称>_packed.bin')
+    args = parser.parse_args()
+    if args.packed and args.append:
+        parser.error('--packed 不支持 --append')
+
     print("=" * 60)
     print("CSV 转 二进制文件 (Protocol Bin) 工具")
-    print(f"帧长度: {FRAME_LEN} 字节 (Payload: {PAYLOAD_LEN})")
+    if args.packed:
+        import packed_frame
+        print(f"帧格式: 打包帧 (Cmd 0x{packed_frame.CMD_PACKED:02X})，每帧最多 {packed_frame.MAX_SAMPLES} 个样本，"
+              f"帧长不超过 {packed_frame.MAX_FRAME_LEN} 字节")
+    else:
+        print(f"帧长度: {FRAME_LEN} 字节 (Payload: {PAYLOAD_LEN})")
     print("=" * 60)
     
     success_count = 0
-    for csv_file in FILES_TO_PROCESS:
-        if process_single_file(csv_file):
+    for csv_file in args.files:
+        path = columnar.resolve_input(csv_file)
+        if args.packed:
+            result = process_packed_file(path)
+        else:
+            result = process_single_file(path, append=args.append)
+        if result.ok:
             success_count += 1
             
     print("\n" + "=" * 60)
-    print(f"全部完成! 成功: {success_count}/{len(FILES_TO_PROCESS)}")
+    print(f"全部完成! 成功: {success_count}/{len(args.files)}")
     print("=" * 60)
 
 if __name__ == "__main__":
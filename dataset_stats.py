@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+分块流式的数据集统计与对比
+
+只读取需要的列，按块以 float64 解析 ('null' 记为空值)，每列维护可合并的
+统计量 (Welford 均值/方差、最小/最大值、空值计数、DDSketch 风格的分位数草图)。
+多个数据集在独立进程中并行统计，最后输出与 acc_comparison_table.md 相同格式的
+markdown 对比表。
+
+    python3 dataset_stats.py WTB1_data/WTB1.csv converted_WTB1_format.csv --columns 'AccX(g)' 'AccY(g)'
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 每块读取的行数
+CHUNK_ROWS = 500_000
+
+# 分位数草图的相对误差
+SKETCH_ACCURACY = 0.01
+
+NULL_VALUES = ['null']
+
+class QuantileSketch:
+    """
+    DDSketch 风格的分位数草图
+
+    按 gamma = (1 + a) / (1 - a) 的对数分桶计数，任意分位数的相对误差不超过 a；
+    桶计数可直接相加，因此分块/并行的结果可以合并。
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _add(self, store, values):
+        keys = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        uniq, counts = np.unique(keys, return_counts=True)
+        for k, c in zip(uniq.tolist(), counts.tolist()):
+            store[k] = store.get(k, 0) + c
+
+    def update(self, values):
+        """加入一批非空值"""
+        if len(values) == 0:
+            return
+        tiny = np.finfo(np.float64).tiny
+        pos = values[values > tiny]
+        neg = -values[values < -tiny]
+        if len(pos):
+            self._add(self.positive, pos)
+        if len(neg):
+            self._add(self.negative, neg)
+        self.zeros += len(values) - len(pos) - len(neg)
+        self.count += len(values)
+
+    def merge(self, other):
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for k, c in other_store.items():
+                store[k] = store.get(k, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float('nan')
+        rank = q * (self.count - 1)
+        seen = 0
+        # 从最小值开始: 负数 (绝对值从大到小)、零、正数 (从小到大)
+        for k in sorted(self.negative, reverse=True):
+            seen += self.negative[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.positive):
+            seen += self.positive[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.positive))
+
+class RunningStats:
+    """单列的可合并流式统计"""
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('nan')
+        self.max = float('nan')
+        self.sketch = QuantileSketch(accuracy)
+
+    def update(self, values):
+        """加入一批数值 (NaN 计为空值)"""
+        values = np.asarray(values, dtype=np.float64)
+        valid = values[~np.isnan(values)]
+        self.nulls += len(values) - len(valid)
+        if len(valid) == 0:
+            return
+        other = RunningStats.__new__(RunningStats)
+        other.count = len(valid)
+        other.nulls = 0
+        other.mean = float(valid.mean())
+        other.m2 = float(((valid - other.mean) ** 2).sum())
+        other.min = float(valid.min())
+        other.max = float(valid.max())
+        other.sketch = QuantileSketch(self.sketch.accuracy)
+        other.sketch.update(valid)
+        self.merge(other)
+
+    def merge(self, other):
+        """合并另一份统计 (Chan 并行方差公式)"""
+        self.nulls += other.nulls
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+        else:
+            n = self.count + other.count
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.count * other.count / n
+            self.mean += delta * other.count / n
+            self.count = n
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def std(self):
+        """样本标准差 (ddof=1，与 pandas 一致)"""
+        if self.count < 2:
+            return float('nan')
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def quantile(self, q):
+        """近似分位数 (限制在实际的 [min, max] 内，草图的桶代表值可能略超出)"""
+        value = self.sketch.quantile(q)
+        if self.count == 0:
+            return value
+        return min(max(value, self.min), self.max)
+
+    def summary(self):
+        return {
+            'Mean': self.mean if self.count else float('nan'),
+            'Min': self.min,
+            'Max': self.max,
+            'Std': self.std,
+            'P50': self.quantile(0.5),
+            'P99': self.quantile(0.99),
+            'NullCount': self.nulls,
+        }
+
+def iter_column_chunks(path, columns, chunk_rows=CHUNK_ROWS, typed=True):
+    """
+    分块读取指定列，产生 {列名: float64 数组}
+
+    CSV 只解析需要的列; typed=True 时直接按 float64 解析 (遇到无法解析的值
+    会抛出 ValueError)，typed=False 时按字符串读取再转换 (无法解析记为空值)。
+    列式中间文件按批次读取。
+    """
+    import columnar
+
+    if columnar.is_columnar(path):
+        present = [c for c in columns if c in columnar._unique_names(columnar.read_header(path))]
+        for batch in columnar.iter_batches(path, present):
+            yield {name: batch.column(i).to_numpy(zero_copy_only=False).astype(np.float64)
+                   for i, name in enumerate(batch.schema.names)}
+        return
+
+    import pandas as pd
+    wanted = set(columns)
+    if typed:
+        for chunk in pd.read_csv(path, usecols=lambda c: c in wanted, dtype=np.float64,
+                                 na_values=NULL_VALUES, chunksize=chunk_rows):
+            yield {c: chunk[c].to_numpy() for c in chunk.columns}
+    else:
+        for chunk in pd.read_csv(path, usecols=lambda c: c in wanted, dtype=str,
+                                 keep_default_na=False, chunksize=chunk_rows):
+            yield {c: pd.to_numeric(chunk[c], errors='coerce').to_numpy(np.float64)
+                   for c in chunk.columns}
+
+def _count_rows(path, chunk_rows):
+    """列全部缺失时单独统计行数"""
+    import columnar
+    if columnar.is_columnar(path):
+        return sum(batch.num_rows for batch in columnar.iter_batches(path))
+    import pandas as pd
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], dtype=str, chunksize=chunk_rows))
+
+def collect_stats(path, columns, chunk_rows=CHUNK_ROWS):
+    """
+    统计单个数据集
+    :return: {'path', 'rows': 行数, 'columns': {列名: RunningStats}, 'missing': 缺失的列}
+    """
+    for typed in (True, False):
+        stats = {c: RunningStats() for c in columns}
+        rows = 0
+        seen = set()
+        try:
+            for chunk in iter_column_chunks(path, columns, chunk_rows, typed):
+                if chunk:
+                    rows += len(next(iter(chunk.values())))
+                for name, values in chunk.items():
+                    seen.add(name)
+                    stats[name].update(values)
+            break
+        except ValueError:
+            # 有列含无法解析的文本: 改为按字符串读取后重新统计
+            continue
+
+    if not seen:
+        rows = _count_rows(path, chunk_rows)
+    # 缺失的列按全空处理 (与 pandas 的 NaN 序列一致)
+    missing = [c for c in columns if c not in seen]
+    for c in missing:
+        stats[c].nulls = rows
+    return {'path': path, 'rows': rows, 'columns': stats, 'missing': missing}
+
+def compare(paths, columns, chunk_rows=CHUNK_ROWS, workers=None):
+    """
+    并行统计多个数据集 (每个数据集一个进程)
+    :return: 与 paths 顺序一致的 collect_stats 结果列表
+    """
+    columns = list(dict.fromkeys(columns))
+    if len(paths) <= 1 or workers == 1:
+        return [collect_stats(p, columns, chunk_rows) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as pool:
+        futures = [pool.submit(collect_stats, p, columns, chunk_rows) for p in paths]
+        return [f.result() for f in futures]
+
+def _short_name(column):
+    """'AccX(g)' -> 'AccX'"""
+    return column.split('(')[0]
+
+def format_ratio(base, value):
+    """差异倍数 (与 compare_acc 的规则一致)"""
+    if abs(base) > 1e-4:
+        return f"{value / base:.2f}x"
+    if abs(value) > 1e-4:
+        return "Inf"
+    return "-"
+
+def markdown_table(results, labels, columns, metrics=('Mean', 'Min', 'Max', 'Std')):
+    """
+    生成 acc_comparison_table.md 格式的对比表
+
+    第一个数据集作为基准，其余每个数据集各有一列差异倍数。
+    """
+    base = labels[0]
+    header = ["指标 (Metric)"] + list(labels) + [f"差异倍数 ({label} / {base})" for label in labels[1:]]
+    lines = ["| " + " | ".join(header) + " |",
+             "| " + " | ".join([":---"] * len(header)) + " |"]
+
+    for i, col in enumerate(columns):
+        if i:
+            lines.append("|" + " |" * len(header))
+        for metric in metrics:
+            values = [r['columns'][col].summary()[metric] for r in results]
+            cells = [f"**{_short_name(col)} {metric}**"] + [f"{v:.4f}" for v in values]
+            cells += [format_ratio(values[0], v) for v in values[1:]]
+            lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='分块流式对比多个数据集的统计量')
+    parser.add_argument('files', nargs='+', help='CSV 或列式文件 (第一个作为基准)')
+    parser.add_argument('--labels', nargs='+', help='各数据集在表格中的名称 (默认: 文件名)')
+    parser.add_argument('--columns', nargs='+', default=['AccX(g)', 'AccY(g)', 'AccZ(g)'])
+    parser.add_argument('--metrics', nargs='+', default=['Mean', 'Min', 'Max', 'Std'],
+                        choices=['Mean', 'Min', 'Max', 'Std', 'P50', 'P99', 'NullCount'])
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('-o', '--output', help='把 markdown 表格写入文件')
+    args = parser.parse_args()
+
+    labels = args.labels or [os.path.basename(f) for f in args.files]
+    if len(labels) != len(args.files):
+        parser.error("--labels 数量必须与文件数量一致")
+
+    results = compare(args.files, args.columns, args.chunk_rows)
+    table = markdown_table(results, labels, args.columns, args.metrics)
+    print(table)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(table + "\n")
+
+if __name__ == '__main__':
+    main()
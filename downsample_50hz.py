@@ -9,13 +9,18 @@
 
 生成降采样后的 CSV 文件，然后调用 csv_to_bin.py 生成 bin 文件
 """
-import csv
 import os
 import subprocess
 from bisect import bisect_left
 
+import columnar
+import metrics
+import stages
+
 # 配置
 SAMPLE_INTERVAL_US = 20000  # 50Hz = 20ms = 20000μs
+# 无有效气压的行每 DOWNSAMPLE_FACTOR 行取 1 行
+DOWNSAMPLE_FACTOR = 2
 FILES_TO_PROCESS = [
     ('WTR1_data/WTR1.csv', 'WTR1_data/WTR1_50hz.csv'),
     ('WTL1_data/WTL1.csv', 'WTL1_data/WTL1_50hz.csv'),
@@ -42,38 +47,45 @@ def find_closest_index(target_ts, timestamps):
     else:
         return pos
 
-def downsample_to_50hz(input_csv, output_csv):
+def downsample_to_50hz(input_csv, output_csv, factor=DOWNSAMPLE_FACTOR):
     """
     将 CSV 文件降采样到 50Hz，同时保留所有有效气压数据
     
     策略：
     1. 标记所有有效气压数据的行（必须保留）
-    2. 对于无气压数据的行，每2个取1个
+    2. 对于无气压数据的行，每 factor 个取1个
     3. 占位符 10000.00 改为 0
     不伪造任何数据，只选择原始数据点
+    :return: stages.StageResult (outputs['output'] 为实际输出路径)
     """
+    with stages.measure('downsample', file=input_csv) as result:
+        _downsample(input_csv, output_csv, factor, result)
+    return result
+
+def _downsample(input_csv, output_csv, downsample_factor, result):
+    # 输入可能是 CSV 或列式中间文件
+    input_csv = columnar.resolve_input(input_csv)
     print(f"\n处理文件: {input_csv}")
     
     if not os.path.exists(input_csv):
         print(f"  ✗ 文件不存在: {input_csv}")
-        return False
+        result.fail(f"文件不存在: {input_csv}")
+        return
     
     # Step 1: 读取所有数据
     rows = []
     timestamps = []
-    header = None
     pressure_col_idx = -1
     
-    with open(input_csv, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        header = next(reader)
-        
-        # 找到pressure列的索引
-        for i, col in enumerate(header):
-            if col.strip().lower() == 'pressure':
-                pressure_col_idx = i
-                break
-        
+    header, reader = columnar.open_rows(input_csv)
+    
+    # 找到pressure列的索引
+    for i, col in enumerate(header):
+        if col.strip().lower() == 'pressure':
+            pressure_col_idx = i
+            break
+    
+    with metrics.step('read'):
         for row in reader:
             if not row:
                 continue
@@ -86,12 +98,14 @@ def downsample_to_50hz(input_csv, output_csv):
     
     if not rows:
         print(f"  ✗ 没有有效数据")
-        return False
+        result.fail(f"没有有效数据: {input_csv}")
+        return
     
     # 按时间戳排序
-    combined = sorted(zip(timestamps, rows), key=lambda x: x[0])
-    timestamps = [x[0] for x in combined]
-    rows = [x[1] for x in combined]
+    with metrics.step('sort'):
+        combined = sorted(zip(timestamps, rows), key=lambda x: x[0])
+        timestamps = [x[0] for x in combined]
+        rows = [x[1] for x in combined]
     
     print(f"  原始数据: {len(rows)} 行")
     print(f"  时间范围: {timestamps[0]} ~ {timestamps[-1]} (μs)")
@@ -104,24 +118,24 @@ def downsample_to_50hz(input_csv, output_csv):
     print(f"  原始采样率: ~{original_rate:.1f} Hz")
     
     # Step 2: 标记有效气压数据行 & 将占位符改为0
-    PLACEHOLDER_VALUE = '10000.00'
+    # CSV 中为 '10000.00'，列式文件读出为 '10000' (旧版本写出的文件为 '10000.0')
+    PLACEHOLDER_VALUES = ('10000.00', '10000.0', '10000')
     valid_pressure_indices = set()
     
     for i, row in enumerate(rows):
         if pressure_col_idx >= 0 and pressure_col_idx < len(row):
             pressure = row[pressure_col_idx].strip()
-            if pressure == PLACEHOLDER_VALUE:
+            if pressure in PLACEHOLDER_VALUES:
                 # 将占位符改为0
                 row[pressure_col_idx] = '0'
-            elif pressure and pressure != '0':
+            elif pressure and pressure not in ('0', '0.0'):
                 # 有效气压数据，标记此行必须保留
                 valid_pressure_indices.add(i)
     
     print(f"  有效气压数据行: {len(valid_pressure_indices)} 个")
     
-    # Step 3: 降采样（保留所有有效气压行，其他行每2个取1个）
+    # Step 3: 降采样（保留所有有效气压行，其他行每 downsample_factor 个取1个）
     output_rows = []
-    downsample_factor = 2
     skip_counter = 0
     
     for i, row in enumerate(rows):
@@ -130,7 +144,7 @@ def downsample_to_50hz(input_csv, output_csv):
             output_rows.append(row)
             skip_counter = 0  # 重置计数器
         else:
-            # 无有效气压，每2个取1个
+            # 无有效气压，每 downsample_factor 个取1个
             if skip_counter % downsample_factor == 0:
                 output_rows.append(row)
             skip_counter += 1
@@ -141,15 +155,19 @@ def downsample_to_50hz(input_csv, output_csv):
     output_rate = len(output_rows) / total_time_s if total_time_s > 0 else 0
     print(f"  输出采样率: ~{output_rate:.1f} Hz")
     
-    # Step 4: 写入输出文件
-    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
+    # Step 4: 写入输出文件 (CSV 或列式中间格式)
+    output_path = columnar.output_path(output_csv)
+    with metrics.step('write'), columnar.open_row_writer(output_path, header) as writer:
         writer.writerows(output_rows)
     
-    print(f"  ✓ 已保存: {output_csv}")
-    
-    return True
+    print(f"  ✓ 已保存: {output_path}")
+    metrics.count('rows', len(rows))
+    metrics.count('rows_out', len(output_rows))
+    metrics.count_file('bytes_read', input_csv)
+    metrics.count_file('bytes_written', output_path)
+    result.outputs['output'] = output_path
+    result.details = {'pressure_rows': len(valid_pressure_indices)}
+    result.ok = True
 
 def main():
     print("=" * 70)
@@ -162,9 +180,10 @@ def main():
     output_files = []
     
     for input_csv, output_csv in FILES_TO_PROCESS:
-        if downsample_to_50hz(input_csv, output_csv):
+        result = downsample_to_50hz(input_csv, output_csv)
+        if result.ok:
             success_count += 1
-            output_files.append(output_csv)
+            output_files.append(result.outputs['output'])
     
     print("\n" + "=" * 70)
     print(f"降采样完成! 成功: {success_count}/{len(FILES_TO_PROCESS)}")
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+实时采集: 接收网关推送的 80 字节帧流，写入按大小/时间轮转的 bin 分段
+
+    session = ingest.IngestSession('WTR1', 'WTR1_data')
+    session.feed(data)        # 任意切分的字节流 (帧可以跨批次)
+    session.close()
+
+- 每批数据与上一批剩余的不完整帧拼接后，整块向量化校验帧头和 CRC
+  (bin_to_csv.scan_frames)，损坏的字节区间按同步字跳过并计数
+- 有效帧追加到 <device>_data/<device>_live_<时间>.bin，超过 max_bytes 字节或
+  跨度超过 max_seconds 秒 (按帧时间戳) 时轮转到新分段；写 CSV 时同名 .csv 一同轮转
+- 每个分段的 .idx 时间戳索引只为新增帧补充 (bin_index.extend_index)，
+  最多每 INDEX_INTERVAL 秒写一次，轮转和结束时立即写入
+- 滚动统计: 每秒一份 RunningStats，查询时合并最近 ROLLING_SECONDS 秒
+- 图表金字塔 (ChartPyramid): 多级 min/max 降采样，随数据增量更新，前端可按
+  时间跨度选择层级，不必读取原始帧
+
+app.py 通过 WebSocket /api/ingest/{device} 提供该功能；也可以作为 TCP 客户端
+直接从网关 (或 playback.py 的 TCP 输出) 采集:
+
+    python3 ingest.py tcp://127.0.0.1:9000 --device WTR1 --max-mb 64 --max-seconds 3600
+"""
+import collections
+import csv
+import os
+import time
+from datetime import datetime
+
+import bin_index
+import bin_to_csv
+
+FRAME_LEN = bin_to_csv.FRAME_LEN
+
+# 分段轮转的默认阈值
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+MAX_SEGMENT_SECONDS = 3600.0
+
+# 索引写入的最小间隔 (秒)
+INDEX_INTERVAL = 1.0
+
+# 滚动统计的窗口 (秒)
+ROLLING_SECONDS = 60
+
+# 图表金字塔: 第 0 层每个点 PYRAMID_BASE 帧，每上一层合并 PYRAMID_FACTOR 个点，
+# 每层保留最近 PYRAMID_POINTS 个点
+PYRAMID_BASE = 10
+PYRAMID_FACTOR = 10
+PYRAMID_LEVELS = 4
+PYRAMID_POINTS = 2000
+
+# 统计与图表使用的列: (CSV 列名, 帧字段, 编码倍数)
+STATS_FIELDS = bin_to_csv.ROUND_TRIP_FIELDS
+
+def physical_columns(frames):
+    """结构化帧数组 -> (n, 列数) float64 物理量矩阵"""
+    import numpy as np
+    return np.column_stack([frames[field] / scale for _, field, scale in STATS_FIELDS])
+
+class ChartPyramid:
+    """
+    多级 min/max 降采样
+
+    每层每个点保存 (首帧时间戳, 各列最小值, 各列最大值)；第 0 层由原始帧聚合，
+    上一层由下一层已完成的点聚合。未满的点留到下一批继续累积。
+    """
+
+    def __init__(self, columns, base=PYRAMID_BASE, factor=PYRAMID_FACTOR,
+                 levels=PYRAMID_LEVELS, points=PYRAMID_POINTS):
+        self.columns = columns
+        self.sizes = [base * factor ** k for k in range(levels)]
+        self.factor = factor
+        self.levels = [collections.deque(maxlen=points) for _ in range(levels)]
+        # 各层未完成的点: [首帧时间戳, 最小值数组, 最大值数组, 已合并数量]
+        self._pending = [None] * levels
+
+    def _add(self, level, time, lo, hi, count, need):
+        """把 count 个下层单位 (帧或点) 的聚合结果并入 level 层的未完成点"""
+        import numpy as np
+        pending = self._pending[level]
+        if pending is None:
+            pending = self._pending[level] = [time, lo.copy(), hi.copy(), 0]
+        else:
+            np.minimum(pending[1], lo, out=pending[1])
+            np.maximum(pending[2], hi, out=pending[2])
+        pending[3] += count
+        if pending[3] < need:
+            return
+        self._pending[level] = None
+        self._complete(level, (pending[0], pending[1], pending[2]))
+
+    def _complete(self, level, point):
+        self.levels[level].append(point)
+        if level + 1 < len(self.levels):
+            self._add(level + 1, *point, 1, self.factor)
+
+    def update(self, times, values):
+        """加入一批帧: times 为时间戳数组，values 为 (n, 列数) 物理量矩阵"""
+        base = self.sizes[0]
+        i, n = 0, len(times)
+        pending = self._pending[0]
+        if pending is not None and n:
+            # 先补满上一批留下的未完成点
+            j = min(n, base - pending[3])
+            self._add(0, 0, values[:j].min(axis=0), values[:j].max(axis=0), j, base)
+            i = j
+        # 整组的点一次性向量化计算
+        groups = (n - i) // base
+        if groups:
+            block = values[i:i + groups * base].reshape(groups, base, -1)
+            lows, highs = block.min(axis=1), block.max(axis=1)
+            for g in range(groups):
+                self._complete(0, (int(times[i + g * base]), lows[g], highs[g]))
+            i += groups * base
+        if i < n:
+            self._add(0, int(times[i]), values[i:].min(axis=0), values[i:].max(axis=0), n - i, base)
+
+    def query(self, level, column, points=None):
+        """返回某层某列的 [[时间戳, 最小值, 最大值], ...] (最近 points 个点)"""
+        c = self.columns.index(column)
+        data = list(self.levels[level])
+        if points:
+            data = data[-points:]
+        return [[t, float(lo[c]), float(hi[c])] for t, lo, hi in data]
+
+class RollingStats:
+    """按秒分桶的 RunningStats，查询时合并最近 window 秒"""
+
+    def __init__(self, columns, window=ROLLING_SECONDS):
+        self.columns = columns
+        self.window = window
+        self.buckets = collections.deque()
+
+    def update(self, values, now=None):
+        from dataset_stats import RunningStats
+        second = int(now if now is not None else time.time())
+        if not self.buckets or self.buckets[-1][0] != second:
+            self.buckets.append((second, [RunningStats() for _ in self.columns]))
+        for stats, column in zip(self.buckets[-1][1], values.T):
+            stats.update(column)
+        while self.buckets and self.buckets[0][0] <= second - self.window:
+            self.buckets.popleft()
+
+    def summary(self):
+        from dataset_stats import RunningStats
+        merged = [RunningStats() for _ in self.columns]
+        for _, bucket in self.buckets:
+            for total, stats in zip(merged, bucket):
+                total.merge(stats)
+        return {column: {k: (None if v != v else v) for k, v in stats.summary().items()}
+                for column, stats in zip(self.columns, merged)}
+
+class IngestSession:
+    """单个设备的一次实时采集"""
+
+    def __init__(self, device, directory, max_bytes=MAX_SEGMENT_BYTES,
+                 max_seconds=MAX_SEGMENT_SECONDS, write_csv=False):
+        self.device = device
+        self.directory = str(directory)
+        self.max_bytes = max(FRAME_LEN, max_bytes // FRAME_LEN * FRAME_LEN)
+        self.max_seconds = max_seconds
+        self.write_csv = write_csv
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.columns = [column for column, _, _ in STATS_FIELDS]
+        self.pyramid = ChartPyramid(self.columns)
+        self.rolling = RollingStats(self.columns)
+        self.segments = []
+        self.counts = {'bytes_received': 0, 'frames': 0, 'skipped_bytes': 0, 'skipped_ranges': 0}
+        self.started = time.time()
+        self.closed = False
+
+        self._tail = b''
+        # 上一批以跳过区间结尾 (保留的 _tail 紧接在损坏字节之后)
+        self._skipping = False
+        self._bin = None
+        self._csv = None
+        self._csv_writer = None
+        self._index = None
+        self._index_written = 0.0
+        self._segment_frames = 0
+        self._segment_start = None
+
+    # ---- 分段 ----
+    def _open_segment(self):
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        base = os.path.join(self.directory, f"{self.device}_live_{stamp}")
+        path, n = base + '.bin', 1
+        while os.path.exists(path):
+            n += 1
+            path = f"{base}_{n}.bin"
+        self._bin = open(path, 'wb')
+        if self.write_csv:
+            self._csv = open(os.path.splitext(path)[0] + '.csv', 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.DictWriter(self._csv, fieldnames=bin_to_csv.CSV_FIELDS)
+            self._csv_writer.writeheader()
+        self._index = None
+        self._segment_frames = 0
+        self._segment_start = None
+        self.segments.append(path)
+        print(f"  [{self.device}] 新分段: {path}")
+
+    def _close_segment(self):
+        if self._bin is None:
+            return
+        self._bin.close()
+        if self._csv is not None:
+            self._csv.close()
+        self._write_index(force=True)
+        self._bin = self._csv = self._csv_writer = None
+
+    def _write_index(self, force=False):
+        """为新增帧补充索引并写出 (非强制时最多每 INDEX_INTERVAL 秒一次)"""
+        now = time.monotonic()
+        if not force and now - self._index_written < INDEX_INTERVAL:
+            return
+        path = self.segments[-1]
+        if self._bin is not None and not self._bin.closed:
+            self._bin.flush()
+        if self._segment_frames == 0:
+            return
+        if self._index is None:
+            self._index = bin_index.build_index(path)
+        else:
+            self._index = bin_index.extend_index(self._index)
+        bin_index.write_index(self._index)
+        self._index_written = now
+
+    def _segment_room(self, times):
+        """当前分段还能写入 times 中的前多少帧"""
+        import numpy as np
+        room = (self.max_bytes - self._segment_frames * FRAME_LEN) // FRAME_LEN
+        if self.max_seconds and len(times):
+            if self._segment_start is None:
+                self._segment_start = int(times[0])
+            limit = self._segment_start + int(self.max_seconds * bin_index.ticks_per_second(self._segment_start))
+            room = min(room, int(np.searchsorted(np.maximum.accumulate(times), limit, side='left')))
+        return room
+
+    def _write(self, frames):
+        """写入一批有效帧 (结构化数组)，必要时轮转分段"""
+        import numpy as np
+        times = frames['time'].astype(np.int64)
+        start = 0
+        while start < len(frames):
+            if self._bin is None:
+                self._open_segment()
+            room = self._segment_room(times[start:])
+            if room <= 0:
+                if self._segment_frames == 0:
+                    room = 1
+                else:
+                    self._close_segment()
+                    continue
+            chunk = frames[start:start + room]
+            self._bin.write(chunk.tobytes())
+            if self._csv_writer is not None:
+                # 帧字段 4 ~ 21 即 Payload 的时间戳与 17 个字段
+                self._csv_writer.writerows(bin_to_csv.values_to_row(frame[4:22]) for frame in chunk.tolist())
+            self._segment_frames += len(chunk)
+            start += len(chunk)
+
+    # ---- 输入 ----
+    def feed(self, data):
+        """
+        处理收到的一批字节 (可包含不完整帧)
+        :return: 本批的计数 {'frames': 有效帧数, 'skipped_bytes': 跳过的字节数}
+        """
+        import numpy as np
+        if self.closed:
+            raise ValueError("采集已结束")
+        self.counts['bytes_received'] += len(data)
+        buf = self._tail + bytes(data)
+        offsets, skipped = bin_to_csv.scan_frames(buf)
+        # 最后一个有效帧之后的字节 (scan_frames 已计为跳过): 只保留可能是下一帧开头的部分
+        end = int(offsets[-1]) + FRAME_LEN if len(offsets) else 0
+        keep = max(end, len(buf) - (FRAME_LEN - 1))
+        skipped = [(a, min(b, keep)) for a, b in skipped if a < keep]
+        self._tail = buf[keep:]
+        # 从本批开头起的跳过区间若紧接上一批的跳过区间，是同一段损坏数据
+        continued = self._skipping and bool(skipped) and skipped[0][0] == 0
+        self._skipping = bool(skipped) and skipped[-1][1] == keep
+
+        skipped_bytes = sum(b - a for a, b in skipped)
+        self.counts['skipped_bytes'] += skipped_bytes
+        self.counts['skipped_ranges'] += len(skipped) - continued
+        if len(offsets):
+            raw = np.frombuffer(buf, dtype=np.uint8)
+            frames = raw[offsets[:, None] + np.arange(FRAME_LEN)].reshape(-1).view(bin_to_csv.frame_dtype())
+            self._write(frames)
+            values = physical_columns(frames)
+            self.rolling.update(values)
+            self.pyramid.update(frames['time'], values)
+            self.counts['frames'] += len(frames)
+            self._write_index()
+        return {'frames': len(offsets), 'skipped_bytes': skipped_bytes}
+
+    def close(self):
+        """结束采集: 关闭当前分段并写出索引 (剩余不完整帧计为跳过)"""
+        if self.closed:
+            return
+        if self._tail:
+            self.counts['skipped_bytes'] += len(self._tail)
+            self.counts['skipped_ranges'] += not self._skipping
+            self._tail = b''
+        self._close_segment()
+        self.closed = True
+
+    def status(self):
+        elapsed = time.time() - self.started
+        return {
+            'device': self.device,
+            'active': not self.closed,
+            'elapsed_seconds': round(elapsed, 3),
+            'frames_per_second': round(self.counts['frames'] / elapsed, 2) if elapsed else None,
+            'segments': self.segments,
+            **self.counts,
+        }
+
+def main():
+    import argparse
+    import asyncio
+    from urllib.parse import urlparse
+    parser = argparse.ArgumentParser(description='从 TCP 帧流实时采集并写入轮转的 bin 分段')
+    parser.add_argument('source', help='tcp://host:port (网关或 playback.py 的 TCP 输出)')
+    parser.add_argument('--device', required=True, help='设备名 (输出到 <device>_data/)')
+    parser.add_argument('--max-mb', type=float, default=MAX_SEGMENT_BYTES / 1024 / 1024, help='分段最大大小 (MB)')
+    parser.add_argument('--max-seconds', type=float, default=MAX_SEGMENT_SECONDS, help='分段最大时间跨度 (秒)')
+    parser.add_argument('--csv', action='store_true', help='同时写出 CSV 分段')
+    args = parser.parse_args()
+
+    url = urlparse(args.source)
+    if url.scheme != 'tcp':
+        parser.error("只支持 tcp://host:port")
+
+    session = IngestSession(args.device, f"{args.device}_data", int(args.max_mb * 1024 * 1024),
+                            args.max_seconds, args.csv)
+
+    async def run():
+        reader, writer = await asyncio.open_connection(url.hostname, url.port)
+        print(f"➜ 已连接 {args.source}")
+        try:
+            while True:
+                data = await reader.read(64 * 1024)
+                if not data:
+                    break
+                session.feed(data)
+        finally:
+            writer.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\n已中断")
+    finally:
+        session.close()
+    status = session.status()
+    print(f"✓ {status['frames']} 帧, 跳过 {status['skipped_bytes']} bytes, 分段 {len(status['segments'])} 个")
+
+if __name__ == '__main__':
+    main()
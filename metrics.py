@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+阶段级计时、计数与性能剖析
+
+各阶段函数用 stage() 包裹，记录墙钟/CPU 时间、行数与字节数计数、内存采样，
+阶段内的子步骤 (读取 / 解析 / 写入) 用 step() 分别累计耗时:
+
+    with metrics.stage('split', file=input_file):
+        with metrics.step('read'):
+            batch = ...
+        metrics.count('rows', total_rows)
+
+- 阶段运行期间由一个后台线程每 RSS_SAMPLE_INTERVAL 秒采样一次 RSS，
+  记入所有正在运行的阶段的 rss_max_sample_bytes
+
+- 环境变量 BLE_PROFILE=cprofile 时对最外层阶段做 cProfile (输出 .prof)，
+  BLE_PROFILE=sample 时用后台线程对主线程做栈采样 (输出 flamegraph 可用的 .folded)，
+  输出目录由 BLE_PROFILE_DIR 指定 (默认 profiles/)
+- 设置 BLE_METRICS_FILE 时，进程退出前把本进程的阶段记录按 JSON 行追加到该文件，
+  app.py 通过它汇总子进程的指标
+- MetricsCollector 汇总各任务的指标，供 app.py 的 /metrics 接口输出 Prometheus 文本格式
+"""
+import atexit
+import collections
+import functools
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_ENV = 'BLE_PROFILE'
+PROFILE_DIR_ENV = 'BLE_PROFILE_DIR'
+METRICS_FILE_ENV = 'BLE_METRICS_FILE'
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# 栈采样间隔 (秒)
+SAMPLE_INTERVAL = 0.005
+
+# 阶段运行期间的 RSS 采样间隔 (秒)
+RSS_SAMPLE_INTERVAL = 0.05
+
+# 延迟直方图的默认分桶 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float('inf'))
+
+# 待 dump() 写出的阶段记录上限: 常驻进程中不设置 BLE_METRICS_FILE 时不会 dump，只保留最近的记录
+MAX_RECORDS = 1000
+
+# 本进程已结束的阶段记录 (最近 MAX_RECORDS 条) / 各线程正在运行的阶段栈 (多线程并发运行阶段时互不干扰)
+records = collections.deque(maxlen=MAX_RECORDS)
+_local = threading.local()
+_lock = threading.Lock()
+_profile_seq = itertools.count(1)
+
+# 所有线程正在运行的阶段记录 (供 RSS 采样线程更新)
+_active = []
+_active_cond = threading.Condition()
+_rss_sampler = None
+
+def peak_rss_bytes():
+    """进程生命周期内的峰值 RSS"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def current_rss_bytes():
+    """当前 RSS (仅 Linux，其他平台返回 None)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class _StackSampler(threading.Thread):
+    """定时采样主线程调用栈，累计为 folded 格式 ('a;b;c 次数')"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.target = threading.main_thread().ident
+        self.counts = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, n in sorted(self.counts.items(), key=lambda x: -x[1]):
+                f.write(f"{stack} {n}\n")
+
+def _sample_rss_loop():
+    """后台线程: 有阶段在运行时定时采样 RSS，没有时等待"""
+    while True:
+        with _active_cond:
+            while not _active:
+                _active_cond.wait()
+            active = list(_active)
+        rss = current_rss_bytes()
+        if rss is None:
+            return  # 当前平台无法读取 RSS
+        for record in active:
+            if rss > (record['rss_max_sample_bytes'] or 0):
+                record['rss_max_sample_bytes'] = rss
+            record['rss_samples'] += 1
+        time.sleep(RSS_SAMPLE_INTERVAL)
+
+def _activate(record):
+    global _rss_sampler
+    with _active_cond:
+        _active.append(record)
+        if _rss_sampler is None:
+            _rss_sampler = threading.Thread(target=_sample_rss_loop, name='metrics-rss', daemon=True)
+            _rss_sampler.start()
+        _active_cond.notify()
+
+def _deactivate(record):
+    with _active_cond:
+        _active.remove(record)
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _profile_mode(profile):
+    mode = (profile if profile is not None else os.environ.get(PROFILE_ENV, '')).lower()
+    return mode if mode in PROFILE_MODES else None
+
+def _profile_path(name, suffix):
+    directory = os.environ.get(PROFILE_DIR_ENV, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    return os.path.join(directory, f"{name}_{stamp}_{os.getpid()}_{next(_profile_seq)}{suffix}")
+
+@contextmanager
+def stage(name, profile=None, **labels):
+    """
+    记录一个阶段 (可嵌套，嵌套的阶段记录 parent)
+
+    :param profile: 'cprofile' / 'sample'，默认取环境变量 BLE_PROFILE；只对最外层阶段生效
+    :param labels: 附加标签 (如 file=路径)
+    """
+    stack = _stack()
+    record = {
+        'stage': name,
+        'parent': stack[-1]['stage'] if stack else None,
+        'labels': {k: str(v) for k, v in labels.items()},
+        'pid': os.getpid(),
+        'counters': {},
+        'steps': {},
+        'rss_start_bytes': current_rss_bytes(),
+        'rss_max_sample_bytes': current_rss_bytes(),
+        'rss_samples': 0,
+    }
+    mode = _profile_mode(profile) if not stack else None
+    profiler = sampler = None
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif mode == 'sample':
+        sampler = _StackSampler()
+        sampler.start()
+
+    stack.append(record)
+    _activate(record)
+    # 阶段可能在线程池中并发运行: 只统计当前线程的 CPU 时间
+    cpu_start = time.thread_time()
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield record
+        ok = True
+    finally:
+        record['wall_seconds'] = time.perf_counter() - start
+        record['cpu_seconds'] = time.thread_time() - cpu_start
+        _deactivate(record)
+        stack.pop()
+        if profiler is not None:
+            profiler.disable()
+            record['profile'] = _profile_path(name, '.prof')
+            profiler.dump_stats(record['profile'])
+        if sampler is not None:
+            sampler.stop()
+            record['profile'] = _profile_path(name, '.folded')
+            sampler.write(record['profile'])
+        sample_memory(record)
+        record['peak_rss_bytes'] = peak_rss_bytes()
+        record['ok'] = ok
+        with _lock:
+            records.append(record)
+
+def timed(name):
+    """
+    装饰器: 把整个函数作为一个阶段记录
+
+    第一个位置参数为字符串时 (通常是文件路径) 记为 file 标签。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            labels = {'file': args[0]} if args and isinstance(args[0], str) else {}
+            with stage(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def step(name):
+    """
+    累计当前阶段内一个子步骤的耗时 (同名步骤多次进入时相加)
+
+    在热循环中应按批次进入 (如每读取一批行)，而不是每行进入一次。
+    没有正在运行的阶段时只执行代码块。
+    """
+    stack = _stack()
+    if not stack:
+        yield
+        return
+    steps = stack[-1]['steps']
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        steps[name] = steps.get(name, 0.0) + time.perf_counter() - start
+
+def count(key, value=1):
+    """给当前阶段的计数器累加 (没有正在运行的阶段时忽略)"""
+    stack = _stack()
+    if stack:
+        counters = stack[-1]['counters']
+        counters[key] = counters.get(key, 0) + value
+
+def count_file(key, path):
+    """把文件大小计入当前阶段的字节计数 (如 bytes_read / bytes_written)"""
+    try:
+        count(key, os.path.getsize(path))
+    except OSError:
+        pass
+
+def sample_memory(record=None):
+    """采样当前 RSS，更新当前阶段的最大值"""
+    stack = _stack()
+    record = record or (stack[-1] if stack else None)
+    rss = current_rss_bytes()
+    if record is not None and rss is not None:
+        record['rss_max_sample_bytes'] = max(record.get('rss_max_sample_bytes') or 0, rss)
+    return rss
+
+def throughput(record, key='rows'):
+    """阶段吞吐量 (每秒计数)"""
+    wall = record.get('wall_seconds') or 0
+    value = record.get('counters', {}).get(key)
+    return value / wall if wall and value is not None else None
+
+def dump(path=None):
+    """把本进程的阶段记录 (最近 MAX_RECORDS 条) 追加写入 JSON 行文件"""
+    path = path or os.environ.get(METRICS_FILE_ENV)
+    if not path or not records:
+        return
+    with _lock:
+        lines = [json.dumps(r, ensure_ascii=False) + '\n' for r in records]
+        records.clear()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.writelines(lines)
+
+def load(path):
+    """读取 dump() 写出的记录"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+atexit.register(dump)
+
+class Histogram:
+    """Prometheus 风格的累积直方图 (按标签分组)"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label='stage'):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self.series = {}
+
+    def observe(self, value, label_value=''):
+        counts, total = self.series.get(label_value, ([0] * len(self.buckets), [0.0, 0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        total[0] += value
+        total[1] += 1
+        self.series[label_value] = (counts, total)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total) in sorted(self.series.items()):
+            prefix = f'{self.label}="{_escape(label_value)}",' if label_value else ''
+            for bound, n in zip(self.buckets, counts):
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {n}')
+            labels = f'{{{prefix.rstrip(",")}}}' if prefix else ''
+            lines.append(f"{self.name}_sum{labels} {total[0]:.6f}")
+            lines.append(f"{self.name}_count{labels} {total[1]}")
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# gauge 名称 -> 说明
+GAUGE_HELP = {
+    'ble_stage_rows_per_second': '最近一次阶段运行的吞吐量 (行/秒)',
+    'ble_stage_peak_rss_bytes': '最近一次阶段运行结束时进程的峰值 RSS (字节)',
+    'ble_stage_rss_max_sample_bytes': '最近一次阶段运行期间采样到的最大 RSS (字节)',
+}
+
+class MetricsCollector:
+    """
+    汇总多个任务的指标并输出 Prometheus 文本格式
+
+    任务耗时、各处理步骤耗时用直方图记录; 子进程阶段记录中的行数/字节数
+    和阶段内子步骤的耗时累加为计数器，最近一次的吞吐量和内存作为 gauge。
+    """
+
+    def __init__(self):
+        self.job_latency = Histogram('ble_job_duration_seconds', '处理任务总耗时', label='status')
+        self.step_latency = Histogram('ble_step_duration_seconds', '处理步骤耗时 (含子进程启动)', label='step')
+        self.stage_latency = Histogram('ble_stage_duration_seconds', '阶段函数耗时')
+        self.jobs = {}
+        self.counters = {}
+        self.step_seconds = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe_job(self, seconds, status):
+        with self._lock:
+            self.job_latency.observe(seconds, status)
+            self.jobs[status] = self.jobs.get(status, 0) + 1
+
+    def observe_step(self, step, seconds):
+        with self._lock:
+            self.step_latency.observe(seconds, step)
+
+    def observe_record(self, record):
+        stage_name = record['stage']
+        with self._lock:
+            self.stage_latency.observe(record.get('wall_seconds', 0.0), stage_name)
+            for key, value in record.get('counters', {}).items():
+                series = (key, stage_name)
+                self.counters[series] = self.counters.get(series, 0) + value
+            for step_name, seconds in record.get('steps', {}).items():
+                series = (stage_name, step_name)
+                self.step_seconds[series] = self.step_seconds.get(series, 0.0) + seconds
+            rate = throughput(record)
+            if rate is not None:
+                self.gauges[('ble_stage_rows_per_second', stage_name)] = rate
+            if record.get('peak_rss_bytes'):
+                self.gauges[('ble_stage_peak_rss_bytes', stage_name)] = record['peak_rss_bytes']
+            if record.get('rss_max_sample_bytes'):
+                self.gauges[('ble_stage_rss_max_sample_bytes', stage_name)] = record['rss_max_sample_bytes']
+
+    def render(self):
+        with self._lock:
+            lines = []
+            lines += self.job_latency.render()
+            lines += self.step_latency.render()
+            lines += self.stage_latency.render()
+
+            lines += ["# HELP ble_jobs_total 处理任务数", "# TYPE ble_jobs_total counter"]
+            for status, n in sorted(self.jobs.items()):
+                lines.append(f'ble_jobs_total{{status="{_escape(status)}"}} {n}')
+
+            for key in sorted({k for k, _ in self.counters}):
+                name = f"ble_stage_{key}_total"
+                lines += [f"# HELP {name} 阶段累计 {key}", f"# TYPE {name} counter"]
+                for (k, stage_name), value in sorted(self.counters.items()):
+                    if k == key:
+                        lines.append(f'{name}{{stage="{_escape(stage_name)}"}} {value}')
+
+            if self.step_seconds:
+                name = 'ble_stage_step_seconds_total'
+                lines += [f"# HELP {name} 阶段内子步骤 (读取 / 解析 / 写入等) 累计耗时",
+                          f"# TYPE {name} counter"]
+                for (stage_name, step_name), seconds in sorted(self.step_seconds.items()):
+                    lines.append(f'{name}{{stage="{_escape(stage_name)}",step="{_escape(step_name)}"}} '
+                                 f'{seconds:.6f}')
+
+            for gauge in sorted({g for g, _ in self.gauges}):
+                lines += [f"# HELP {gauge} {GAUGE_HELP.get(gauge, gauge)}", f"# TYPE {gauge} gauge"]
+                for (g, stage_name), value in sorted(self.gauges.items()):
+                    if g == gauge:
+                        lines.append(f'{gauge}{{stage="{_escape(stage_name)}"}} {value:.6g}')
+        return '\n'.join(lines) + '\n'
+
+def summarize(stage_records):
+    """把阶段记录整理为任务结果中展示的摘要"""
+    summary = []
+    for r in stage_records:
+        summary.append({
+            'stage': r['stage'],
+            'parent': r.get('parent'),
+            'labels': r.get('labels', {}),
+            'wall_seconds': round(r.get('wall_seconds', 0.0), 4),
+            'cpu_seconds': round(r.get('cpu_seconds', 0.0), 4),
+            'peak_rss_mb': round((r.get('peak_rss_bytes') or 0) / 1e6, 1),
+            'max_rss_sample_mb': round((r.get('rss_max_sample_bytes') or 0) / 1e6, 1),
+            'steps': {k: round(v, 4) for k, v in r.get('steps', {}).items()},
+            'counters': r.get('counters', {}),
+            'rows_per_second': throughput(r),
+            'profile': r.get('profile'),
+        })
+    return summary
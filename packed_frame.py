@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+多样本打包帧 (Cmd 0x02)
+
+原协议每帧只携带一个样本 (80 字节)，其中 GPS 恒为 0、气压只在少数行有效。
+打包帧沿用相同的帧头与 CRC，但一帧携带最多 MAX_SAMPLES 个样本:
+
+    Header(2) 55 AA + Cmd(1) 02 + Len(1) + Payload(Len) + CRC16(2)
+    CRC 范围与原协议相同: Cmd + Len + Payload
+
+Payload (版本 1):
+    version  u8       PACKED_VERSION
+    count    u8       样本数 K
+    t0       u64      第一个样本的时间戳
+    K 个样本，每个样本依次为:
+      mask   varint   字段存在位图 (bit i 对应 FIELD_NAMES[i]，值为 0 的字段不存在)
+      dt     varint   与上一个样本的时间戳差 (zigzag，第一个样本没有)
+      值     varint   mask 中每个存在字段: 与帧内该字段上一个存在值的差 (zigzag，初值 0)
+
+不存在的字段解码为 0，与原协议中缺失/GPS 字段填 0 的规则一致，因此编码无损。
+每帧独立解码 (差分状态不跨帧)，丢失一帧不会影响其他帧。帧长不超过
+MAX_FRAME_LEN，一个 ATT_MTU=247 的 BLE 通知即可承载。
+"""
+import struct
+
+import bin_to_csv
+
+HEADER0 = bin_to_csv.HEADER0
+HEADER1 = bin_to_csv.HEADER1
+CMD_PACKED = 0x02
+PACKED_VERSION = 1
+
+# Payload 中时间戳之后的字段 (与原协议 Payload 顺序一致)
+FIELD_NAMES = [name for name, _ in bin_to_csv.FRAME_FIELDS[5:-1]]
+
+# 每帧最多样本数 / 最大 Payload 长度 (帧长 = Payload + 6)
+MAX_SAMPLES = 32
+MAX_PAYLOAD = 238
+MAX_FRAME_LEN = MAX_PAYLOAD + 6
+
+SYNC_PATTERN = bytes([HEADER0, HEADER1, CMD_PACKED])
+
+# 版本 + 样本数 + t0
+_PAYLOAD_HEAD = struct.Struct('<BBQ')
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+def _unzigzag(z):
+    return z >> 1 if not z & 1 else -((z + 1) >> 1)
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _get_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def _frame(payload):
+    body = bytes([CMD_PACKED, len(payload)]) + payload
+    return bytes([HEADER0, HEADER1]) + body + struct.pack('<H', bin_to_csv.calculate_crc16(body))
+
+class PackedEncoder:
+    """
+    把样本流打包为 Cmd 0x02 帧
+
+        encoder = PackedEncoder()
+        for ts, values in samples:
+            for frame in encoder.add(ts, values):
+                f.write(frame)
+        f.write(encoder.flush() or b'')
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES, max_payload=MAX_PAYLOAD):
+        self.max_samples = max_samples
+        self.max_payload = max_payload
+        self.frames = 0
+        self.samples = 0
+        self._reset()
+
+    def _reset(self):
+        self._body = bytearray()
+        self._count = 0
+        self._t0 = None
+        self._last_ts = None
+        self._prev = [0] * len(FIELD_NAMES)
+
+    def _encode_sample(self, ts, values):
+        """按当前帧内状态编码一个样本，返回 (字节, 更新后的各字段上一个值)"""
+        out = bytearray()
+        mask = 0
+        for i, v in enumerate(values):
+            if v:
+                mask |= 1 << i
+        _put_varint(out, mask)
+        if self._count:
+            _put_varint(out, _zigzag(ts - self._last_ts))
+        prev = list(self._prev)
+        for i, v in enumerate(values):
+            if v:
+                _put_varint(out, _zigzag(v - prev[i]))
+                prev[i] = v
+        return out, prev
+
+    def add(self, ts, values):
+        """加入一个样本，返回因此完成的帧列表 (0 或 1 个)"""
+        done = []
+        encoded, prev = self._encode_sample(ts, values)
+        if self._count and (self._count >= self.max_samples or
+                            _PAYLOAD_HEAD.size + len(self._body) + len(encoded) > self.max_payload):
+            done.append(self.flush())
+            encoded, prev = self._encode_sample(ts, values)
+        if self._count == 0:
+            self._t0 = ts
+        self._body += encoded
+        self._prev = prev
+        self._last_ts = ts
+        self._count += 1
+        self.samples += 1
+        return done
+
+    def flush(self):
+        """输出当前未满的帧 (没有样本时返回 None)"""
+        if not self._count:
+            return None
+        payload = _PAYLOAD_HEAD.pack(PACKED_VERSION, self._count, self._t0) + bytes(self._body)
+        self._reset()
+        self.frames += 1
+        return _frame(payload)
+
+def decode_payload(payload):
+    """
+    解码打包帧的 Payload
+    :return: [(时间戳, [17 个字段整数值]), ...]
+    """
+    version, count, ts = _PAYLOAD_HEAD.unpack_from(payload, 0)
+    if version != PACKED_VERSION:
+        raise ValueError(f"不支持的打包帧版本: {version}")
+    pos = _PAYLOAD_HEAD.size
+    prev = [0] * len(FIELD_NAMES)
+    samples = []
+    for k in range(count):
+        mask, pos = _get_varint(payload, pos)
+        if k:
+            dt, pos = _get_varint(payload, pos)
+            ts += _unzigzag(dt)
+        values = [0] * len(FIELD_NAMES)
+        i = 0
+        while mask:
+            if mask & 1:
+                delta, pos = _get_varint(payload, pos)
+                prev[i] += _unzigzag(delta)
+                values[i] = prev[i]
+            mask >>= 1
+            i += 1
+        samples.append((ts, values))
+    if pos != len(payload):
+        raise ValueError(f"Payload 长度不符: 解码到 {pos}, 实际 {len(payload)}")
+    return samples
+
+def is_packed_file(bin_path):
+    """文件第一帧是否为打包帧"""
+    with open(bin_path, 'rb') as f:
+        head = f.read(3)
+    return head == SYNC_PATTERN
+
+def iter_frames(buf):
+    """
+    逐帧解析字节流 (同时支持 Cmd 0x01 单样本帧和 Cmd 0x02 打包帧)
+
+    帧头、长度或 CRC 不正确时向后搜索下一个 55 AA 重新同步。
+    :return: 迭代器，产生 ('frame', 偏移, 帧长, [(时间戳, 值列表), ...])
+             或 ('skip', 起始偏移, 结束偏移, None)
+    """
+    size = len(buf)
+    pos = 0
+    skip_start = None
+    while pos + 6 <= size:
+        frame_len = None
+        if buf[pos] == HEADER0 and buf[pos + 1] == HEADER1:
+            cmd, length = buf[pos + 2], buf[pos + 3]
+            if cmd == bin_to_csv.CMD_TYPE and length == bin_to_csv.PAYLOAD_LEN:
+                frame_len = bin_to_csv.FRAME_LEN
+            elif cmd == CMD_PACKED:
+                frame_len = length + 6
+        if frame_len is not None and pos + frame_len <= size:
+            body = bytes(buf[pos + 2:pos + frame_len - 2])
+            crc = struct.unpack_from('<H', buf, pos + frame_len - 2)[0]
+            if bin_to_csv.calculate_crc16(body) == crc:
+                try:
+                    if body[0] == CMD_PACKED:
+                        samples = decode_payload(body[2:])
+                    else:
+                        unpacked = struct.unpack(bin_to_csv.PAYLOAD_FMT, body[2:])
+                        samples = [(unpacked[0], list(unpacked[1:]))]
+                except (ValueError, IndexError, struct.error):
+                    samples = None
+                if samples is not None:
+                    if skip_start is not None:
+                        yield 'skip', skip_start, pos, None
+                        skip_start = None
+                    yield 'frame', pos, frame_len, samples
+                    pos += frame_len
+                    continue
+        if skip_start is None:
+            skip_start = pos
+        next_pos = buf.find(bytes([HEADER0, HEADER1]), pos + 1)
+        pos = next_pos if next_pos >= 0 else size
+    if skip_start is None and pos < size:
+        skip_start = pos
+    if skip_start is not None:
+        yield 'skip', skip_start, size, None
+
+def scan_timeline(buf):
+    """
+    扫描打包帧文件，供回放使用
+    :return: (各帧起始偏移, 各帧结束偏移, 各帧最后一个样本的时间戳) 三个 int64 数组
+    """
+    import numpy as np
+    starts, ends, times = [], [], []
+    for kind, offset, length, samples in iter_frames(buf):
+        if kind == 'frame':
+            starts.append(offset)
+            ends.append(offset + length)
+            # 设备攒够 K 个样本后才发送，因此按最后一个样本的时间回放
+            times.append(samples[-1][0])
+    return (np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+            np.array(times, dtype=np.int64))
@@ -0,0 +1,660 @@
+#!/usr/bin/env python3
+"""
+实时回放 .bin 帧 (模拟在线 BLE 设备)
+
+以 mmap 方式打开 csv_to_bin 生成的 bin 文件，按帧内 uint64 时间戳的节奏
+把 80 字节帧发送到本地 TCP / UDP / Unix socket 或伪终端 (pty)。
+打包帧文件 (Cmd 0x02，见 packed_frame.py) 按每帧最后一个样本的时间戳发送:
+
+    python3 playback.py WTR1_data/WTR1_50hz.bin --target tcp://127.0.0.1:9000
+    python3 playback.py WTR1_data/WTR1_50hz.bin --target udp://127.0.0.1:9001 --speed 10
+    python3 playback.py WTR1_data/WTR1_50hz.bin --target unix:///tmp/ble.sock --speed 0
+    python3 playback.py WTR1_data/WTR1_50hz.bin --target pty --loop
+
+多个文件在同一时钟上同步回放，每个设备一个输出端 (端口依次加一):
+
+    python3 playback.py WTR1_data/WTR1_50hz.bin WTL1_data/WTL1_50hz.bin WTB1_data/WTB1_50hz.bin \\
+        --target udp://127.0.0.1:9001 --speed 20
+
+- 调度按绝对时间计算: 第 i 帧的发送时刻 = 起始时刻 + (t_i - t_0) / speed，
+  不累加每帧的 sleep 误差；asyncio.sleep 醒得早一点，最后 SPIN_SECONDS 忙等，
+  抖动可稳定在亚毫秒级。speed=0 表示不限速 (尽快发送)
+- 已到期的多帧合并为一次写入 (高倍速时)
+- 背压: 接收端读得慢、发送缓冲超过 HIGH_WATER 时，wait 策略暂停回放等待缓冲
+  排空 (停顿超过 REBASE_SECONDS 后重新对齐时钟，不会突发补发)，drop 策略
+  跳过该接收端并计数
+- 结束时输出发送帧数、实际速率、发送时刻相对计划时刻的延迟分布 (抖动)
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+import bin_to_csv
+import metrics
+import stage_log
+
+FRAME_LEN = bin_to_csv.FRAME_LEN
+
+# 最后多长时间改为忙等 (秒)
+SPIN_SECONDS = 0.002
+
+# 发送缓冲高水位 (字节)
+HIGH_WATER = 64 * 1024
+
+# 背压停顿超过该时长 (秒) 后重新对齐回放时钟
+REBASE_SECONDS = 0.1
+
+# 单次写入的最大帧数 (不限速或大量帧同时到期时)
+MAX_BATCH_FRAMES = 256
+
+# 抖动统计的缓冲长度 (攒够后合并进统计)
+JITTER_FLUSH = 4096
+
+BACKPRESSURE_POLICIES = ('wait', 'drop')
+
+# 回放结束后等待输出端排空的宽限时间 (秒)；BLE 链路模拟另加按剩余队列估算的发送时间
+LINK_FLUSH_SECONDS = 5.0
+
+class _FlowProtocol(asyncio.Protocol):
+    """只写协议: 跟踪传输层的暂停/恢复 (写缓冲高低水位)"""
+
+    def __init__(self, on_made=None, on_lost=None):
+        self.transport = None
+        self.closed = False
+        self._on_made = on_made
+        self._on_lost = on_lost
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=HIGH_WATER)
+        if self._on_made:
+            self._on_made(self)
+
+    def pause_writing(self):
+        self._writable.clear()
+
+    def resume_writing(self):
+        self._writable.set()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._writable.set()
+        if self._on_lost:
+            self._on_lost(self)
+
+    @property
+    def paused(self):
+        return not self._writable.is_set()
+
+    async def drain(self):
+        await self._writable.wait()
+
+    def data_received(self, data):
+        pass
+
+    def datagram_received(self, data, addr):
+        pass
+
+    def error_received(self, exc):
+        pass
+
+class Sink:
+    """
+    回放输出端
+
+    target 取值:
+      tcp://host:port   监听 TCP 端口，向所有已连接的客户端发送
+      unix:///path      监听 Unix socket，向所有已连接的客户端发送
+      udp://host:port   向该地址发送 UDP 数据报 (每帧一个数据报)
+      pty               创建伪终端，向主端写入 (从端路径打印在终端上)
+    """
+
+    def __init__(self, target, policy='wait'):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"未知的背压策略: {policy}")
+        self.target = target
+        self.policy = policy
+        self.clients = []
+        self.dropped_frames = 0
+        self.bytes_sent = 0
+        self.description = target
+        self.datagram = False
+        self._server = None
+        self._client_event = asyncio.Event()
+        self._pty_fds = ()
+
+    def _new_protocol(self):
+        return _FlowProtocol(on_made=self._add_client, on_lost=self._remove_client)
+
+    def _add_client(self, protocol):
+        self.clients.append(protocol)
+        self._client_event.set()
+
+    def _remove_client(self, protocol):
+        if protocol in self.clients:
+            self.clients.remove(protocol)
+
+    async def start(self, wait_clients=1):
+        """打开输出端；TCP / Unix 监听模式下等待 wait_clients 个客户端连接"""
+        loop = asyncio.get_running_loop()
+        url = urlparse(self.target)
+        if url.scheme == 'tcp':
+            self._server = await loop.create_server(self._new_protocol, url.hostname or '127.0.0.1', url.port)
+            self.description = f"tcp://{url.hostname or '127.0.0.1'}:{url.port}"
+        elif url.scheme == 'unix':
+            path = url.path
+            if os.path.exists(path):
+                os.unlink(path)
+            self._server = await loop.create_unix_server(self._new_protocol, path)
+        elif url.scheme == 'udp':
+            await loop.create_datagram_endpoint(self._new_protocol, remote_addr=(url.hostname, url.port))
+            self.datagram = True
+            wait_clients = 0
+        elif self.target == 'pty':
+            import pty
+            import tty
+            master, slave = pty.openpty()
+            # 原始模式: 不做换行转换、回显等处理
+            tty.setraw(slave)
+            self._pty_fds = (master, slave)
+            self.description = os.ttyname(slave)
+            await loop.connect_write_pipe(self._new_protocol, os.fdopen(master, 'wb', buffering=0))
+            wait_clients = 0
+        else:
+            raise ValueError(f"不支持的输出目标: {self.target}")
+
+        print(f"➜ 输出: {self.description}")
+        if wait_clients:
+            print(f"  等待 {wait_clients} 个客户端连接...")
+            while len(self.clients) < wait_clients:
+                self._client_event.clear()
+                await self._client_event.wait()
+
+    @property
+    def listening(self):
+        """TCP / Unix 监听模式"""
+        return self._server is not None
+
+    @property
+    def blocked(self):
+        return any(c.paused for c in self.clients)
+
+    @property
+    def undelivered_frames(self):
+        """已提交但未写出的帧数 (直接写入传输层，总为 0)"""
+        return 0
+
+    def send(self, data, frames, bounds=None):
+        """
+        写入所有接收端；drop 策略下跳过写缓冲已满的接收端
+        :param bounds: 各帧在 data 中的 (起, 止) 偏移 (帧长不固定时，UDP 按它逐帧发送)
+        """
+        for client in list(self.clients):
+            if client.closed:
+                continue
+            if self.policy == 'drop' and client.paused:
+                self.dropped_frames += frames
+                continue
+            if self.datagram:
+                for start, end in bounds or ((a, a + FRAME_LEN) for a in range(0, len(data), FRAME_LEN)):
+                    client.transport.sendto(data[start:end])
+            else:
+                client.transport.write(data)
+            self.bytes_sent += len(data)
+
+    async def drain(self):
+        for client in list(self.clients):
+            await client.drain()
+
+    async def flush(self, timeout=None):
+        """等待写缓冲排空 (或超时)"""
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def close(self):
+        for client in self.clients:
+            if client.transport is not None:
+                client.transport.close()
+        if self._server is not None:
+            self._server.close()
+        for fd in self._pty_fds[1:]:
+            os.close(fd)
+
+class JitterStats:
+    """发送时刻相对计划时刻的延迟统计 (秒)"""
+
+    def __init__(self):
+        from dataset_stats import RunningStats
+        self.stats = RunningStats()
+        self._buffer = []
+
+    def add(self, values):
+        self._buffer.extend(values)
+        if len(self._buffer) >= JITTER_FLUSH:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.stats.update(self._buffer)
+            self._buffer = []
+
+    def summary(self):
+        self.flush()
+        s = self.stats
+        if s.count == 0:
+            return {}
+        to_us = lambda v: round(v * 1e6, 1)
+        return {
+            'count': s.count,
+            'mean_us': to_us(s.mean),
+            'p50_us': to_us(s.quantile(0.5)),
+            'p99_us': to_us(s.quantile(0.99)),
+            'max_us': to_us(s.max),
+        }
+
+def load_timeline(bin_path, first_frame=0):
+    """
+    mmap 打开 bin 文件
+    :param first_frame: 从该帧开始 (之前的帧不读取)
+    :return: (逐帧原始字节 memoryview, 各帧时间戳 (微秒, int64 数组))
+    """
+    import numpy as np
+    import bin_archive
+    if bin_archive.is_archive(bin_path):
+        # 只解压起始帧所在块及之后的块
+        with bin_archive.ArchiveReader(bin_path) as reader:
+            frames = reader.load_frames(first_frame)
+    else:
+        frames = bin_to_csv.load_frames(bin_path)[first_frame:]
+    if len(frames) == 0:
+        return memoryview(b''), np.zeros(0, dtype=np.int64)
+    return memoryview(frames.view(np.uint8).reshape(-1)), _to_us(frames['time'].astype(np.int64))
+
+def _to_us(times):
+    """13 位毫秒时间戳统一为微秒"""
+    import numpy as np
+    return np.where((times > 0) & (times < 10**14), times * 1000, times)
+
+def load_packed_timeline(bin_path, start_us=None):
+    """
+    mmap 打开打包帧 (Cmd 0x02) 文件，帧长不固定，需要逐帧扫描一次
+    :param start_us: 从最后一个样本不早于该时间戳 (微秒) 的帧开始
+    :return: (原始字节 memoryview, 各帧起止字节偏移, 各帧时间戳 (微秒), 起始帧序号)
+    """
+    import numpy as np
+    import packed_frame
+    buf = bin_to_csv._open_bin(bin_path)
+    starts, ends, times = packed_frame.scan_timeline(buf)
+    times = _to_us(times)
+    first = int(np.searchsorted(times, start_us, side='left')) if start_us is not None else 0
+    return memoryview(buf), starts[first:], ends[first:], times[first:], first
+
+def device_name(bin_path):
+    """'WTR1_data/WTR1_50hz.bin' -> 'WTR1'"""
+    return os.path.basename(bin_path).split('.')[0].split('_')[0]
+
+def _time_index(bin_path):
+    """bin 文件的 .idx 索引或 .binz 归档的读取器 (两者的定位接口相同)"""
+    import contextlib
+    import bin_archive
+    import bin_index
+    if bin_archive.is_archive(bin_path):
+        return bin_archive.ArchiveReader(bin_path)
+    return contextlib.nullcontext(bin_index.get_index(bin_path))
+
+def start_frame(bin_path, start_us):
+    """用 .idx 索引 (.binz 归档用其块索引) 定位时间戳 (微秒) 不早于 start_us 的第一帧"""
+    with _time_index(bin_path) as index:
+        if index.ticks == 1000:
+            start_us //= 1000
+        return index.seek(start_us)
+
+def first_time_us(bin_path):
+    """bin 文件首帧时间戳 (微秒)"""
+    import packed_frame
+    if packed_frame.is_packed_file(bin_path):
+        for kind, _, _, samples in packed_frame.iter_frames(bin_to_csv._open_bin(bin_path)):
+            if kind == 'frame':
+                return int(_to_us(samples[0][0]))
+        return 0
+    with _time_index(bin_path) as index:
+        return index.first_time * (1_000_000 // index.ticks)
+
+class Stream:
+    """一个设备的帧流: mmap 的帧数据、共享时钟上的时间偏移 (秒) 和输出端"""
+
+    def __init__(self, bin_path, sink, name=None, start_us=None):
+        """:param start_us: 从该时间戳 (微秒) 开始回放 (通过 .idx 索引定位，不扫描文件)"""
+        self.path = bin_path
+        self.sink = sink
+        self.name = name or device_name(bin_path)
+        import packed_frame
+        self.packed = packed_frame.is_packed_file(bin_path)
+        if self.packed:
+            # 打包帧长度不固定，记录每帧的起止字节偏移 (没有 .idx 索引)
+            self.raw, self.starts, self.ends, self.times, self.first_frame = \
+                load_packed_timeline(bin_path, start_us)
+        else:
+            self.first_frame = start_frame(bin_path, start_us) if start_us is not None else 0
+            self.raw, self.times = load_timeline(bin_path, self.first_frame)
+        self.offsets = None
+        self.played = 0
+        self.jitter = JitterStats()
+        self.max_lateness = 0.0
+
+    def __len__(self):
+        return len(self.times)
+
+    def chunk(self, i, j):
+        """第 i ~ j-1 帧的原始字节，以及各帧在其中的 (起, 止) 偏移 (定长帧为 None)"""
+        if self.packed:
+            base = int(self.starts[i])
+            bounds = list(zip((self.starts[i:j] - base).tolist(), (self.ends[i:j] - base).tolist()))
+            return self.raw[base:int(self.ends[j - 1])], bounds
+        return self.raw[i * FRAME_LEN:j * FRAME_LEN], None
+
+async def sleep_until(target, spin=SPIN_SECONDS):
+    """睡到 target (perf_counter 时刻)；最后 spin 秒忙等以减小抖动"""
+    delay = target - time.perf_counter()
+    if delay > spin:
+        await asyncio.sleep(delay - spin)
+    while time.perf_counter() < target:
+        pass
+
+async def play_streams(streams, speed=1.0, loop=False, spin=SPIN_SECONDS, duration=None):
+    """
+    在同一时钟上回放多个设备的帧流
+
+    各流按时间戳做基于堆的 k 路归并: 堆中保存每个流下一帧的时间偏移，弹出最早
+    的流后，用 searchsorted 一次取出该流在 "已到期且不晚于其他流下一帧" 范围内
+    的连续帧写入它自己的输出端，再把它的下一帧放回堆中。所有流共用一个起始时刻，
+    同一时刻到期的各设备帧在同一轮发送。设备间偏差按 "同一采样时刻 (相差不到
+    半个采样周期) 的两个设备帧的发送延迟之差" 统计。
+    :param streams: Stream 列表
+    :param speed: 回放倍速，0 表示不限速
+    :param loop: 播放到结尾后从头继续 (时间轴连续)
+    :param duration: 最长回放时长 (秒，墙钟)，None 表示不限
+    :return: 回放报告字典
+    """
+    import heapq
+    import numpy as np
+
+    streams = [s for s in streams if len(s)]
+    if not streams:
+        print("✗ 没有可回放的帧")
+        return None
+
+    # 共享时钟: 以所有流中最早的时间戳为零点
+    t0 = min(int(s.times[0]) for s in streams)
+    for s in streams:
+        s.offsets = (s.times - t0) / 1e6
+    # 循环回放时，相邻两轮之间隔一个典型采样周期
+    periods = [float(np.median(np.diff(s.offsets))) for s in streams if len(s) > 1]
+    period = min(periods) if periods else 0.0
+    lap = max(s.offsets[-1] for s in streams) + period
+    total = sum(len(s) for s in streams)
+
+    sinks = list({id(s.sink): s.sink for s in streams}.values())
+    log = stage_log.StageLog('playback', file=','.join(s.path for s in streams),
+                             target=','.join(sink.description for sink in sinks))
+    skew = JitterStats()
+    # 每个流最近一次发送的 (时间偏移, 发送延迟)，用于统计设备间偏差
+    last_sent = {}
+    stalls = 0
+    sent = 0
+    laps = 0
+    start = base = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    def reset():
+        heap = [(s.offsets[0], k, 0) for k, s in enumerate(streams)]
+        heapq.heapify(heap)
+        return heap
+
+    heap = reset()
+    while True:
+        if not heap:
+            if not loop:
+                break
+            laps += 1
+            heap = reset()
+            if speed > 0:
+                base += lap / speed
+
+        offset, k, i = heapq.heappop(heap)
+        stream = streams[k]
+        # 本次最多发送到其他流的下一帧为止，保证各流按时间顺序交替
+        limit = heap[0][0] if heap else float('inf')
+
+        if speed > 0:
+            target = base + offset / speed
+            if target > time.perf_counter():
+                await sleep_until(target, spin)
+            now = time.perf_counter()
+            # 合并该流已到期的帧 (至少一帧)
+            due = min((now - base) * speed, limit)
+            j = int(np.searchsorted(stream.offsets, due, side='right'))
+            j = min(max(j, i + 1), i + MAX_BATCH_FRAMES, len(stream))
+            lateness = now - (base + stream.offsets[i:j] / speed)
+            stream.jitter.add(lateness.tolist())
+            stream.max_lateness = max(stream.max_lateness, float(lateness.max()))
+            last_sent[k] = (offset, float(lateness[0]))
+            skew.add([abs(last_sent[k][1] - other_lateness)
+                      for other, (other_offset, other_lateness) in last_sent.items()
+                      if other != k and abs(other_offset - offset) < period / 2])
+        else:
+            j = int(np.searchsorted(stream.offsets, limit, side='right'))
+            j = min(max(j, i + 1), i + MAX_BATCH_FRAMES, len(stream))
+            now = time.perf_counter()
+
+        data, bounds = stream.chunk(i, j)
+        stream.sink.send(data, j - i, bounds)
+        stream.played += j - i
+        sent += j - i
+        if j < len(stream):
+            heapq.heappush(heap, (stream.offsets[j], k, j))
+        log.progress(sent, None if loop else total)
+
+        blocked = [sink for sink in sinks if sink.blocked and sink.policy == 'wait']
+        if blocked:
+            stall_start = time.perf_counter()
+            for sink in blocked:
+                await sink.drain()
+            stalled = time.perf_counter() - stall_start
+            # 停顿过长: 整体后移时钟，避免恢复后突发补发
+            if speed > 0 and stalled > REBASE_SECONDS:
+                base += stalled
+                stalls += 1
+        elif speed <= 0:
+            # 不限速时也要让出事件循环 (接受连接、处理断开)
+            await asyncio.sleep(0)
+
+        if deadline and now >= deadline:
+            break
+        listening = [sink for sink in sinks if sink.listening]
+        if listening and not any(sink.clients for sink in listening):
+            print("  ⚠️ 所有客户端已断开，停止回放")
+            break
+
+    elapsed = time.perf_counter() - start
+    # 等输出端 (含 BLE 链路模拟队列) 排空后再统计，字节数与链路统计一致
+    await asyncio.gather(*(sink.flush(LINK_FLUSH_SECONDS) for sink in sinks))
+    dropped = sum(sink.dropped_frames for sink in sinks)
+    undelivered = sum(sink.undelivered_frames for sink in sinks)
+    bytes_sent = sum(sink.bytes_sent for sink in sinks)
+    report = {
+        'speed': speed,
+        'frames_played': sent,
+        'laps': laps,
+        'elapsed_seconds': round(elapsed, 3),
+        'frames_per_second': round(sent / elapsed, 2) if elapsed else None,
+        'bytes_sent': bytes_sent,
+        'dropped_frames': dropped,
+        'undelivered_frames': undelivered,
+        'stalls': stalls,
+        'sample_period_us': round(period * 1e6, 1),
+        'streams': [{
+            'device': s.name,
+            'file': s.path,
+            'first_frame': s.first_frame,
+            'target': s.sink.description,
+            'frames_played': s.played,
+            'lateness': s.jitter.summary(),
+        } for s in streams],
+    }
+    if speed > 0 and len(streams) > 1:
+        # 偏差与回放倍速下的采样周期 (墙钟) 比较
+        report['wall_sample_period_us'] = round(period / speed * 1e6, 1)
+        report['skew'] = skew.summary()
+    metrics.count('rows', sent)
+    metrics.count('bytes_written', bytes_sent)
+    log.finish(ok=dropped == 0 and undelivered == 0, frames=sent, dropped=dropped,
+               undelivered=undelivered, stalls=stalls)
+    return report
+
+async def play(bin_path, sink, speed=1.0, loop=False, spin=SPIN_SECONDS, duration=None, start=None):
+    """
+    按时间戳节奏回放一个 bin 文件 (参数见 play_streams)
+    :param start: 从相对首帧 start 秒处开始
+    """
+    start_us = first_time_us(bin_path) + int(start * 1e6) if start else None
+    return await play_streams([Stream(bin_path, sink, start_us=start_us)], speed, loop, spin, duration)
+
+def print_report(report):
+    print()
+    print("=" * 60)
+    print("回放完成")
+    print("=" * 60)
+    print(f"  回放帧数: {report['frames_played']} (循环 {report['laps']} 轮)")
+    print(f"  耗时: {report['elapsed_seconds']} 秒, 实际速率: {report['frames_per_second']} 帧/秒")
+    print(f"  发送字节: {report['bytes_sent']}, 丢弃帧: {report['dropped_frames']}, 背压停顿: {report['stalls']}")
+    if report['undelivered_frames']:
+        print(f"  ⚠️ 未送达帧: {report['undelivered_frames']} (结束时仍在输出端队列中)")
+    for stream in report['streams']:
+        lateness = stream['lateness']
+        prefix = f"  [{stream['device']}] {stream['target']}: {stream['frames_played']} 帧"
+        if lateness:
+            print(f"{prefix}, 发送延迟 平均 {lateness['mean_us']} µs, P50 {lateness['p50_us']} µs, "
+                  f"P99 {lateness['p99_us']} µs, 最大 {lateness['max_us']} µs")
+        else:
+            print(prefix)
+    if report.get('skew'):
+        skew = report['skew']
+        ok = skew['p99_us'] <= report['wall_sample_period_us']
+        print(f"  设备间偏差: P50 {skew['p50_us']} µs, P99 {skew['p99_us']} µs, 最大 {skew['max_us']} µs "
+              f"(当前倍速下采样周期 {report['wall_sample_period_us']} µs) {'✓' if ok else '⚠️'}")
+    if report.get('links'):
+        import ble_link
+        for link in report['links']:
+            ble_link.print_summary(link, label=f"[{link['device']}] ")
+
+def expand_targets(target, count, names):
+    """
+    为多个设备展开输出目标: tcp/udp 端口依次加一，unix 路径加设备名后缀，
+    pty 每个设备一个
+    """
+    if count == 1:
+        return [target]
+    url = urlparse(target)
+    if url.scheme in ('tcp', 'udp'):
+        host = url.hostname or '127.0.0.1'
+        return [f"{url.scheme}://{host}:{url.port + k}" for k in range(count)]
+    if url.scheme == 'unix':
+        root, ext = os.path.splitext(url.path)
+        return [f"unix://{root}_{name}{ext}" for name in names]
+    return [target] * count
+
+async def _run(args):
+    names = [device_name(path) for path in args.bin_files]
+    targets = args.target if len(args.target) == len(args.bin_files) else \
+        expand_targets(args.target[0], len(args.bin_files), names)
+    sinks = [Sink(target, args.on_backpressure) for target in targets]
+    if args.link:
+        import ble_link
+        # 每个设备一条独立的链路 (种子依次加一)
+        sinks = [ble_link.LinkEmulator(sink, mtu=args.mtu, interval=args.conn_interval_ms / 1000,
+                                       packets_per_event=args.packets_per_event, loss=args.loss,
+                                       reorder=args.reorder, latency=args.latency_ms / 1000,
+                                       latency_jitter=args.latency_jitter_ms / 1000,
+                                       latency_dist=args.latency_dist, seed=args.seed + k)
+                 for k, sink in enumerate(sinks)]
+    try:
+        await asyncio.gather(*(sink.start(args.wait_clients) for sink in sinks))
+        start_us = None
+        if args.start:
+            # 相对所有文件中最早的首帧
+            start_us = min(first_time_us(path) for path in args.bin_files) + int(args.start * 1e6)
+        streams = [Stream(path, sink, name, start_us)
+                   for path, sink, name in zip(args.bin_files, sinks, names)]
+        with metrics.stage('playback', file=','.join(args.bin_files)):
+            report = await play_streams(streams, args.speed, args.loop, args.spin_ms / 1000, args.duration)
+        if report is not None and args.link:
+            # play_streams 已等待链路队列排空
+            report['links'] = [dict(sink.summary(), device=stream.name)
+                               for sink, stream in zip(sinks, streams)]
+        return report
+    finally:
+        for sink in sinks:
+            sink.close()
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='按时间戳实时回放 bin 帧 (多个文件在同一时钟上同步回放)')
+    parser.add_argument('bin_files', nargs='+',
+                        help='csv_to_bin 生成的 bin 文件 (如 WTR1_data/WTR1_50hz.bin WTL1_data/WTL1_50hz.bin)')
+    parser.add_argument('--target', nargs='+', default=['tcp://127.0.0.1:9000'],
+                        help='输出: tcp://host:port, udp://host:port, unix:///path 或 pty；'
+                             '多个文件只给一个目标时按设备展开 (端口依次加一 / 路径加设备名)')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放倍速 (0 = 不限速)')
+    parser.add_argument('--loop', action='store_true', help='循环回放')
+    parser.add_argument('--start', type=float, help='从相对首帧该秒数处开始回放 (使用 .idx 索引定位)')
+    parser.add_argument('--duration', type=float, help='最长回放时长 (秒)')
+    parser.add_argument('--wait-clients', type=int, default=1, help='TCP / Unix 模式下每个输出端开始前等待的客户端数')
+    parser.add_argument('--on-backpressure', choices=BACKPRESSURE_POLICIES, default='wait',
+                        help='接收端读得慢时: wait 暂停回放, drop 丢弃该接收端的帧')
+    parser.add_argument('--spin-ms', type=float, default=SPIN_SECONDS * 1000,
+                        help='每帧发送前忙等的时长 (毫秒，0 = 只用 asyncio.sleep)')
+    parser.add_argument('--json', help='把回放报告写入 JSON 文件')
+    import ble_link
+    link = parser.add_argument_group('BLE 链路模拟 (见 ble_link.py)')
+    link.add_argument('--link', action='store_true', help='在输出端前模拟 BLE 链路')
+    link.add_argument('--mtu', type=int, default=ble_link.DEFAULT_MTU, help='ATT_MTU (每个包最多 MTU-3 字节)')
+    link.add_argument('--conn-interval-ms', type=float, default=ble_link.DEFAULT_CONN_INTERVAL * 1000, help='连接间隔 (毫秒)')
+    link.add_argument('--packets-per-event', type=int, default=ble_link.DEFAULT_PACKETS_PER_EVENT, help='每个连接事件最多发送的包数')
+    link.add_argument('--loss', type=float, default=0.0, help='丢包率 (0~1)')
+    link.add_argument('--reorder', type=float, default=0.0, help='包推迟到下一个连接事件的概率 (0~1)')
+    link.add_argument('--latency-ms', type=float, default=0.0, help='送达时延基准值 (毫秒)')
+    link.add_argument('--latency-jitter-ms', type=float, default=0.0, help='时延分布的离散程度 (毫秒)')
+    link.add_argument('--latency-dist', choices=ble_link.LATENCY_DISTRIBUTIONS, default='normal',
+                      help='时延分布')
+    link.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args()
+
+    for path in args.bin_files:
+        if not os.path.exists(path):
+            print(f"✗ 找不到文件: {path}")
+            sys.exit(1)
+    if len(args.target) not in (1, len(args.bin_files)):
+        parser.error("--target 数量必须为 1 或与文件数量一致")
+
+    try:
+        report = asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        print("\n已中断")
+        sys.exit(130)
+    if report is None:
+        sys.exit(1)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -2,21 +2,20 @@ import json
 import os
 import datetime
 import time
+import shutil
+import struct
+import tempfile
 
 # 输入文件路径
 input_file = 'backend/app/algorithm/other/20250927152940.txt'
 # 输出JSON文件路径
 output_file = 'backend/app/algorithm/other/calibration_data_new.json'
 
-# 检查输入文件是否存在
-if not os.path.exists(input_file):
-    print(f"错误：找不到输入文件 {input_file}")
-    exit(1)
+# 数据字段 (每条记录格式)
+DATA_FIELDS = ["timestamp", "acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"]
 
-# 初始化数据列表
-data_list = []
-device_id = None
-first_timestamp = None
+# 秒级时间前缀 -> 毫秒时间戳 的缓存 (同一秒内的行共享同一前缀)
+_second_cache = {}
 
 def convert_to_timestamp(time_str):
     """将时间字符串转换为毫秒级时间戳"""
@@ -33,86 +32,136 @@ def convert_to_timestamp(time_str):
             print(f"警告：无法解析时间格式: {time_str}")
             return int(time.time() * 1000)  # 使用当前时间作为默认值
 
-print(f"开始读取文件：{input_file}")
-
-# 读取文件内容
-with open(input_file, 'r', encoding='utf-8') as f:
-    # 跳过第一行列名
-    headers = f.readline().strip().split('\t')
-    print(f"找到 {len(headers)} 个列名")
-    
-    # 读取数据行
-    line_count = 0
-    for line in f:
-        line_count += 1
-        values = line.strip().split('\t')
-        
-        # 确保有足够的数据
-        if len(values) >= 9:  # 至少需要时间、设备ID和6个数据字段
-            # 提取时间戳
-            time_str = values[0]
-            timestamp = convert_to_timestamp(time_str)
-            
-            # 记录第一个时间戳
-            if first_timestamp is None:
-                first_timestamp = timestamp
-            
-            # 提取设备ID
-            current_device_id = values[1]
+def convert_to_timestamp_cached(time_str):
+    """
+    带缓存的时间戳转换, 结果与 convert_to_timestamp 一致
+
+    "%Y-%m-%d %H:%M:%S:%f" 的秒级前缀只在缓存未命中时调用 strptime,
+    毫秒部分按 %f 的规则右补零后直接相加。
+    """
+    prefix, sep, frac = time_str.rpartition(':')
+    if sep and prefix.count(':') == 2 and frac.isdigit() and len(frac) <= 6:
+        base_ms = _second_cache.get(prefix)
+        if base_ms is None:
+            try:
+                dt = datetime.datetime.strptime(prefix, "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                return convert_to_timestamp(time_str)
+            base_ms = int(dt.timestamp()) * 1000
+            _second_cache[prefix] = base_ms
+        return base_ms + int(frac.ljust(6, '0')) // 1000
+    return convert_to_timestamp(time_str)
+
+def iter_records(path):
+    """逐行读取 TXT 文件, 生成 (设备ID, [timestamp, ax, ay, az, gx, gy, gz])"""
+    with open(path, 'r', encoding='utf-8') as f:
+        # 跳过第一行列名
+        headers = f.readline().strip().split('\t')
+        print(f"找到 {len(headers)} 个列名")
+
+        line_count = 0
+        for line in f:
+            line_count += 1
+            values = line.strip().split('\t')
+
+            # 确保有足够的数据
+            if len(values) >= 9:  # 至少需要时间、设备ID和6个数据字段
+                timestamp = convert_to_timestamp_cached(values[0])
+
+                # 根据用户提供的meta信息，加速度和角速度数据在第3-8列
+                record = [timestamp,
+                          float(values[2]), float(values[3]), float(values[4]),
+                          float(values[5]), float(values[6]), float(values[7])]
+                yield values[1], record
+
+            # 打印进度
+            if line_count % 100000 == 0:
+                print(f"已处理 {line_count} 行数据")
+
+        print(f"文件读取完成，共处理 {line_count} 行数据")
+
+def convert_txt_to_json(input_path, output_path, sample_rate=100, npy_path=None):
+    """
+    流式转换 TXT -> JSON, 内存占用与数据长度无关
+
+    data 数组逐条写入同目录的临时文件, 结束后再与 meta 拼接成最终文档,
+    因此 meta 中的 device_id / total_count 依旧位于文件开头。
+    :param npy_path: 可选, 同时输出 float64 的 (N, 7) .npy 数据文件
+    :return: 写入的记录数
+    """
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    device_id = None
+    count = 0
+
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8', dir=out_dir) as data_tmp, \
+            tempfile.TemporaryFile(dir=out_dir) as npy_tmp:
+        for current_device_id, record in iter_records(input_path):
             if device_id is None:
                 device_id = current_device_id
-            
-            # 提取传感器数据
-            # 根据用户提供的meta信息，加速度和角速度数据在第3-8列
-            ax = float(values[2])
-            ay = float(values[3])
-            az = float(values[4])
-            gx = float(values[5])
-            gy = float(values[6])
-            gz = float(values[7])
-            
-            # 创建数据记录 [timestamp, ax, ay, az, gx, gy, gz]
-            data_record = [timestamp, ax, ay, az, gx, gy, gz]
-            data_list.append(data_record)
-        
-        # 打印进度
-        if line_count % 1000 == 0:
-            print(f"已处理 {line_count} 行数据")
-
-print(f"文件读取完成，共处理 {line_count} 行数据")
-print(f"成功解析 {len(data_list)} 条数据记录")
-
-# 计算采样率（假设数据是连续的）
-sample_rate = 100  # 默认值
-# if len(data_list) > 1:
-#     time_diff = data_list[1][0] - data_list[0][0]  # 第二条记录与第一条记录的时间差
-#     if time_diff > 0:
-#         sample_rate = int(1000 / time_diff)  # 转换为Hz
-
-# 构造最终的JSON格式
-final_json = {
-    "meta": {
-        "device_id": device_id if device_id else "unknown",
-        "sensor_type": "6-axis",
-        "sample_rate": sample_rate,
-        "data_fields": ["timestamp", "acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z"],
-        "total_count": len(data_list)
-        # 注意：CRC32计算是可选的，这里暂时省略
-    },
-    "data": data_list
-}
-
-# 将数据写入JSON文件
-print(f"开始写入JSON文件：{output_file}")
-with open(output_file, 'w', encoding='utf-8') as f:
-    json.dump(final_json, f, ensure_ascii=False, indent=2)
-
-print(f"JSON文件写入完成！")
-print(f"数据已保存到：{output_file}")
-print(f"JSON文件包含 {len(data_list)} 条数据记录")
-print(f"最终JSON结构：")
-print(f"- meta: 包含设备ID、传感器类型、采样率等元信息")
-print(f"- data: 包含 {len(data_list)} 条记录的数组")
-print(f"每条记录格式: [timestamp, ax, ay, az, gx, gy, gz]")
-print(f"设备ID: {device_id}")
-print(f"采样率: {sample_rate} Hz")
\ No newline at end of file
+
+            data_tmp.write(',\n' if count else '\n')
+            data_tmp.write(json.dumps(record, separators=(',', ':')))
+            if npy_path:
+                npy_tmp.write(struct.pack('<7d', *record))
+            count += 1
+
+        print(f"成功解析 {count} 条数据记录")
+
+        meta = {
+            "device_id": device_id if device_id else "unknown",
+            "sensor_type": "6-axis",
+            "sample_rate": sample_rate,
+            "data_fields": DATA_FIELDS,
+            "total_count": count
+            # 注意：CRC32计算是可选的，这里暂时省略
+        }
+
+        # 拼接最终的JSON文档
+        print(f"开始写入JSON文件：{output_path}")
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('{"meta":')
+            json.dump(meta, f, ensure_ascii=False)
+            f.write(',"data":[')
+            data_tmp.seek(0)
+            shutil.copyfileobj(data_tmp, f)
+            f.write('\n]}\n')
+
+        if npy_path:
+            import numpy as np
+            print(f"开始写入NPY文件：{npy_path}")
+            with open(npy_path, 'wb') as f:
+                header = {'descr': '<f8', 'fortran_order': False, 'shape': (count, len(DATA_FIELDS))}
+                np.lib.format.write_array_header_1_0(f, header)
+                npy_tmp.seek(0)
+                shutil.copyfileobj(npy_tmp, f)
+
+    return count
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='将标定 TXT 数据转换为 JSON')
+    parser.add_argument('input', nargs='?', default=input_file, help='输入的 TXT 文件路径')
+    parser.add_argument('-o', '--output', default=output_file, help='输出的 JSON 文件路径')
+    parser.add_argument('--sample-rate', type=int, default=100, help='写入 meta 的采样率 (Hz)')
+    parser.add_argument('--npy', help='同时输出 .npy 数据文件 (float64, N x 7)')
+    args = parser.parse_args()
+
+    # 检查输入文件是否存在
+    if not os.path.exists(args.input):
+        print(f"错误：找不到输入文件 {args.input}")
+        exit(1)
+
+    print(f"开始读取文件：{args.input}")
+    count = convert_txt_to_json(args.input, args.output, args.sample_rate, args.npy)
+
+    print(f"JSON文件写入完成！")
+    print(f"数据已保存到：{args.output}")
+    print(f"JSON文件包含 {count} 条数据记录")
+    print(f"最终JSON结构：")
+    print(f"- meta: 包含设备ID、传感器类型、采样率等元信息")
+    print(f"- data: 包含 {count} 条记录的数组")
+    print(f"每条记录格式: [timestamp, ax, ay, az, gx, gy, gz]")
+    print(f"采样率: {args.sample_rate} Hz")
+
+if __name__ == '__main__':
+    main()
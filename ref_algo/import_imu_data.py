@@ -1,29 +1,29 @@
 import csv
+import functools
 import os
 import sys
 from pathlib import Path
 from datetime import datetime
 import uuid
-import pandas as pd
-from dotenv import load_dotenv
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 
-# 加载环境变量
-load_dotenv()
+@functools.lru_cache(maxsize=None)
+def get_engine():
+    """数据库连接 (首次使用时加载 .env 并创建，导入模块不连接数据库)"""
+    from dotenv import load_dotenv
+    load_dotenv()
 
-# 数据库连接配置 - 支持DATABASE_URL或单独配置
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-if DATABASE_URL:
-    engine = create_engine(DATABASE_URL)
-else:
+    # 数据库连接配置 - 支持DATABASE_URL或单独配置
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return create_engine(database_url)
     DB_USER = os.getenv('DB_USER', 'postgres')
     DB_PASSWORD = os.getenv('DB_PASSWORD', 'changethis')
     DB_HOST = os.getenv('DB_HOST', 'localhost')
     DB_PORT = os.getenv('DB_PORT', '5432')
     DB_NAME = os.getenv('DB_NAME', 'app')
-    engine = create_engine(f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
+    return create_engine(f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
 
 # 固定的用户、设备、会话ID
 FIXED_USER_ID = "10000000-0000-0000-0000-000000000001"
@@ -77,7 +77,7 @@ def ensure_required_records(conn, session_id=None, device_id=None, user_id=None)
     # 每个表操作使用独立事务，避免一个失败影响其他操作
     # 1. 创建用户记录（如果表存在）
     try:
-        with engine.begin() as user_conn:
+        with get_engine().begin() as user_conn:
             # 检查users表是否存在
             user_table_exists = user_conn.execute(text("""
                 SELECT EXISTS (
@@ -105,7 +105,7 @@ def ensure_required_records(conn, session_id=None, device_id=None, user_id=None)
     
     # 2. 创建设备记录（如果表存在）
     try:
-        with engine.begin() as device_conn:
+        with get_engine().begin() as device_conn:
             # 检查devices表是否存在
             device_table_exists = device_conn.execute(text("""
                 SELECT EXISTS (
@@ -133,7 +133,7 @@ def ensure_required_records(conn, session_id=None, device_id=None, user_id=None)
     
     # 3. 创建滑雪会话记录（如果表存在）
     try:
-        with engine.begin() as session_conn:
+        with get_engine().begin() as session_conn:
             # 检查skiing_sessions表是否存在
             session_table_exists = session_conn.execute(text("""
                 SELECT EXISTS (
@@ -160,129 +160,220 @@ def ensure_required_records(conn, session_id=None, device_id=None, user_id=None)
     return user_id, device_id
 
 
+# 维特英文格式列名 -> 目标列名
+WT_EN_COLUMNS = {
+    'time': 'timestamp',
+    'DeviceName': 'device_name',
+    'AccX(g)': 'acc_x',
+    'AccY(g)': 'acc_y',
+    'AccZ(g)': 'acc_z',
+    'AsX(°/s)': 'gyro_x',
+    'AsY(°/s)': 'gyro_y',
+    'AsZ(°/s)': 'gyro_z',
+    'HX(uT)': 'mag_x',
+    'HY(uT)': 'mag_y',
+    'HZ(uT)': 'mag_z'
+}
+
+# 维特中文格式列名 -> 目标列名
+WT_ZH_COLUMNS = {
+    '时间': 'timestamp',
+    '设备名称': 'device_name',
+    '加速度X(g)': 'acc_x',
+    '加速度Y(g)': 'acc_y',
+    '加速度Z(g)': 'acc_z',
+    '角速度X(°/s)': 'gyro_x',
+    '角速度Y(°/s)': 'gyro_y',
+    '角速度Z(°/s)': 'gyro_z',
+    '磁场X(uT)': 'mag_x',
+    '磁场Y(uT)': 'mag_y',
+    '磁场Z(uT)': 'mag_z'
+}
+
+NUMERIC_COLUMNS = ['acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z', 'mag_x', 'mag_y', 'mag_z']
+
+# 输出列顺序
+COLUMN_ORDER = ['timestamp', 'datetime', 'device_name', 'gyro_x', 'gyro_y', 'gyro_z',
+                'mag_x', 'mag_y', 'mag_z', 'acc_x', 'acc_y', 'acc_z']
+
+# 每次读取的行数 (决定内存工作集大小)
+READ_CHUNK_ROWS = 200_000
+
+
 class IMUDataProcessor:
     """IMU数据处理器"""
     
-    def __init__(self):
-        pass
+    def __init__(self, chunksize=READ_CHUNK_ROWS):
+        self.chunksize = chunksize
     
-    # --- 2. 私有读取器 (基于你提供的逻辑) --- 
-    def _read_wt_imu(self, file_path):
-        """读取WT公司IMU数据文件"""
+    def _detect_wt_dialect(self, columns):
+        """仅根据表头识别列格式
+        
+        Args:
+            columns: 文件表头列名列表
+            
+        Returns:
+            tuple: (格式名 'en'/'zh'/'heuristic', {源列名: 目标列名})
+        """
+        if all(col in columns for col in WT_EN_COLUMNS):
+            return 'en', dict(WT_EN_COLUMNS)
+        if all(col in columns for col in WT_ZH_COLUMNS):
+            return 'zh', dict(WT_ZH_COLUMNS)
+        
+        # 尝试映射常见的列名 (同一目标列只取第一个匹配的源列)
+        column_mapping = {}
+        for col in columns:
+            col_lower = col.lower()
+            if 'time' in col_lower or '时间' in col:
+                target = 'timestamp'
+            elif 'device' in col_lower or '设备' in col:
+                target = 'device_name'
+            elif 'acc' in col_lower and 'x' in col_lower:
+                target = 'acc_x'
+            elif 'acc' in col_lower and 'y' in col_lower:
+                target = 'acc_y'
+            elif 'acc' in col_lower and 'z' in col_lower:
+                target = 'acc_z'
+            elif ('gyro' in col_lower or '角速度' in col) and 'x' in col_lower:
+                target = 'gyro_x'
+            elif ('gyro' in col_lower or '角速度' in col) and 'y' in col_lower:
+                target = 'gyro_y'
+            elif ('gyro' in col_lower or '角速度' in col) and 'z' in col_lower:
+                target = 'gyro_z'
+            elif ('mag' in col_lower or '磁场' in col) and 'x' in col_lower:
+                target = 'mag_x'
+            elif ('mag' in col_lower or '磁场' in col) and 'y' in col_lower:
+                target = 'mag_y'
+            elif ('mag' in col_lower or '磁场' in col) and 'z' in col_lower:
+                target = 'mag_z'
+            else:
+                continue
+            if target not in column_mapping.values():
+                column_mapping[col] = target
+        
+        return 'heuristic', column_mapping
+    
+    def _iter_wt_imu_chunks(self, file_path):
+        """分块读取WT公司IMU数据文件
+        
+        只读取需要的列, 数值列按字符串读入后整列转换为 float64 (与数据库列精度一致,
+        不引入 float32 舍入误差), 含无法解析的数值 (如 "--") 的行跳过并计数,
+        设备名称解析为 category,
+        每块处理完成后立即返回, 内存占用与文件大小无关。
+        
+        Yields:
+            pandas.DataFrame: 列顺序为 COLUMN_ORDER 的数据块
+        """
         print(f"读取WT IMU文件: {file_path}")
         
         # 检测文件扩展名，选择合适的分隔符
         file_extension = Path(file_path).suffix.lower()
         if file_extension == '.txt':
             print("检测到TXT文件，使用制表符分隔符...")
-            df = pd.read_csv(file_path, sep='\t', encoding='utf-8')
+            sep = '\t'
         else:
             print("检测到CSV文件，使用逗号分隔符...")
-            df = pd.read_csv(file_path, sep=',', encoding='utf-8')
-            
-        print(f"原始 IMU 文件已读取: {len(df)} 行")
-
-        # 定义英文字段和对应的中文字段
-        en_selected_columns = ['time', 'DeviceName', 'AccX(g)', 'AccY(g)', 'AccZ(g)', 
-                             'AsX(°/s)', 'AsY(°/s)', 'AsZ(°/s)', 'HX(uT)', 'HY(uT)', 'HZ(uT)']
+            sep = ','
         
-        zh_selected_columns = ['时间', '设备名称', '加速度X(g)', '加速度Y(g)', '加速度Z(g)', 
-                             '角速度X(°/s)', '角速度Y(°/s)', '角速度Z(°/s)', '磁场X(uT)', '磁场Y(uT)', '磁场Z(uT)']
-
-        # 检测数据格式并提取列
-        if all(col in df.columns for col in en_selected_columns):
-            print("  > 检测到维特英文格式，正在提取列...")
-            df = df[en_selected_columns].copy()
+        import pandas as pd
+        # 只读表头判断格式
+        header = pd.read_csv(file_path, sep=sep, encoding='utf-8', nrows=0).columns.tolist()
+        dialect, column_mapping = self._detect_wt_dialect(header)
+        if dialect == 'en':
+            print("  > 检测到维特英文格式")
+        elif dialect == 'zh':
+            print("  > 检测到维特中文格式")
+        elif column_mapping:
+            print(f"  > 未检测到WT格式，成功映射 {len(column_mapping)} 个列名")
+        else:
+            print("  > 无法识别列名")
+            return
+        
+        dtypes = {}
+        for src, target in column_mapping.items():
+            if target in NUMERIC_COLUMNS:
+                # 不能直接用 float64: 一个坏单元格会让 read_csv 中止整个导入
+                dtypes[src] = str
+            elif target == 'device_name':
+                dtypes[src] = 'category'
+            else:
+                dtypes[src] = str
+        
+        reader = pd.read_csv(file_path, sep=sep, encoding='utf-8',
+                             usecols=list(column_mapping), dtype=dtypes,
+                             chunksize=self.chunksize)
+        
+        total_rows = 0
+        bad_rows = 0
+        for chunk in reader:
+            chunk = chunk.rename(columns=column_mapping)
             
-            # 重命名英文字段为中文
-            df = df.rename(columns={
-                'time': '时间',
-                'DeviceName': '设备名称',
-                'AccX(g)': '加速度X(g)',
-                'AccY(g)': '加速度Y(g)',
-                'AccZ(g)': '加速度Z(g)',
-                'AsX(°/s)': '角速度X(°/s)',
-                'AsY(°/s)': '角速度Y(°/s)',
-                'AsZ(°/s)': '角速度Z(°/s)',
-                'HX(uT)': '磁场X(uT)',
-                'HY(uT)': '磁场Y(uT)',
-                'HZ(uT)': '磁场Z(uT)'
-            })
+            # --- 数值列整列转换, 无法解析的单元格 (非空但转换后为 NaN) 所在行跳过 ---
+            bad = pd.Series(False, index=chunk.index)
+            for col in NUMERIC_COLUMNS:
+                if col in chunk.columns:
+                    raw = chunk[col]
+                    values = pd.to_numeric(raw, errors='coerce')
+                    bad |= values.isna() & raw.notna()
+                    chunk[col] = values.astype('float64')
+            if bad.any():
+                first = chunk.index[bad.to_numpy()][0]
+                print(f"  {int(bad.sum())} 行数值格式错误，已跳过 (首个位于数据第 {first + 1} 行)")
+                bad_rows += int(bad.sum())
+                chunk = chunk[~bad]
             
-        elif all(col in df.columns for col in zh_selected_columns):
-            print("  > 检测到维特中文格式，正在提取列...")
-            df = df[zh_selected_columns].copy()
-        else:
-            print("  > 未检测到WT格式，尝试使用现有列名...")
-            # 尝试映射常见的列名
-            column_mapping = {}
-            for col in df.columns:
-                col_lower = col.lower()
-                if 'time' in col_lower or '时间' in col:
-                    column_mapping[col] = '时间'
-                elif 'device' in col_lower or '设备' in col:
-                    column_mapping[col] = '设备名称'
-                elif 'acc' in col_lower and 'x' in col_lower:
-                    column_mapping[col] = '加速度X(g)'
-                elif 'acc' in col_lower and 'y' in col_lower:
-                    column_mapping[col] = '加速度Y(g)'
-                elif 'acc' in col_lower and 'z' in col_lower:
-                    column_mapping[col] = '加速度Z(g)'
-                elif ('gyro' in col_lower or '角速度' in col) and 'x' in col_lower:
-                    column_mapping[col] = '角速度X(°/s)'
-                elif ('gyro' in col_lower or '角速度' in col) and 'y' in col_lower:
-                    column_mapping[col] = '角速度Y(°/s)'
-                elif ('gyro' in col_lower or '角速度' in col) and 'z' in col_lower:
-                    column_mapping[col] = '角速度Z(°/s)'
-                elif ('mag' in col_lower or '磁场' in col) and 'x' in col_lower:
-                    column_mapping[col] = '磁场X(uT)'
-                elif ('mag' in col_lower or '磁场' in col) and 'y' in col_lower:
-                    column_mapping[col] = '磁场Y(uT)'
-                elif ('mag' in col_lower or '磁场' in col) and 'z' in col_lower:
-                    column_mapping[col] = '磁场Z(uT)'
+            # --- 标准化: WTR1(xx:xx) -> WTR1, 只对类别做一次拆分 ---
+            if 'device_name' in chunk.columns:
+                names = chunk['device_name']
+                prefixes = names.cat.categories.str.split('(', n=1).str[0]
+                chunk['device_name'] = names.map(dict(zip(names.cat.categories, prefixes))).astype('category')
             
-            if column_mapping:
-                df = df.rename(columns=column_mapping)
-                print(f"  > 成功映射 {len(column_mapping)} 个列名")
-            else:
-                print("  > 无法识别列名，保持原样")
-
-        # --- 标准化 ---
-        if '设备名称' in df.columns:
-            df['设备名称'] = df['设备名称'].str.split('(', n=1).str[0]
-
-
-        # --- 目标格式 ---
-        column_mapping = {
-            '时间': 'timestamp',
-            '设备名称': 'device_name',
-            '加速度X(g)': 'acc_x',
-            '加速度Y(g)': 'acc_y',
-            '加速度Z(g)': 'acc_z',
-            '角速度X(°/s)': 'gyro_x',
-            '角速度Y(°/s)': 'gyro_y',
-            '角速度Z(°/s)': 'gyro_z',
-            '磁场X(uT)': 'mag_x',
-            '磁场Y(uT)': 'mag_y',
-            '磁场Z(uT)': 'mag_z'
-        }
-
-        df = df.rename(columns=column_mapping)
-      
-        # --- 定义列的顺序 ---
-        column_order = ['timestamp', 'datetime', 'device_name', 'gyro_x', 'gyro_y', 'gyro_z',
-                       'mag_x', 'mag_y', 'mag_z', 'acc_x', 'acc_y', 'acc_z']
+            # 确保所有列都存在，如果不存在则填充NaN
+            for col in COLUMN_ORDER:
+                if col not in chunk.columns:
+                    chunk[col] = None
+            
+            total_rows += len(chunk)
+            yield chunk[COLUMN_ORDER]
         
-        # 确保所有列都存在，如果不存在则填充NaN
-        for col in column_order:
-            if col not in df.columns:
-                df[col] = None
-                
-        df = df[column_order]
-
+        if bad_rows:
+            print(f"WT IMU数据读取完成: {total_rows} 行 (数值格式错误跳过 {bad_rows} 行)")
+        else:
+            print(f"WT IMU数据读取完成: {total_rows} 行")
+    
+    # --- 2. 私有读取器 (基于你提供的逻辑) --- 
+    def _read_wt_imu(self, file_path):
+        """读取WT公司IMU数据文件 (一次性返回完整 DataFrame)"""
+        import pandas as pd
+        chunks = list(self._iter_wt_imu_chunks(file_path))
+        if not chunks:
+            return pd.DataFrame(columns=COLUMN_ORDER)
+        
+        df = pd.concat(chunks, ignore_index=True)
         print(f"WT IMU数据处理完成: {len(df)} 行")
         return df
 
+def _chunk_to_records(chunk):
+    """将一个数据块整体转换为临时表记录列表 (跳过时间戳无效的行)"""
+    import pandas as pd
+    timestamps = pd.to_datetime(chunk['timestamp'], errors='coerce')
+    valid = timestamps.notna()
+    chunk = chunk[valid].reset_index(drop=True)
+    if chunk.empty:
+        return []
+    
+    device_names = chunk['device_name'].astype(object)
+    frame = pd.DataFrame({
+        'timestamp': list(timestamps[valid].dt.to_pydatetime()),
+        'source_id': device_names.map(get_source_id),
+        'device_name': device_names.fillna('unknown'),
+    })
+    numeric = chunk[NUMERIC_COLUMNS].astype('float64')
+    frame[NUMERIC_COLUMNS] = numeric.astype(object).where(numeric.notna(), None)
+    frame.insert(0, 'id', [uuid.uuid4() for _ in range(len(frame))])
+    
+    return frame.to_dict('records')
+
 def import_imu_data(csv_file_path, session_id=None, device_id=None, user_id=None):
     """从CSV/TXT文件导入IMU数据到数据库，使用新的数据处理器和临时表方法"""
     # 验证文件
@@ -303,21 +394,12 @@ def import_imu_data(csv_file_path, session_id=None, device_id=None, user_id=None
         # 检测文件类型并选择适当的读取方法
         file_extension = Path(csv_file_path).suffix.lower()
         
-        if file_extension == '.txt' or file_extension == '.csv':
-            # 使用WT IMU数据处理器
-            df = processor._read_wt_imu(csv_file_path)
-        else:
+        if file_extension != '.txt' and file_extension != '.csv':
             print(f"不支持的文件格式: {file_extension}")
             return False
         
-        if df is None or len(df) == 0:
-            print("读取的数据为空")
-            return False
-            
-        print(f"成功读取 {len(df)} 行数据")
-        
         # 使用事务性连接 - 确保自动管理事务
-        with engine.begin() as conn:
+        with get_engine().begin() as conn:
             
             # 使用固定的会话ID，如果没有指定则使用默认值
             if session_id is None:
@@ -356,84 +438,37 @@ def import_imu_data(csv_file_path, session_id=None, device_id=None, user_id=None
                 print(f"创建临时表失败: {e}")
                 raise
             
-            # 2. 准备数据导入到临时表
-            print("准备批量插入数据...")
-            total_rows = len(df)
+            # 2. 分块读取并直接导入临时表
+            print("分块读取并批量插入数据...")
+            total_rows = 0
             success_count = 0
             
+            insert_cols = ['id', 'timestamp', 'source_id', 'device_name'] + NUMERIC_COLUMNS
+            query = text(f"INSERT INTO imu_data_temp ({', '.join(insert_cols)}) "
+                         f"VALUES ({', '.join(f':{k}' for k in insert_cols)})")
+            
             try:
-                # 批量处理数据
-                temp_records = []
-                
-                for idx, row in df.iterrows():
-                    try:
-                        # 准备临时表记录
-                        temp_record = {
-                            'id': uuid.uuid4(),  # 为每行数据生成唯一ID
-                            'timestamp': row.get('timestamp'),
-                            'source_id': get_source_id(row.get('device_name', 'unknown')),  # 根据设备名称映射source_id
-                            'device_name': row.get('device_name', 'unknown')
-                        }
-                        
-                        # 确保timestamp不为空
-                        if pd.isna(temp_record['timestamp']):
-                            print(f"行 {idx} 时间戳为空，跳过此行")
-                            continue
-                        
-                        # 确保timestamp是datetime类型
-                        if not isinstance(temp_record['timestamp'], pd.Timestamp):
-                            try:
-                                temp_record['timestamp'] = pd.to_datetime(temp_record['timestamp'])
-                            except:
-                                print(f"行 {idx} 时间戳格式错误，跳过此行")
-                                continue
-                        
-                        # 转换pandas时间戳为Python datetime
-                        temp_record['timestamp'] = temp_record['timestamp'].to_pydatetime()
-                        
-                        # 获取数值数据，处理NaN值
-                        numeric_columns = ['acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z', 'mag_x', 'mag_y', 'mag_z']
-                        for col in numeric_columns:
-                            if col in df.columns:
-                                value = row.get(col)
-                                if pd.notna(value):
-                                    temp_record[col] = float(value)
-                                else:
-                                    temp_record[col] = None
-                        
-                        temp_records.append(temp_record)
-                        success_count += 1
-                        
-                    except Exception as e:
-                        print(f"处理行 {idx} 失败: {str(e)}")
-                        continue
-                
-                # 批量插入数据
-                if temp_records:
-                    print(f"准备插入 {len(temp_records)} 条记录到临时表...")
-                    
-                    # 构建批量插入查询
-                    all_keys = set()
-                    for record in temp_records:
-                        all_keys.update(record.keys())
-                    
-                    cols = ', '.join(sorted(all_keys))
-                    placeholders = ', '.join(f":{k}" for k in sorted(all_keys))
+                for chunk in processor._iter_wt_imu_chunks(csv_file_path):
+                    total_rows += len(chunk)
+                    records = _chunk_to_records(chunk)
                     
-                    query = text(f"INSERT INTO imu_data_temp ({cols}) VALUES ({placeholders})")
+                    skipped = len(chunk) - len(records)
+                    if skipped:
+                        print(f"  {skipped} 行时间戳为空或格式错误，已跳过")
                     
-                    # 批量执行插入
-                    for record in temp_records:
-                        # 确保所有字段都存在
-                        complete_record = {k: record.get(k) for k in sorted(all_keys)}
-                        conn.execute(query, complete_record)
-                    
-                    print(f"成功插入 {success_count} 条记录到临时表")
+                    if records:
+                        conn.execute(query, records)
+                        success_count += len(records)
+                        print(f"  已插入 {success_count} 条记录到临时表...")
                 
             except Exception as e:
                 print(f"批量插入数据失败: {str(e)}")
                 raise
             
+            if success_count == 0:
+                print("读取的数据为空")
+                return False
+            
             # 3. 将临时表数据迁移到主表
             print(f"临时表导入完成，成功导入 {success_count} 行数据")
             print("开始将数据从临时表迁移到imu_data主表...")
@@ -151,6 +151,8 @@ run_verification() {
     if [ -f "verify_timestamp.py" ]; then
         print_info "验证时间戳格式..."
         python3 verify_timestamp.py
+        print_info "审计时间戳 (单调性 / 间隔 / 采样率 / 漂移)..."
+        python3 verify_timestamp.py --audit --json timestamp_audit.json || print_warning "时间戳审计发现问题"
     fi
 
     # 验证拆分结果
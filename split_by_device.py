@@ -4,8 +4,20 @@
 """
 import csv
 import os
+import sys
+from itertools import islice
+
+import columnar
+import metrics
+import stage_log
+import stages
 
 INPUT_FILE = 'data.csv'
+# 未转换的原始 Tab 分隔文件 (可直接拆分，无需先生成 data.csv)
+TXT_INPUT_FILE = 'data.txt'
+
+# 每批读取 / 写入的行数
+BATCH_ROWS = 10000
 
 # 设备名称到文件夹的映射
 DEVICE_FOLDERS = {
@@ -14,67 +26,110 @@ DEVICE_FOLDERS = {
     'WTB1': 'WTB1_data'
 }
 
-def split_by_device():
-    """按设备拆分数据"""
-    
+def _iter_input_rows(input_file):
+    """逐行读取输入文件 (.txt 按 Tab 分隔读取，其余按 CSV 读取)"""
+    if input_file.endswith('.txt'):
+        import convert_to_csv
+        yield from convert_to_csv.iter_txt_rows(input_file)
+        return
+    with open(input_file, 'r', encoding='utf-8') as infile:
+        yield from csv.reader(infile)
+
+def default_input():
+    """默认输入: data.csv，不存在时直接读取 data.txt"""
+    if not os.path.exists(INPUT_FILE) and os.path.exists(TXT_INPUT_FILE):
+        return TXT_INPUT_FILE
+    return INPUT_FILE
+
+def split_by_device(input_file=INPUT_FILE, output_dir='.', devices=None):
+    """
+    按设备拆分数据
+    :param input_file: 输入文件，.txt 按 Tab 分隔直接读取 (等价于先转换为 CSV)
+    :param output_dir: 设备文件夹所在目录
+    :param devices: 设备前缀 -> 文件夹名 (默认 DEVICE_FOLDERS)
+    :return: stages.StageResult (outputs 为 {设备: 输出文件})
+    """
+    devices = devices or DEVICE_FOLDERS
+    with stages.measure('split', file=input_file) as result:
+        _split(input_file, output_dir, devices, result)
+    return result
+
+def _split(input_file, output_dir, devices, result):
     # 创建文件夹
-    for folder in DEVICE_FOLDERS.values():
+    for folder in devices.values():
+        folder = os.path.join(output_dir, folder)
         os.makedirs(folder, exist_ok=True)
-        print(f"创建文件夹: {folder}/")
+        print(f"创建文件夹: {os.path.normpath(folder)}/")
     
     # 打开所有输出文件
-    files = {}
     writers = {}
     header = None
-    device_counts = {device: 0 for device in DEVICE_FOLDERS}
+    device_counts = {device: 0 for device in devices}
     unknown_devices = {}
     
-    with open(INPUT_FILE, 'r', encoding='utf-8') as infile:
-        reader = csv.reader(infile)
+    reader = _iter_input_rows(input_file)
+    log = stage_log.StageLog('split', file=input_file)
+    
+    # 读取表头
+    header = next(reader)
+    print(f"\n表头: {len(header)} 列")
+    
+    # 为每个设备创建输出文件并写入表头 (CSV 或列式中间格式)
+    for device, folder in devices.items():
+        output_path = columnar.output_path(os.path.join(output_dir, folder, f'{device}.csv'))
+        writers[device] = columnar.open_row_writer(output_path, header)
+        result.outputs[device] = output_path
+        print(f"创建文件: {output_path}")
+    
+    # 处理数据行 (按批读取、分组、写入，分别计入 read / parse / write 子步骤)
+    total_rows = 0
+    while True:
+        with metrics.step('read'):
+            batch = list(islice(reader, BATCH_ROWS))
+        if not batch:
+            break
         
-        # 读取表头
-        header = next(reader)
-        print(f"\n表头: {len(header)} 列")
+        with metrics.step('parse'):
+            groups = {device: [] for device in devices}
+            for row in batch:
+                total_rows += 1
+                
+                # 获取设备名称（第2列，索引1）
+                device_name = row[1] if len(row) > 1 else ''
+                
+                # 提取设备前缀（如 WTR1(xxx) -> WTR1）
+                device_prefix = None
+                for prefix in devices:
+                    if device_name.startswith(prefix):
+                        device_prefix = prefix
+                        break
+                
+                if device_prefix:
+                    groups[device_prefix].append(row)
+                else:
+                    # 记录未知设备
+                    if device_name not in unknown_devices:
+                        unknown_devices[device_name] = 0
+                    unknown_devices[device_name] += 1
+                    log.error('未知设备', f"行 {total_rows + 1}", device_name)
         
-        # 为每个设备创建输出文件并写入表头
-        for device, folder in DEVICE_FOLDERS.items():
-            output_path = os.path.join(folder, f'{device}.csv')
-            files[device] = open(output_path, 'w', encoding='utf-8', newline='')
-            writers[device] = csv.writer(files[device])
-            writers[device].writerow(header)
-            print(f"创建文件: {output_path}")
+        with metrics.step('write'):
+            for device, rows in groups.items():
+                if rows:
+                    writers[device].writerows(rows)
+                    device_counts[device] += len(rows)
         
-        # 处理数据行
-        total_rows = 0
-        for row in reader:
-            total_rows += 1
-            
-            # 获取设备名称（第2列，索引1）
-            device_name = row[1] if len(row) > 1 else ''
-            
-            # 提取设备前缀（如 WTR1(xxx) -> WTR1）
-            device_prefix = None
-            for prefix in DEVICE_FOLDERS:
-                if device_name.startswith(prefix):
-                    device_prefix = prefix
-                    break
-            
-            if device_prefix:
-                writers[device_prefix].writerow(row)
-                device_counts[device_prefix] += 1
-            else:
-                # 记录未知设备
-                if device_name not in unknown_devices:
-                    unknown_devices[device_name] = 0
-                unknown_devices[device_name] += 1
-            
-            # 进度显示
-            if total_rows % 100000 == 0:
-                print(f"已处理 {total_rows} 行...")
-    
+        # 进度显示 (限速)
+        log.progress(total_rows)
+
     # 关闭所有文件
-    for f in files.values():
-        f.close()
+    with metrics.step('write'):
+        for writer in writers.values():
+            writer.close()
+    for writer in writers.values():
+        metrics.count_file('bytes_written', writer.path)
+    metrics.count('rows', total_rows)
+    metrics.count_file('bytes_read', input_file)
     
     # 打印统计
     print("\n" + "=" * 60)
@@ -94,13 +149,22 @@ def split_by_device():
         for dev, count in unknown_devices.items():
             print(f"  {dev}: {count} 行")
     
+    log.finish(ok=split_total == total_rows and not unknown_devices,
+               rows=total_rows, **device_counts)
+    result.details = {'device_counts': device_counts, 'unknown_devices': unknown_devices,
+                      'total_rows': total_rows}
+    
     # 验证
-    if split_total == total_rows and not unknown_devices:
+    result.ok = split_total == total_rows and not unknown_devices
+    if result.ok:
         print(f"\n✓ 数据完整！拆分行数 ({split_total}) = 原始行数 ({total_rows})")
-        return True, device_counts, total_rows
     else:
+        result.error = f"拆分行数 ({split_total}) ≠ 原始行数 ({total_rows})"
         print(f"\n✗ 数据不完整！拆分行数 ({split_total}) ≠ 原始行数 ({total_rows})")
-        return False, device_counts, total_rows
+
+def main():
+    result = split_by_device(sys.argv[1] if len(sys.argv) > 1 else default_input())
+    sys.exit(0 if result.ok else 1)
 
 if __name__ == '__main__':
-    split_by_device()
+    main()
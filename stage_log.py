@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+阶段日志: 限速进度输出、错误聚合与结构化摘要
+
+热循环中不再逐行 print，而是:
+
+    log = stage_log.StageLog('csv_to_bin', file=csv_path)
+    for ...:
+        log.progress(done, total)                     # 最多每 PROGRESS_INTERVAL 秒输出一次
+        log.error('crc', f"帧 {n}", "CRC 不匹配")      # 只计数，每类保留前 MAX_SAMPLES 个位置
+    summary = log.finish(frames=n)                     # 打印聚合结果，返回摘要字典
+
+每类错误只在第一次出现时打印一行。设置环境变量 BLE_STAGE_LOG_FILE 时，
+进度事件和阶段摘要按 JSON 行追加写入该文件，app.py 读取它更新任务进度，
+并把摘要放入任务结果供前端展示。
+"""
+import json
+import os
+import sys
+import time
+
+STAGE_LOG_FILE_ENV = 'BLE_STAGE_LOG_FILE'
+
+# 进度输出的最小间隔 (秒)
+PROGRESS_INTERVAL = float(os.environ.get('BLE_PROGRESS_INTERVAL', '2'))
+
+# 每类错误保留的样本位置数量
+MAX_SAMPLES = 10
+
+# progress() 每隔多少次调用才检查一次时间
+CHECK_EVERY = 1024
+
+def _emit(event):
+    """追加一条结构化事件 (未设置 BLE_STAGE_LOG_FILE 时忽略)"""
+    path = os.environ.get(STAGE_LOG_FILE_ENV)
+    if not path:
+        return
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+class StageLog:
+    """单个阶段 (通常对应一个文件) 的日志"""
+
+    def __init__(self, stage, stream=None, interval=PROGRESS_INTERVAL, max_samples=MAX_SAMPLES, **labels):
+        self.stage = stage
+        self.labels = {k: str(v) for k, v in labels.items()}
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.max_samples = max_samples
+        self.errors = {}
+        self.start = time.monotonic()
+        self.done = 0
+        self.total = None
+        self._last_report = self.start
+        self._next_check = CHECK_EVERY
+
+    def _print(self, text):
+        print(text, file=self.stream, flush=True)
+
+    def progress(self, done, total=None):
+        """更新进度 (开销很小，可在每行调用)"""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if done < self._next_check:
+            return
+        self._next_check = done + CHECK_EVERY
+        now = time.monotonic()
+        if now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        rate = done / (now - self.start) if now > self.start else 0.0
+        if self.total:
+            self._print(f"  [{self.stage}] 已处理 {done}/{self.total} ({done / self.total:.0%}), {rate:,.0f} 行/秒")
+        else:
+            self._print(f"  [{self.stage}] 已处理 {done} 行, {rate:,.0f} 行/秒")
+        _emit({'type': 'progress', 'stage': self.stage, 'labels': self.labels,
+               'done': done, 'total': self.total, 'rate': rate})
+
+    def error(self, kind, location=None, message=''):
+        """记录一个错误: 按类别计数，保留前 max_samples 个位置，只在首次出现时打印"""
+        entry = self.errors.get(kind)
+        if entry is None:
+            entry = self.errors[kind] = {'count': 0, 'samples': []}
+            where = f" ({location})" if location is not None else ''
+            self._print(f"  ⚠️ [{self.stage}] {kind}{where}: {message} (后续同类错误只计数)")
+        entry['count'] += 1
+        if len(entry['samples']) < self.max_samples:
+            entry['samples'].append({'location': location, 'message': str(message)})
+
+    @property
+    def error_count(self):
+        return sum(e['count'] for e in self.errors.values())
+
+    def finish(self, ok=None, **counts):
+        """
+        结束阶段: 打印错误汇总并输出结构化摘要
+        :param ok: 是否成功 (默认: 没有错误即成功)
+        :param counts: 写入摘要的计数 (如 rows=..., frames=...)
+        """
+        elapsed = time.monotonic() - self.start
+        if ok is None:
+            ok = not self.errors
+        for kind, entry in self.errors.items():
+            locations = ', '.join(str(s['location']) for s in entry['samples'][:5])
+            more = ' ...' if entry['count'] > 5 else ''
+            self._print(f"  ⚠️ [{self.stage}] {kind}: {entry['count']} 次 (位置: {locations}{more})")
+
+        summary = {
+            'type': 'summary',
+            'stage': self.stage,
+            'labels': self.labels,
+            'ok': bool(ok),
+            'elapsed_seconds': round(elapsed, 4),
+            'counts': counts,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+        _emit(summary)
+        return summary
+
+def position(path):
+    """事件文件当前的末尾位置 (启动一个阶段前记下，之后 load(path, since=...) 只读取该阶段的事件)"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def load(path, since=0):
+    """
+    读取 JSON 行事件文件，返回 (最近的进度事件, 阶段摘要列表)
+
+    :param since: 从该字节位置开始读取 (position() 的返回值)，之前阶段的事件不计入
+    最近的进度事件所属的阶段 (阶段名 + 标签相同) 之后已输出摘要时，视为没有进行中的进度，
+    避免新阶段 (或同一阶段的下一个文件) 刚开始时显示上一个阶段的进度。
+    """
+    latest, summaries = None, []
+    if not os.path.exists(path):
+        return latest, summaries
+    with open(path, 'rb') as f:
+        f.seek(since)
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # 子进程可能正在写入最后一行
+                continue
+            if event.get('type') == 'progress':
+                latest = event
+            elif event.get('type') == 'summary':
+                summaries.append(event)
+                if latest is not None and (latest.get('stage'), latest.get('labels')) == \
+                        (event.get('stage'), event.get('labels')):
+                    latest = None
+    return latest, summaries
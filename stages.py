@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+处理阶段的类型化接口
+
+每个阶段是一个函数: 显式传入输入/输出路径和选项，返回 StageResult (计数与耗时)，
+不依赖各脚本的模块级路径常量，因此可以在任意输入上运行、并行运行或在常驻进程中复用:
+
+    import stages
+    r = stages.split('uploads/data.txt', output_dir='jobs/1')
+    r = stages.align('jobs/1/WTR1_data/WTR1.csv', 'bmp/Barometer.csv')
+    r = stages.downsample('jobs/1/WTR1_data/WTR1.csv', 'jobs/1/WTR1_data/WTR1_50hz.csv')
+    r = stages.encode(r.outputs['output'])
+    print(r.ok, r.counts['rows'], r.wall_seconds)
+
+split_by_device.py / align_barometer.py / downsample_50hz.py / csv_to_bin.py 的命令行入口
+只是用默认路径调用同样的函数。计数来自阶段内的 metrics.count()，与 BLE_METRICS_FILE
+中的阶段记录一致。
+"""
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional
+
+import metrics
+
+@dataclass
+class StageResult:
+    """一次阶段运行的结果"""
+    stage: str
+    ok: bool = False
+    inputs: Dict[str, str] = field(default_factory=dict)
+    outputs: Dict[str, str] = field(default_factory=dict)
+    # metrics.count() 累加的计数 (rows / bytes_read / bytes_written / errors ...)
+    counts: Dict[str, int] = field(default_factory=dict)
+    # metrics.step() 累计的子步骤耗时 (秒)
+    steps: Dict[str, float] = field(default_factory=dict)
+    # 阶段特有的结果 (如各设备行数)
+    details: Dict[str, Any] = field(default_factory=dict)
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    error: Optional[str] = None
+
+    def fail(self, message):
+        """标记失败并返回自身 (用于提前返回)"""
+        self.ok = False
+        self.error = message
+        return self
+
+    def to_dict(self):
+        return asdict(self)
+
+@contextmanager
+def measure(name, **inputs):
+    """
+    以 metrics.stage 记录一个阶段，结束时把计数和耗时填入 StageResult
+
+    :param inputs: 输入路径 (同时作为阶段标签)
+    """
+    result = StageResult(name, inputs={k: str(v) for k, v in inputs.items()})
+    record = None
+    try:
+        with metrics.stage(name, **inputs) as record:
+            yield result
+    finally:
+        if record is not None:
+            result.counts = dict(record['counters'])
+            result.steps = dict(record['steps'])
+            result.wall_seconds = record.get('wall_seconds', 0.0)
+            result.cpu_seconds = record.get('cpu_seconds', 0.0)
+
+def split(input_file: str, output_dir: str = '.',
+          devices: Optional[Dict[str, str]] = None) -> StageResult:
+    """
+    按设备拆分原始数据
+
+    :param input_file: data.csv 或 Tab 分隔的 data.txt
+    :param output_dir: 设备文件夹所在目录
+    :param devices: 设备前缀 -> 文件夹名 (默认 split_by_device.DEVICE_FOLDERS)
+    :return: outputs 为 {设备: 输出文件}，details 含各设备行数与未知设备
+    """
+    import split_by_device
+    return split_by_device.split_by_device(input_file, output_dir, devices)
+
+def align(device_file: str, barometer_file: str,
+          output_file: Optional[str] = None) -> StageResult:
+    """
+    把气压计数据对齐到一个设备文件
+
+    :param output_file: 输出路径 (默认覆盖 device_file)
+    """
+    import align_barometer
+    barometer = align_barometer.load_barometer_data(barometer_file)
+    return align_barometer.process_device_file(device_file, barometer, output_file)
+
+def downsample(input_file: str, output_file: str,
+               factor: Optional[int] = None) -> StageResult:
+    """
+    降采样 (保留全部有效气压行，其余每 factor 行取 1 行)
+
+    :param factor: 默认 downsample_50hz.DOWNSAMPLE_FACTOR
+    """
+    import downsample_50hz
+    return downsample_50hz.downsample_to_50hz(input_file, output_file,
+                                              factor or downsample_50hz.DOWNSAMPLE_FACTOR)
+
+def encode(csv_file: str, bin_file: Optional[str] = None,
+           append: bool = False, packed: bool = False) -> StageResult:
+    """
+    CSV / 列式文件编码为 .bin
+
+    :param bin_file: 输出路径 (默认 <名称>.bin，打包帧为 <名称>_packed.bin)
+    :param append: 追加模式 (只编码已有 bin 最后一帧之后的新行)
+    :param packed: 输出多样本打包帧 (Cmd 0x02)，不支持 append
+    """
+    import csv_to_bin
+    if packed:
+        if append:
+            raise ValueError('打包帧不支持追加模式')
+        return csv_to_bin.process_packed_file(csv_file, bin_file)
+    return csv_to_bin.process_single_file(csv_file, append=append, bin_path=bin_file)
+
+# 阶段名 -> 函数 (供任务调度按名称调用)
+STAGES = {
+    'split': split,
+    'align': align,
+    'downsample': downsample,
+    'encode': encode,
+}
@@ -3,10 +3,26 @@
 CSV 验证脚本 - 对比原始 txt 和生成的 CSV 文件是否一致
 """
 import csv
+import queue
+import sys
+import threading
+from itertools import zip_longest
+
+import columnar
+import metrics
 
 TXT_FILE = 'data.txt'
 CSV_FILE = 'data.csv'
 
+# 每次读取的块大小 / 预读队列长度
+READ_BLOCK = 4 * 1024 * 1024
+QUEUE_BLOCKS = 4
+
+# 汇总中保留的不一致位置数量
+MAX_LOCATIONS = 20
+
+_TAB_TO_COMMA = bytes.maketrans(b'\t', b',')
+
 def verify_files():
     """验证 txt 和 csv 文件内容是否一致"""
     print("=" * 60)
@@ -69,26 +85,189 @@ def verify_files():
         print("\n✓ 所有行验证通过！CSV 文件与原始 TXT 完全一致。")
         return True
 
+def _read_line_blocks(path, out, block_size):
+    """后台线程: 按块读取文件并切分为完整行列表，放入队列 (None 表示结束)"""
+    try:
+        with open(path, 'rb') as f:
+            pending = b''
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                data = pending + data
+                lines = data.split(b'\n')
+                pending = lines.pop()
+                out.put(lines)
+            if pending:
+                out.put([pending])
+    finally:
+        out.put(None)
+
+def _iter_lines_parallel(path, block_size=READ_BLOCK):
+    """在独立线程中预读文件，逐行产生 (不含 \\n 的) bytes"""
+    q = queue.Queue(maxsize=QUEUE_BLOCKS)
+    threading.Thread(target=_read_line_blocks, args=(path, q, block_size), daemon=True).start()
+    while True:
+        lines = q.get()
+        if lines is None:
+            return
+        yield from lines
+
+def _strip_cr(line):
+    return line[:-1] if line.endswith(b'\r') else line
+
+def _txt_fields(line):
+    row = next(csv.reader([line.decode('utf-8', 'replace')], delimiter='\t'), [])
+    if row and row[-1].endswith('\r'):
+        row[-1] = row[-1].rstrip('\r')
+    return row
+
+def _csv_fields(line):
+    return next(csv.reader([line.decode('utf-8', 'replace')]), [])
+
+def _chain_header(header, rows):
+    yield header
+    yield from rows
+
+@metrics.timed('verify_csv')
+def verify_files_streaming(txt_file=TXT_FILE, csv_file=CSV_FILE, max_locations=MAX_LOCATIONS):
+    """
+    单遍流式验证 txt 与 csv 是否一致
+
+    两个文件各由一个线程按块并行读取，逐行比较: 不含引号/逗号的行直接把
+    Tab 替换为逗号后按字节比较，只有需要转义或字节不一致的行才解析字段。
+    行数在同一遍中统计，不一致会全部计数，并保留前 max_locations 个位置。
+    csv_file 按 columnar.resolve_input 解析；为列式文件时逐行比较规范化后的字段。
+    :return: 汇总字典
+    """
+    csv_file = columnar.resolve_input(csv_file)
+    normalize = columnar.is_columnar(csv_file)
+    if normalize:
+        header_row, csv_rows = columnar.open_rows(csv_file)
+        csv_lines = _chain_header(header_row, csv_rows)
+    else:
+        csv_lines = _iter_lines_parallel(csv_file)
+
+    print("=" * 60)
+    print("开始验证 CSV 文件与原始 TXT 文件的一致性 (单遍流式)...")
+    print("=" * 60)
+
+    summary = {
+        'txt_lines': 0,
+        'csv_lines': 0,
+        'mismatch_lines': 0,
+        'column_count_mismatches': 0,
+        'column_mismatches': {},
+        'locations': [],
+    }
+    header = None
+
+    pairs = zip_longest(_iter_lines_parallel(txt_file), csv_lines)
+    for line_no, (txt_line, csv_line) in enumerate(pairs, start=1):
+        # 进度显示 (放在各个提前 continue 之前，一致的行同样计入)
+        if line_no % 100000 == 0:
+            print(f"已验证 {line_no} 行...")
+
+        if txt_line is not None:
+            summary['txt_lines'] += 1
+        if csv_line is not None:
+            summary['csv_lines'] += 1
+        if txt_line is None or csv_line is None:
+            summary['mismatch_lines'] += 1
+            continue
+
+        txt_line = _strip_cr(txt_line)
+
+        if header is None:
+            header = _txt_fields(txt_line)
+
+        if normalize:
+            # 列式文件: csv_line 已是字段列表 (表头原样，数据行规范化后比较)
+            txt_row = _txt_fields(txt_line)
+            csv_row = csv_line
+            if line_no > 1:
+                txt_row = columnar.normalize_row(txt_row)
+                csv_row = columnar.normalize_row(csv_row)
+            if txt_row == csv_row:
+                continue
+        else:
+            csv_line = _strip_cr(csv_line)
+
+            # 快速路径: 无需转义的行直接按字节比较
+            if b'"' not in txt_line and b',' not in txt_line and b'\r' not in txt_line:
+                if txt_line.translate(_TAB_TO_COMMA) == csv_line:
+                    continue
+
+            txt_row = _txt_fields(txt_line)
+            csv_row = _csv_fields(csv_line)
+            if txt_row == csv_row:
+                continue
+
+        summary['mismatch_lines'] += 1
+        if len(txt_row) != len(csv_row):
+            summary['column_count_mismatches'] += 1
+        columns = [i for i, (a, b) in enumerate(zip_longest(txt_row, csv_row)) if a != b]
+        for i in columns:
+            name = header[i] if header and i < len(header) else f"#{i + 1}"
+            summary['column_mismatches'][name] = summary['column_mismatches'].get(name, 0) + 1
+
+        if len(summary['locations']) < max_locations:
+            summary['locations'].append({
+                'line': line_no,
+                'txt_cols': len(txt_row),
+                'csv_cols': len(csv_row),
+                'columns': columns[:10],
+                'txt_preview': txt_row[:3],
+                'csv_preview': csv_row[:3],
+            })
+
+    summary['passed'] = (summary['mismatch_lines'] == 0
+                         and summary['txt_lines'] == summary['csv_lines'])
+
+    print("\n" + "=" * 60)
+    print("验证结果报告")
+    print("=" * 60)
+    print(f"原始 TXT 文件行数: {summary['txt_lines']}")
+    print(f"生成 CSV 文件行数: {summary['csv_lines']}")
+    print(f"行数一致: {'✓ 是' if summary['txt_lines'] == summary['csv_lines'] else '✗ 否'}")
+    print(f"不一致行数: {summary['mismatch_lines']} (列数不同: {summary['column_count_mismatches']})")
+
+    if summary['column_mismatches']:
+        print("\n各列不一致次数:")
+        for name, count in sorted(summary['column_mismatches'].items(), key=lambda x: -x[1]):
+            print(f"  {name}: {count}")
+
+    if summary['locations']:
+        print(f"\n不一致的行 (前{len(summary['locations'])}个):")
+        for err in summary['locations']:
+            print(f"  行 {err['line']}: TXT列数={err['txt_cols']}, CSV列数={err['csv_cols']}, 列={err['columns']}")
+            print(f"    TXT预览: {err['txt_preview']}")
+            print(f"    CSV预览: {err['csv_preview']}")
+
+    if summary['passed']:
+        print("\n✓ 所有行验证通过！CSV 文件与原始 TXT 完全一致。")
+
+    return summary
+
 def show_sample():
     """显示 CSV 文件的样本数据"""
     print("\n" + "=" * 60)
     print("CSV 文件样本数据 (前5行)")
     print("=" * 60)
     
-    with open(CSV_FILE, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        for i, row in enumerate(reader):
-            if i >= 5:
-                break
-            if i == 0:
-                print(f"表头 ({len(row)} 列):")
-                for j, col in enumerate(row):
-                    print(f"  [{j+1}] {col}")
-            else:
-                print(f"\n数据行 {i}: {row[:5]}...")
+    header, rows = columnar.open_rows(columnar.resolve_input(CSV_FILE))
+    for i, row in enumerate(_chain_header(header, rows)):
+        if i >= 5:
+            break
+        if i == 0:
+            print(f"表头 ({len(row)} 列):")
+            for j, col in enumerate(row):
+                print(f"  [{j+1}] {col}")
+        else:
+            print(f"\n数据行 {i}: {row[:5]}...")
 
 if __name__ == '__main__':
-    result = verify_files()
+    result = verify_files_streaming()['passed']
     show_sample()
     
     print("\n" + "=" * 60)
@@ -97,3 +276,4 @@ if __name__ == '__main__':
     else:
         print("验证状态: ✗ 失败")
     print("=" * 60)
+    sys.exit(0 if result else 1)
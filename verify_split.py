@@ -4,9 +4,13 @@
 确保不丢失任何数据
 """
 import csv
+import hashlib
 import os
+import sys
+from itertools import zip_longest
 
-ORIGINAL_FILE = 'data.csv'
+import columnar
+import metrics
 
 DEVICE_FILES = {
     'WTR1': 'WTR1_data/WTR1.csv',
@@ -14,8 +18,14 @@ DEVICE_FILES = {
     'WTB1': 'WTB1_data/WTB1.csv'
 }
 
-def verify_split():
+def default_original():
+    """原始数据文件: 与 split_by_device 的默认输入相同 (data.csv，不存在时为 data.txt)"""
+    import split_by_device
+    return split_by_device.default_input()
+
+def verify_split(original_file=None):
     """验证拆分后的数据完整性"""
+    original_file = original_file or default_original()
     print("=" * 70)
     print("开始验证拆分数据的完整性...")
     print("=" * 70)
@@ -26,20 +36,18 @@ def verify_split():
     original_header = None
     unknown_rows = []
     
-    with open(ORIGINAL_FILE, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        original_header = next(reader)
-        
-        for row in reader:
-            device_name = row[1] if len(row) > 1 else ''
-            matched = False
-            for prefix in DEVICE_FILES:
-                if device_name.startswith(prefix):
-                    original_data[prefix].append(tuple(row))
-                    matched = True
-                    break
-            if not matched:
-                unknown_rows.append(row)
+    rows = _iter_rows(original_file)
+    original_header = next(rows)
+    for row in rows:
+        device_name = row[1] if len(row) > 1 else ''
+        matched = False
+        for prefix in DEVICE_FILES:
+            if device_name.startswith(prefix):
+                original_data[prefix].append(tuple(row))
+                matched = True
+                break
+        if not matched:
+            unknown_rows.append(row)
     
     print(f"  原始数据表头列数: {len(original_header)}")
     for device, rows in original_data.items():
@@ -143,5 +151,176 @@ def verify_split():
     
     return all_pass
 
+def _iter_rows(filepath, normalize=False):
+    """
+    逐行读取 CSV / 列式文件 (或 Tab 分隔的 .txt)，第一行为表头，不保留历史行
+    :param normalize: CSV / txt 的数据行经 columnar.normalize_file 转换为列式文件读出的文本形式
+    """
+    delimiter = ','
+    if filepath.endswith('.txt'):
+        import convert_to_csv
+        rows = convert_to_csv.iter_txt_rows(filepath)
+        header = next(rows, [])
+        delimiter = '\t'
+    else:
+        header, rows = columnar.open_rows(filepath)
+    yield header
+    if normalize and not columnar.is_columnar(filepath):
+        rows = columnar.normalize_file(filepath, header, rows, delimiter)
+    yield from rows
+
+def _match_device(device_name, device_files=DEVICE_FILES):
+    for prefix in device_files:
+        if device_name.startswith(prefix):
+            return prefix
+    return None
+
+class RowDigest:
+    """按顺序累积的行摘要 (顺序敏感的哈希 + 行数)"""
+
+    def __init__(self):
+        self._hash = hashlib.blake2b(digest_size=16)
+        self.count = 0
+
+    def update(self, row):
+        # 字段间用 \x1f、行尾用 \x1e 分隔，避免 ['a,b'] 与 ['a', 'b'] 产生相同输入
+        self._hash.update('\x1f'.join(row).encode('utf-8') + b'\x1e')
+        self.count += 1
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+def _locate_differences(device, original_file, split_file, device_files=DEVICE_FILES,
+                        limit=5, normalize=False):
+    """摘要不一致时，同步流式读取两边定位前 limit 个不一致的行号"""
+    orig_rows = _iter_rows(original_file, normalize)
+    next(orig_rows, None)
+    orig_rows = (row for row in orig_rows
+                 if _match_device(row[1] if len(row) > 1 else '', device_files) == device)
+    split_rows = _iter_rows(split_file, normalize)
+    next(split_rows, None)  # 跳过表头
+
+    mismatches = []
+    for i, (orig, split) in enumerate(zip_longest(orig_rows, split_rows), start=1):
+        if orig != split:
+            mismatches.append(i)
+            if len(mismatches) >= limit:
+                break
+    return mismatches
+
+@metrics.timed('verify_split')
+def verify_split_streaming(original_file=None, device_files=DEVICE_FILES):
+    """
+    流式验证拆分后的数据完整性 (常量内存)
+
+    第一遍读取原始文件，按设备累积摘要与行数；第二遍逐个读取拆分文件计算摘要。
+    只有摘要不一致的设备才再次同步读取两边定位具体的行。
+    拆分文件可以是 CSV 或列式文件 (columnar.resolve_input)；有列式文件时 CSV 一侧的行
+    经 columnar.normalize_file 转换为列式文件读出的文本形式后再计算摘要。
+    """
+    original_file = original_file or default_original()
+    if not os.path.exists(original_file):
+        print(f"✗ 原始文件不存在: {original_file}")
+        return False
+    device_files = {device: columnar.resolve_input(path) for device, path in device_files.items()}
+    normalize = any(columnar.is_columnar(path) for path in device_files.values())
+
+    print("=" * 70)
+    print("开始验证拆分数据的完整性 (流式摘要)...")
+    print("=" * 70)
+
+    # 1. 一遍读取原始数据，按设备累积摘要
+    print("\n[步骤1] 读取原始数据并按设备计算摘要...")
+    original_digests = {device: RowDigest() for device in device_files}
+    unknown_count = 0
+
+    rows = _iter_rows(original_file, normalize)
+    original_header = next(rows)
+    for row in rows:
+        device = _match_device(row[1] if len(row) > 1 else '', device_files)
+        if device:
+            original_digests[device].update(row)
+        else:
+            unknown_count += 1
+
+    print(f"  原始数据表头列数: {len(original_header)}")
+    for device, digest in original_digests.items():
+        print(f"  原始 {device} 行数: {digest.count}")
+    if unknown_count:
+        print(f"  ⚠️ 未匹配设备行数: {unknown_count}")
+
+    # 2. 逐个读取拆分文件计算摘要，同时验证表头
+    print("\n[步骤2] 读取拆分后的各设备文件并计算摘要...")
+    split_digests = {}
+    header_match = True
+
+    for device, filepath in device_files.items():
+        if not os.path.exists(filepath):
+            print(f"  ✗ 文件不存在: {filepath}")
+            return False
+
+        digest = RowDigest()
+        rows = _iter_rows(filepath, normalize)
+        header = next(rows, [])
+        for row in rows:
+            digest.update(row)
+        split_digests[device] = digest
+
+        header_ok = header == original_header
+        header_match = header_match and header_ok
+        print(f"  {device}: {digest.count} 行, 表头{'一致' if header_ok else '不一致'} (文件: {filepath})")
+
+    # 3. 对比行数与摘要，不一致时再定位差异
+    print("\n[步骤3] 对比行数与内容摘要...")
+    count_match = True
+    content_match = True
+
+    for device, filepath in device_files.items():
+        orig = original_digests[device]
+        split = split_digests[device]
+        if orig.count != split.count:
+            print(f"  ✗ {device}: 原始 {orig.count} 行 ≠ 拆分 {split.count} 行")
+            count_match = False
+        if orig.hexdigest() == split.hexdigest():
+            print(f"  ✓ {device}: 所有 {orig.count} 行内容完全一致 (摘要 {orig.hexdigest()[:16]})")
+            continue
+
+        content_match = False
+        mismatches = _locate_differences(device, original_file, filepath, device_files,
+                                         normalize=normalize)
+        print(f"  ✗ {device}: 内容摘要不一致, 前 {len(mismatches)} 处不匹配行号: {mismatches}")
+
+    original_total = sum(d.count for d in original_digests.values()) + unknown_count
+    split_total = sum(d.count for d in split_digests.values())
+
+    # 4. 最终结果
+    print("\n" + "=" * 70)
+    print("验证结果汇总")
+    print("=" * 70)
+
+    checks = [
+        ("表头一致性", header_match),
+        ("行数一致性", count_match),
+        ("内容一致性", content_match),
+        ("无未知设备", unknown_count == 0),
+        ("总行数一致", original_total == split_total)
+    ]
+
+    for name, passed in checks:
+        status = "✓ 通过" if passed else "✗ 失败"
+        print(f"  {name}: {status}")
+
+    all_pass = all(passed for _, passed in checks)
+
+    print("\n" + "=" * 70)
+    if all_pass:
+        print("🎉 验证通过！所有数据完整，无任何丢失！")
+    else:
+        print("❌ 验证失败！请检查上述问题。")
+    print("=" * 70)
+
+    return all_pass
+
 if __name__ == '__main__':
-    verify_split()
+    # 可指定原始文件: python3 verify_split.py data.txt
+    sys.exit(0 if verify_split_streaming(sys.argv[1] if len(sys.argv) > 1 else None) else 1)
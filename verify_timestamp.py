@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 """
 验证时间戳转换是否正确
-1. 检查时间戳格式是否为13位数字
+1. 检查时间戳格式是否为13位 (毫秒) 或16位 (微秒) 数字
 2. 检查时间戳是否在合理范围内
 3. 抽样验证转换的正确性
+
+--audit 模式: 分块向量化审计设备 CSV / 列式 / .bin 文件的时间戳
+(单调性、重复、间隔直方图、滑动窗口采样率、设备间时钟漂移)，可输出 JSON 报告。
 """
 import csv
+import json
 import os
+import sys
+from collections import deque
 from datetime import datetime
 
+import metrics
+
 # 设备文件列表
 DEVICE_FILES = [
     'WTR1_data/WTR1.csv',
@@ -19,10 +27,24 @@ DEVICE_FILES = [
 # 原始CSV文件用于对比
 ORIGINAL_FILE = 'data.csv'
 
+# 审计: 每块读取的行数 / 滑动窗口长度 (秒) / 视为丢帧的间隔 (毫秒)
+AUDIT_CHUNK_ROWS = 1_000_000
+RATE_WINDOW_SECONDS = 10
+GAP_THRESHOLD_MS = 100
+
+# 采样率统计: 比已见最大秒早这么多秒的计数才定稿 (容忍小幅乱序)，更早到达的样本不计入
+RATE_LATE_SECONDS = 2
+
+# 间隔直方图的分桶边界 (毫秒)
+GAP_BIN_EDGES_MS = [0, 1, 2, 5, 8, 12, 15, 20, 30, 50, 100, 200, 500, 1000, 5000]
+
+# 每类问题保留的位置数量
+MAX_LOCATIONS = 10
+
 def timestamp_to_datetime(ts_str):
-    """将13位时间戳转换为datetime对象"""
-    ts_ms = int(ts_str)
-    ts_sec = ts_ms / 1000
+    """将13位 (毫秒) 或16位 (微秒) 时间戳转换为datetime对象"""
+    ts = int(ts_str)
+    ts_sec = ts / 1_000_000 if len(str(ts)) >= 16 else ts / 1000
     return datetime.fromtimestamp(ts_sec)
 
 def verify_file(filepath):
@@ -48,17 +70,18 @@ def verify_file(filepath):
             
             ts = row[0]
             
-            # 检查1: 是否为13位数字
-            if not ts.isdigit() or len(ts) != 13:
-                errors.append(f"行{i}: 非13位数字 '{ts}'")
+            # 检查1: 是否为13位 (毫秒) 或16位 (微秒) 数字
+            if not ts.isdigit() or len(ts) not in (13, 16):
+                errors.append(f"行{i}: 非13/16位数字 '{ts}'")
                 if len(errors) >= 10:
                     break
                 continue
             
             # 检查2: 时间戳范围（2020年1月1日 - 2030年1月1日）
             ts_val = int(ts)
-            min_ts = 1577836800000  # 2020-01-01 00:00:00
-            max_ts = 1893456000000  # 2030-01-01 00:00:00
+            scale = 1000 if len(ts) == 16 else 1
+            min_ts = 1577836800000 * scale  # 2020-01-01 00:00:00
+            max_ts = 1893456000000 * scale  # 2030-01-01 00:00:00
             
             if ts_val < min_ts or ts_val > max_ts:
                 errors.append(f"行{i}: 时间戳超出范围 '{ts}'")
@@ -171,6 +194,439 @@ def verify_against_original():
     
     return all_match
 
+def _to_microseconds(values):
+    """按数量级把毫秒时间戳统一为微秒 (16位)"""
+    import numpy as np
+    values = np.asarray(values, dtype=np.int64)
+    return np.where((values > 0) & (values < 10**14), values * 1000, values)
+
+def iter_timestamp_chunks(filepath, chunk_rows=AUDIT_CHUNK_ROWS):
+    """
+    分块读取文件的时间戳列，产生 (微秒 int64 数组, 无法解析的行数)
+
+    支持 .bin (mmap，不解析其余字段)、列式中间文件和 CSV (只读取第一列)。
+    """
+    import numpy as np
+
+    if filepath.endswith('.bin'):
+        import bin_to_csv
+        times = bin_to_csv.load_frames(filepath)['time']
+        for start in range(0, len(times), chunk_rows):
+            yield _to_microseconds(times[start:start + chunk_rows].astype(np.int64)), 0
+        return
+
+    import columnar
+    if columnar.is_columnar(filepath):
+        pa = columnar._require_pyarrow()
+        name = columnar._unique_names(columnar.read_header(filepath))[0]
+        for batch in columnar.iter_batches(filepath, [name]):
+            column = batch.column(0)
+            values = column.to_pandas()
+            if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+                # 含非数字时间的列按字符串存储，与 CSV 一样逐个判断
+                yield _parse_time_text(values.fillna(''))
+                continue
+            valid = values.notna().to_numpy()
+            yield _to_microseconds(values[valid].astype(np.int64).to_numpy()), int((~valid).sum())
+        return
+
+    import pandas as pd
+    for chunk in pd.read_csv(filepath, usecols=[0], dtype=str, keep_default_na=False,
+                             chunksize=chunk_rows):
+        yield _parse_time_text(chunk.iloc[:, 0])
+
+def _parse_time_text(values):
+    """字符串时间列 (pandas Series) -> (微秒 int64 数组, 无法解析的行数)"""
+    import numpy as np
+    text = values.astype(str).str.strip()
+    valid = text.str.fullmatch(r'\d+')
+    return _to_microseconds(text[valid].astype(np.int64).to_numpy()), int((~valid).sum())
+
+class RateWindows:
+    """
+    按秒计数的滑动窗口采样率 (步长 1 秒)，内存有界
+
+    只保留尚未定稿的最近几秒计数和最后 window 秒的窗口；窗口样本数记入直方图
+    (不同取值的数量受采样率 x 窗口长度限制)，中位数由直方图得到。
+    与整段统计一致，首尾两秒通常不完整，不参与统计。
+    """
+
+    def __init__(self, window_seconds=RATE_WINDOW_SECONDS, late_seconds=RATE_LATE_SECONDS):
+        self.window_seconds = window_seconds
+        self.late_seconds = late_seconds
+        self.pending = {}
+        self.first_second = None
+        self.next_second = None
+        self.max_second = None
+        self.late = 0
+        self.seconds = 0
+        self.empty_seconds = 0
+        self.windows = 0
+        self.sum_hist = {}
+        self.min_sum = None
+        self.min_start = None
+        self.max_sum = None
+        self._recent = deque(maxlen=window_seconds)
+        self._skip_first = True
+
+    def update(self, seconds, counts):
+        for sec, cnt in zip(seconds, counts):
+            if self.next_second is not None and sec < self.next_second:
+                self.late += cnt
+                continue
+            self.pending[sec] = self.pending.get(sec, 0) + cnt
+            if self.max_second is None or sec > self.max_second:
+                self.max_second = sec
+        if self.next_second is None and self.pending:
+            self.first_second = self.next_second = min(self.pending)
+        if self.max_second is not None:
+            self._finalize(self.max_second - self.late_seconds)
+
+    def _finalize(self, until):
+        """把 until 之前 (不含) 的秒依次计入窗口"""
+        while self.next_second is not None and self.next_second < until:
+            cnt = self.pending.pop(self.next_second, 0)
+            if cnt or not self.pending:
+                self._push(cnt)
+                self.next_second += 1
+                continue
+            # 连续的空白秒 (如长时间断连): 窗口填满 0 之后的部分批量计数
+            run = min(min(self.pending), until) - self.next_second
+            direct = min(run, self.window_seconds)
+            for _ in range(direct):
+                self._push(0)
+            self._push_zeros(run - direct)
+            self.next_second += run
+
+    def _push(self, cnt):
+        if self._skip_first:
+            self._skip_first = False
+            return
+        self.seconds += 1
+        if cnt == 0:
+            self.empty_seconds += 1
+        self._recent.append(cnt)
+        if len(self._recent) == self.window_seconds:
+            self._add_window(sum(self._recent), self.seconds - self.window_seconds)
+
+    def _push_zeros(self, n):
+        if n <= 0:
+            return
+        first = self.seconds
+        self.seconds += n
+        self.empty_seconds += n
+        self._recent.extend([0] * min(n, self.window_seconds))
+        self._add_window(0, first - self.window_seconds + 1, n)
+
+    def _add_window(self, total, start, n=1):
+        self.windows += n
+        self.sum_hist[total] = self.sum_hist.get(total, 0) + n
+        if self.min_sum is None or total < self.min_sum:
+            self.min_sum, self.min_start = total, start
+        if self.max_sum is None or total > self.max_sum:
+            self.max_sum = total
+
+    def _median_sum(self):
+        ranks = ((self.windows - 1) // 2, self.windows // 2)
+        values = []
+        seen = 0
+        for total in sorted(self.sum_hist):
+            seen += self.sum_hist[total]
+            while len(values) < 2 and ranks[len(values)] < seen:
+                values.append(total)
+        return sum(values) / 2
+
+    def report(self):
+        """结束统计并返回结果 (调用后不应再 update)"""
+        if self.first_second is None:
+            return None
+        if self.max_second - self.first_second + 1 <= 2:
+            # 不足 3 秒: 全部参与统计
+            counts = [self.pending.get(s, 0) for s in range(self.first_second, self.max_second + 1)]
+            return self._single_window(counts, self.first_second)
+        # 最后一秒不完整，不参与统计
+        self._finalize(self.max_second)
+        start = self.first_second + 1
+        if not self.windows:
+            return self._single_window(list(self._recent), start)
+        window = self.window_seconds
+        return {
+            'window_seconds': window,
+            'windows': self.windows,
+            'min_hz': self.min_sum / window,
+            'median_hz': self._median_sum() / window,
+            'max_hz': self.max_sum / window,
+            'min_window_start': (start + self.min_start) * 1_000_000,
+            'empty_seconds': self.empty_seconds,
+            'late_samples': self.late,
+        }
+
+    def _single_window(self, counts, start):
+        """记录短于窗口长度: 整段作为一个窗口"""
+        rate = sum(counts) / len(counts)
+        return {
+            'window_seconds': len(counts),
+            'windows': 1,
+            'min_hz': rate,
+            'median_hz': rate,
+            'max_hz': rate,
+            'min_window_start': start * 1_000_000,
+            'empty_seconds': counts.count(0),
+            'late_samples': self.late,
+        }
+
+class TimestampAudit:
+    """
+    单个文件的流式时间戳审计
+
+    逐块 update()，块与块之间只保留上一块的最后一个时间戳和有界的采样率窗口，
+    内存与文件长度无关。
+    :param line_offset: 位置报告中行号 = 数据序号 + line_offset (CSV / 列式文件有表头为 2，.bin 帧号为 1)
+    """
+
+    def __init__(self, name, window_seconds=RATE_WINDOW_SECONDS, gap_threshold_ms=GAP_THRESHOLD_MS,
+                 line_offset=2):
+        import numpy as np
+        self.name = name
+        self.line_offset = line_offset
+        self.window_seconds = window_seconds
+        self.gap_threshold_us = gap_threshold_ms * 1000
+        self.count = 0
+        self.invalid = 0
+        self.first = None
+        self.last = None
+        self.min = None
+        self.max = None
+        self.backwards = 0
+        self.duplicates = 0
+        self.gaps = 0
+        self.max_gap_us = 0
+        self.locations = {'backwards': [], 'duplicates': [], 'gaps': []}
+        self.gap_edges_us = np.array(GAP_BIN_EDGES_MS + [np.inf]) * 1000
+        self.gap_hist = np.zeros(len(self.gap_edges_us) - 1, dtype=np.int64)
+        self.rates = RateWindows(window_seconds)
+        # 时间戳对样本序号的线性回归 (Chan 合并公式)，用于估计采样周期与时钟漂移
+        self._n = 0
+        self._mean_i = 0.0
+        self._mean_t = 0.0
+        self._m2_i = 0.0
+        self._c_it = 0.0
+
+    def _record(self, kind, positions, diffs, times):
+        slots = MAX_LOCATIONS - len(self.locations[kind])
+        for pos, diff, ts in list(zip(positions, diffs, times))[:max(slots, 0)]:
+            self.locations[kind].append({'row': int(pos), 'timestamp': int(ts), 'delta_us': int(diff)})
+
+    def update(self, times, invalid=0):
+        import numpy as np
+        self.invalid += invalid
+        if len(times) == 0:
+            return
+        base = self.count
+
+        if self.first is None:
+            self.first = int(times[0])
+            self.min = int(times.min())
+            self.max = int(times.max())
+            diffs = np.diff(times)
+            offset = 1
+        else:
+            diffs = np.diff(times, prepend=self.last)
+            offset = 0
+            self.min = min(self.min, int(times.min()))
+            self.max = max(self.max, int(times.max()))
+        # diffs[k] 是第 base+offset+k 行 (从 0 开始) 与前一行的差
+        rows = np.arange(len(diffs)) + base + offset
+
+        back = np.flatnonzero(diffs < 0)
+        dup = np.flatnonzero(diffs == 0)
+        gap = np.flatnonzero(diffs > self.gap_threshold_us)
+        self.backwards += len(back)
+        self.duplicates += len(dup)
+        self.gaps += len(gap)
+        if len(diffs):
+            self.max_gap_us = max(self.max_gap_us, int(diffs.max()))
+        for kind, idx in (('backwards', back), ('duplicates', dup), ('gaps', gap)):
+            if len(idx):
+                self._record(kind, rows[idx], diffs[idx], times[idx + offset])
+
+        forward = diffs[diffs > 0]
+        self.gap_hist += np.histogram(forward, bins=self.gap_edges_us)[0]
+
+        seconds, counts = np.unique(times // 1_000_000, return_counts=True)
+        self.rates.update(seconds.tolist(), counts.tolist())
+
+        # 合并本块的回归统计 (以首个时间戳为原点，避免大数相减损失精度)
+        idx = np.arange(base, base + len(times), dtype=np.float64)
+        t = (times - self.first).astype(np.float64)
+        n_b = len(times)
+        mean_i_b, mean_t_b = idx.mean(), t.mean()
+        m2_i_b = float(((idx - mean_i_b) ** 2).sum())
+        c_b = float(((idx - mean_i_b) * (t - mean_t_b)).sum())
+        n = self._n + n_b
+        d_i = mean_i_b - self._mean_i
+        d_t = mean_t_b - self._mean_t
+        self._c_it += c_b + d_i * d_t * self._n * n_b / n
+        self._m2_i += m2_i_b + d_i * d_i * self._n * n_b / n
+        self._mean_i += d_i * n_b / n
+        self._mean_t += d_t * n_b / n
+        self._n = n
+
+        self.count += len(times)
+        self.last = int(times[-1])
+
+    @property
+    def period_us(self):
+        """线性拟合的平均采样周期 (微秒)"""
+        if self._m2_i <= 0:
+            return None
+        return self._c_it / self._m2_i
+
+    def window_rates(self):
+        """滑动窗口 (步长 1 秒) 的有效采样率统计"""
+        return self.rates.report()
+
+    def report(self):
+        period = self.period_us
+        duration = (self.last - self.first) / 1e6 if self.count else 0.0
+        edges_ms = GAP_BIN_EDGES_MS + ['inf']
+        return {
+            'file': self.name,
+            'rows': self.count,
+            'invalid': self.invalid,
+            'first': self.first,
+            'last': self.last,
+            'duration_seconds': duration,
+            'monotonic': self.backwards == 0,
+            'backwards': self.backwards,
+            'duplicates': self.duplicates,
+            'gaps': self.gaps,
+            'gap_threshold_ms': self.gap_threshold_us / 1000,
+            'max_gap_ms': self.max_gap_us / 1000,
+            'mean_rate_hz': (self.count - 1) / duration if duration > 0 else None,
+            'fitted_period_us': period,
+            'fitted_rate_hz': 1e6 / period if period else None,
+            'gap_histogram_ms': [
+                {'from': edges_ms[i], 'to': edges_ms[i + 1], 'count': int(c)}
+                for i, c in enumerate(self.gap_hist)
+            ],
+            'window_rate': self.window_rates(),
+            'line_offset': self.line_offset,
+            'locations': self.locations,
+        }
+
+def audit_file(filepath, chunk_rows=AUDIT_CHUNK_ROWS, **kwargs):
+    """分块审计单个文件，返回 TimestampAudit"""
+    kwargs.setdefault('line_offset', 1 if filepath.endswith('.bin') else 2)
+    audit = TimestampAudit(filepath, **kwargs)
+    for times, invalid in iter_timestamp_chunks(filepath, chunk_rows):
+        audit.update(times, invalid)
+    return audit
+
+def clock_drift(audits):
+    """
+    设备间时钟漂移
+
+    比较两两设备的起止时间差和拟合采样周期: 周期之比偏离 1 的部分即为
+    两个设备采样时钟的相对漂移 (ppm)。
+    """
+    names = list(audits)
+    pairs = []
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            ra, rb = audits[a], audits[b]
+            if not ra.count or not rb.count:
+                continue
+            start_ms = (rb.first - ra.first) / 1000
+            end_ms = (rb.last - ra.last) / 1000
+            drift_ppm = None
+            if ra.period_us and rb.period_us:
+                drift_ppm = (rb.period_us / ra.period_us - 1) * 1e6
+            pairs.append({
+                'a': a, 'b': b,
+                'start_offset_ms': start_ms,
+                'end_offset_ms': end_ms,
+                'offset_change_ms': end_ms - start_ms,
+                'period_drift_ppm': drift_ppm,
+            })
+    return pairs
+
+def _print_audit(report):
+    print(f"\n审计文件: {report['file']}")
+    if not report['rows']:
+        print("  ✗ 没有有效时间戳")
+        return
+    print(f"  行数: {report['rows']} (无法解析: {report['invalid']})")
+    print(f"  时间范围: {timestamp_to_datetime(report['first'])} ~ {timestamp_to_datetime(report['last'])}"
+          f" ({report['duration_seconds']:.1f} 秒)")
+    rate = report['fitted_rate_hz']
+    print(f"  平均采样率: {report['mean_rate_hz'] or 0:.3f} Hz, 拟合采样率: {rate or 0:.3f} Hz")
+    print(f"  {'✓' if report['monotonic'] else '✗'} 时间倒退: {report['backwards']}, "
+          f"重复: {report['duplicates']}, 间隔>{report['gap_threshold_ms']:g}ms: {report['gaps']}"
+          f" (最大 {report['max_gap_ms']:.1f} ms)")
+    print("  间隔直方图 (ms):")
+    for b in report['gap_histogram_ms']:
+        if b['count']:
+            print(f"    [{b['from']}, {b['to']}): {b['count']}")
+    w = report['window_rate']
+    if w:
+        print(f"  {w['window_seconds']} 秒滑动窗口采样率: 最小 {w['min_hz']:.1f} Hz, "
+              f"中位 {w['median_hz']:.1f} Hz, 最大 {w['max_hz']:.1f} Hz, 空白秒数 {w['empty_seconds']}")
+    unit = '帧' if report['file'].endswith('.bin') else '行'
+    for kind, label in (('backwards', '倒退'), ('duplicates', '重复'), ('gaps', '大间隔')):
+        for loc in report['locations'][kind][:3]:
+            print(f"    {label} {unit} {loc['row'] + report['line_offset']}: {loc['timestamp']}"
+                  f" (差 {loc['delta_us'] / 1000:.3f} ms)")
+
+@metrics.timed('verify_timestamp')
+def audit_files(filepaths, json_path=None, chunk_rows=AUDIT_CHUNK_ROWS, **kwargs):
+    """
+    审计多个设备文件并计算设备间漂移
+    :return: 报告字典 ('passed' 表示没有时间倒退)
+    """
+    print("=" * 60)
+    print("时间戳审计 (分块向量化)")
+    print("=" * 60)
+
+    audits = {}
+    for filepath in filepaths:
+        if not os.path.exists(filepath):
+            print(f"\n✗ 文件不存在: {filepath}")
+            continue
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        if name in audits:
+            name = filepath
+        audits[name] = audit_file(filepath, chunk_rows, **kwargs)
+
+    files = {}
+    for name, audit in audits.items():
+        files[name] = audit.report()
+        _print_audit(files[name])
+
+    drift = clock_drift(audits)
+    if drift:
+        print("\n设备间时钟漂移:")
+        for d in drift:
+            ppm = d['period_drift_ppm']
+            print(f"  {d['a']} vs {d['b']}: 起始差 {d['start_offset_ms']:.1f} ms, "
+                  f"结束差 {d['end_offset_ms']:.1f} ms, 漂移 {d['offset_change_ms']:.1f} ms"
+                  + (f", 周期偏差 {ppm:.1f} ppm" if ppm is not None else ""))
+
+    report = {
+        'files': files,
+        'drift': drift,
+        'passed': bool(files) and all(r['monotonic'] and r['rows'] for r in files.values()),
+    }
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存: {json_path}")
+
+    print("\n" + "=" * 60)
+    print("✓ 审计通过 (时间戳单调)" if report['passed'] else "✗ 审计发现问题")
+    print("=" * 60)
+    return report
+
 def main():
     print("=" * 60)
     print("时间戳转换验证")
@@ -196,4 +652,20 @@ def main():
     return all_valid
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='时间戳验证 / 审计')
+    parser.add_argument('files', nargs='*', help='审计的文件 (默认: 各设备 CSV/列式文件)')
+    parser.add_argument('--audit', action='store_true', help='分块审计单调性、间隔、采样率与漂移')
+    parser.add_argument('--json', help='审计报告 JSON 输出路径')
+    parser.add_argument('--window', type=int, default=RATE_WINDOW_SECONDS, help='滑动窗口长度 (秒)')
+    parser.add_argument('--gap-ms', type=float, default=GAP_THRESHOLD_MS, help='视为丢帧的间隔 (毫秒)')
+    parser.add_argument('--chunk-rows', type=int, default=AUDIT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.audit or args.files:
+        import columnar
+        targets = args.files or [columnar.resolve_input(f) for f in DEVICE_FILES]
+        report = audit_files(targets, args.json, args.chunk_rows,
+                             window_seconds=args.window, gap_threshold_ms=args.gap_ms)
+        sys.exit(0 if report['passed'] else 1)
     main()